@@ -0,0 +1,470 @@
+'''
+.. module:: benchmark
+   :platform: Linux, Windows, OSX
+   :synopsis: Offline benchmarks of the request signing, decoding and parsing hot paths
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Run from the top of the repository with ``python bench/benchmark.py``. Each benchmark runs in a fresh Python process, so
+the peak memory reported for it is that of its own setup and calls rather than of everything run before it.
+
+Baselines are machine specific, so save one on the machine the comparison will be made on::
+
+    python bench/benchmark.py --save baseline.json
+    python bench/benchmark.py --compare baseline.json
+
+The committed ``baseline-*.json`` files record the machine they were made on. They show the relative cost of the
+benchmarks, and are not a reference for other machines.
+
+'''
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.transport import Transport, ConnectionPool
+from cryptsy.standin import StandInServer
+from cryptsy.managed_api import ManagedAPI, MarketData, MarketOrderData, MarketTradeData, UserTradeData, TransactionData
+from cryptsy.cache import ResponseCache
+from cryptsy.signing import Signer, template
+from cryptsy import bare_api, decoding
+from StringIO import StringIO
+import gc, hashlib, hmac, json, multiprocessing, platform, random, subprocess, time, urllib
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SIZES = (10, 100, 500) #: The numbers of markets (or records) in the synthetic payloads
+
+class BenchmarkResult(object):
+    '''The measurements of one benchmark
+
+    :param name: The name of the benchmark
+    :type name: str
+    :param ops_per_sec: Calls of the benchmarked function per second
+    :type ops_per_sec: float
+    :param objects: GC-tracked objects kept alive by the result of a single call
+    :type objects: int
+    :param peak_memory: Peak resident memory of the process that ran the benchmark in KiB, or None if it can't be read on this platform
+    :type peak_memory: int
+
+    '''
+    def __init__(self, name, ops_per_sec, objects, peak_memory):
+        self.name        = name        #: The name of the benchmark (str)
+        self.ops_per_sec = ops_per_sec #: Calls per second (float)
+        self.objects     = objects     #: GC-tracked objects kept alive by one call's result (int)
+        self.peak_memory = peak_memory #: Peak resident memory in KiB, or None (int)
+
+    def __str__(self):
+        return '{0:<40} {1:>14,.1f} ops/s {2:>10} objects {3:>10} KiB peak'.format(self.name, self.ops_per_sec, self.objects,
+                                                                                          '-' if self.peak_memory is None else self.peak_memory)
+
+def measure(name, function, min_time = 0.5):
+    '''Times a function, calling it repeatedly for at least min_time seconds
+
+    :param name: The name to report the measurements under
+    :type name: str
+    :param function: The function to benchmark, called with no arguments
+    :type function: callable
+    :param min_time: (optional) The minimum number of seconds to spend calling the function
+    :type min_time: float
+    :rtype: :class:`BenchmarkResult`
+
+    Python 2 has no allocation tracer, so allocations are counted as the number of GC-tracked objects that one call's
+    result keeps alive. That is the per-record overhead the containers are meant to keep down.
+
+    '''
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        result = function()
+        objects = len(gc.get_objects()) - before - 1
+        del result
+    finally:
+        if enabled:
+            gc.enable()
+
+    calls   = 0
+    batch   = 1
+    started = time.time()
+    while True:
+        for _ in xrange(batch):
+            function()
+        calls  += batch
+        elapsed = time.time() - started
+        if elapsed >= min_time:
+            break
+        batch *= 2
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    return BenchmarkResult(name, calls/elapsed, objects, peak)
+
+def market_data_payload(markets, trades = 100, orders = 100, seed = 0):
+    '''Builds a synthetic 'marketdatav2' response shaped like the real one
+
+    :param markets: The number of markets
+    :type markets: int
+    :param trades: (optional) Recent trades per market
+    :type trades: int
+    :param orders: (optional) Buy and sell orders per market
+    :type orders: int
+    :param seed: (optional) Seed for the random prices, so payloads are reproducible
+    :type seed: int
+    :rtype: dict
+
+    '''
+    rand   = random.Random(seed)
+    result = dict()
+    for market in xrange(1, markets+1):
+        label = 'C{0}/BTC'.format(market)
+        price = rand.uniform(0.00001, 0.1)
+        result[label] = {'marketid'       : str(market),
+                         'label'          : label,
+                         'lasttradeprice' : _number(price),
+                         'volume'         : _number(rand.uniform(0, 100000)),
+                         'lasttradetime'  : '2014-03-01 12:00:00',
+                         'primaryname'    : 'Coin{0}'.format(market),
+                         'primarycode'    : 'C{0}'.format(market),
+                         'secondaryname'  : 'BitCoin',
+                         'secondarycode'  : 'BTC',
+                         'recenttrades'   : [_trade(rand, i, price) for i in xrange(trades)],
+                         'sellorders'     : [_order(rand, price*(1 + 0.001*i)) for i in xrange(1, orders+1)],
+                         'buyorders'      : [_order(rand, price*(1 - 0.001*i)) for i in xrange(1, orders+1)]}
+    return {'success':1, 'return':{'markets':result}}
+
+def orderbook_payload(markets, orders = 100, seed = 0):
+    '''Builds a synthetic 'orderdata' response shaped like the real one
+
+    :param markets: The number of markets
+    :type markets: int
+    :param orders: (optional) Buy and sell orders per market
+    :type orders: int
+    :param seed: (optional) Seed for the random prices, so payloads are reproducible
+    :type seed: int
+    :rtype: dict
+
+    '''
+    markets_data = market_data_payload(markets, 0, orders, seed)['return']['markets']
+    keys = ('marketid', 'label', 'primaryname', 'primarycode', 'secondaryname', 'secondarycode', 'sellorders', 'buyorders')
+    return {'success':1, 'return':dict((label, dict((key, market[key]) for key in keys)) for label, market in markets_data.iteritems())}
+
+def my_trades_payload(trades, seed = 0):
+    '''Builds a synthetic 'allmytrades' response shaped like the real one
+
+    :param trades: The number of trades
+    :type trades: int
+    :param seed: (optional) Seed for the random prices, so payloads are reproducible
+    :type seed: int
+    :rtype: dict
+
+    '''
+    rand = random.Random(seed)
+    return {'success':1, 'return':[{'tradeid'            : str(1000+i),
+                                    'tradetype'          : rand.choice(('Buy', 'Sell')),
+                                    'datetime'           : '2014-03-01 12:00:00',
+                                    'marketid'           : str(rand.randint(1, 200)),
+                                    'order_id'           : str(5000+i),
+                                    'fee'                : _number(rand.uniform(0, 0.001)),
+                                    'initiate_ordertype' : rand.choice(('Buy', 'Sell')),
+                                    'total'              : _number(rand.uniform(0, 1)),
+                                    'tradeprice'         : _number(rand.uniform(0.00001, 0.1)),
+                                    'quantity'           : _number(rand.uniform(0, 1000))} for i in xrange(trades)]}
+
+def transactions_payload(transactions, seed = 0):
+    '''Builds a synthetic 'mytransactions' response shaped like the real one
+
+    :param transactions: The number of transactions
+    :type transactions: int
+    :param seed: (optional) Seed for the random amounts, so payloads are reproducible
+    :type seed: int
+    :rtype: dict
+
+    '''
+    rand = random.Random(seed)
+    return {'success':1, 'return':[{'currency'  : 'BTC',
+                                    'timestamp' : str(1393675200+60*i),
+                                    'datetime'  : '2014-03-01 12:00:00',
+                                    'timezone'  : 'EST',
+                                    'type'      : rand.choice(('Deposit', 'Withdrawal')),
+                                    'address'   : '1BoatSLRHtKNngkdXEeobR76b53LETtpyT',
+                                    'amount'    : _number(rand.uniform(0, 10)),
+                                    'fee'       : _number(rand.uniform(0, 0.001)),
+                                    'trxid'     : '{0:064x}'.format(rand.getrandbits(256))} for i in xrange(transactions)]}
+
+def _number(value):
+    return '{0:.8f}'.format(value)
+
+def _trade(rand, i, price):
+    quantity = rand.uniform(0, 1000)
+    return {'id':str(100000+i), 'time':'2014-03-01 12:00:00', 'price':_number(price), 'quantity':_number(quantity), 'total':_number(price*quantity)}
+
+def _order(rand, price):
+    quantity = rand.uniform(0, 1000)
+    return {'price':_number(price), 'quantity':_number(quantity), 'total':_number(price*quantity)}
+
+def _encode_unkeyed(inputs, nonce):
+    '''Encodes and signs a request the way :func:`~cryptsy.bare_api.call_pri_api` did before request templates and pre-keyed signers
+    
+    '''
+    body = urllib.urlencode(inputs + [('method', 'createorder'), ('nonce', nonce)])
+    return body, {'Key':'key', 'Sign':hmac.new('secret', body, hashlib.sha512).hexdigest()}
+
+def _encode_prekeyed(signer, inputs, nonce):
+    body = template('createorder', tuple([key for key, _ in inputs])).encode([value for _, value in inputs], nonce)
+    return body, {'Key':'key', 'Sign':signer.sign(body)}
+
+def _eager_market_data(entry):
+    '''Builds a :class:`~cryptsy.managed_api.MarketData` with every trade and order parsed up front, as it was before they
+    were parsed lazily. Compared with the lazy case, it shows what callers that only read the market's own fields save
+    
+    '''
+    market = MarketData(entry)
+    market.recent_trades, market.sell_orders, market.buy_orders
+    return market
+
+def _unslotted(cls):
+    '''Copies a record class without its ``__slots__``, so each instance keeps its fields in a ``__dict__`` as the records
+    did before they were slotted
+
+    '''
+    return type(cls.__name__, (object,), {'__init__':cls.__dict__['__init__']})
+
+def _build_records(trade_class, order_class):
+    '''Builds every recent trade and order of an all-markets snapshot one record at a time with the given classes
+
+    '''
+    def build(entries):
+        records = []
+        for entry in entries:
+            records.extend([trade_class(trade) for trade in entry['recenttrades']])
+            records.extend([order_class(order) for order in entry['buyorders']])
+            records.extend([order_class(order) for order in entry['sellorders']])
+        return records
+    return build
+
+def _parse_per_field(body):
+    '''Parses an all-markets response the way it was parsed before pluggable decoders and batched conversion
+    
+    '''
+    markets = []
+    for entry in json.loads(body)['return']['markets'].itervalues():
+        markets.append((MarketData(entry),
+                        [MarketTradeData(trade) for trade in entry['recenttrades']],
+                        [MarketOrderData(order) for order in entry['buyorders']],
+                        [MarketOrderData(order) for order in entry['sellorders']]))
+    return markets
+
+def _parse_batched(body):
+    markets = []
+    for entry in decoding.loads(body)['return']['markets'].itervalues():
+        market = MarketData(entry)
+        markets.append((market, market.recent_trades, market.buy_orders, market.sell_orders))
+    return markets
+
+class _CannedTransport(Transport):
+    '''Answers every request with the same body, so only the client side of a call is measured
+
+    '''
+    def __init__(self, body):
+        self.body = body
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        return StringIO(self.body)
+
+_ORDER_INPUTS = [('marketid', 3), ('ordertype', 'Buy'), ('quantity', '12.5'), ('price', '0.00041')]
+_GET_INFO      = {'success':1, 'return':{'balances_available':{'BTC':'1.0'}, 'balances_hold':{}, 'servertimestamp':0,
+                                         'servertimezone':'EST', 'serverdatetime':'2014-03-01 12:00:00', 'openordercount':0}}
+
+def cases(sizes = SIZES, end_to_end = True):
+    '''Lists every benchmark
+
+    :param sizes: (optional) The payload sizes to benchmark decoding and parsing at
+    :type sizes: (int, ...)
+    :param end_to_end: (optional) If True, :class:`~cryptsy.managed_api.ManagedAPI` calls against a local
+                       :class:`~cryptsy.standin.StandInServer` are included
+    :type end_to_end: bool
+    :rtype: [(str, callable), ...]
+    :return: The (name, setup) of each benchmark, in the order they are run. setup is called with no arguments and
+             returns the function to measure and a function to call once it has been measured, or None
+
+    '''
+    listed = [('sign createorder', lambda: (_signed_call('secret'), None)),
+              ('sign createorder pre-keyed', lambda: (_signed_call(Signer('secret')), None)),
+              ('encode createorder urlencode+hmac.new', lambda: (_counted(lambda nonce: _encode_unkeyed(_ORDER_INPUTS, nonce)), None)),
+              ('encode createorder template+signer', lambda: (_counted(lambda nonce, signer = Signer('secret'): _encode_prekeyed(signer, _ORDER_INPUTS, nonce)), None))]
+    for size in sizes:
+        listed.extend(_sized_cases(size))
+    if end_to_end:
+        listed.extend([('end-to-end get_info pooled', lambda: _end_to_end('get_info', ConnectionPool(), sizes[0])),
+                       ('end-to-end get_info unpooled', lambda: _end_to_end('get_info', ConnectionPool(max_size = 0), sizes[0])),
+                       ('end-to-end general_market_data x{0}'.format(sizes[0]), lambda: _end_to_end('general_market_data', ConnectionPool(), sizes[0]))])
+    return listed
+
+def _sized_cases(size):
+    market_data  = lambda: json.dumps(market_data_payload(size))
+    markets      = lambda: market_data_payload(size)['return']['markets'].values()
+    return [('decode marketdatav2 x{0}'.format(size), lambda: (_bound(decoding.loads, market_data()), None)),
+            ('decode orderdata x{0}'.format(size), lambda: (_bound(decoding.loads, json.dumps(orderbook_payload(size))), None)),
+            ('decode allmytrades x{0}'.format(size*10), lambda: (_bound(decoding.loads, json.dumps(my_trades_payload(size*10))), None)),
+            ('build MarketData lazy x{0}'.format(size), lambda: (_bound(lambda entries: [MarketData(entry) for entry in entries], markets()), None)),
+            ('build MarketData eager x{0}'.format(size), lambda: (_bound(lambda entries: [_eager_market_data(entry) for entry in entries], markets()), None)),
+            ('build records __slots__ x{0}'.format(size), lambda: (_bound(_build_records(MarketTradeData, MarketOrderData), markets()), None)),
+            ('build records __dict__ x{0}'.format(size),
+             lambda: (_bound(_build_records(_unslotted(MarketTradeData), _unslotted(MarketOrderData)), markets()), None)),
+            ('parse marketdatav2 x{0} json+per-field'.format(size), lambda: (_bound(_parse_per_field, market_data()), None)),
+            ('parse marketdatav2 x{0} {1}+batched'.format(size, decoding.backend), lambda: (_bound(_parse_batched, market_data()), None)),
+            ('build UserTradeData x{0}'.format(size*10),
+             lambda: (_bound(lambda entries: [UserTradeData(entry) for entry in entries], my_trades_payload(size*10)['return']), None)),
+            ('build TransactionData x{0}'.format(size*10),
+             lambda: (_bound(lambda entries: [TransactionData(entry) for entry in entries], transactions_payload(size*10)['return']), None))]
+
+def _bound(function, argument):
+    return lambda: function(argument)
+
+def _counted(function):
+    counter = iter(xrange(1, 1 << 62)).next
+    return lambda: function(counter())
+
+def _signed_call(secret):
+    canned  = _CannedTransport(json.dumps({'success':1, 'return':{'orderid':'1'}}))
+    counter = iter(xrange(1, 1 << 62)).next
+    return lambda: bare_api.call_pri_api('createorder', list(_ORDER_INPUTS), 'key', secret, transport = canned, nonce = counter)
+
+def _end_to_end(method, pool, size):
+    '''Starts a stand-in server and a :class:`~cryptsy.managed_api.ManagedAPI` which calls it over pool, without caching or rate limiting
+
+    '''
+    handlers = {'marketdatav2' : lambda params: market_data_payload(size),
+                'getinfo'      : lambda params: _GET_INFO}
+    server = StandInServer(secret_keys = {'key':'secret'}, handlers = handlers)
+    server.start()
+    api = ManagedAPI('key', 'secret', transport = server.transport(pool), cache = ResponseCache({}), rate_limiter = _Unlimited())
+    def stop():
+        pool.close()
+        server.stop()
+    return getattr(api, method), stop
+
+class _Unlimited(object):
+    def acquire(self, priority):
+        return 0.0
+
+def run_case(name, sizes = SIZES, min_time = 0.5, end_to_end = True):
+    '''Runs one benchmark in this process
+
+    :param name: The name of the benchmark, as listed by :func:`cases`
+    :type name: str
+    :rtype: :class:`BenchmarkResult`
+    :raise: :exc:`KeyError` if there is no such benchmark
+
+    '''
+    function, cleanup = dict(cases(sizes, end_to_end))[name]()
+    try:
+        return measure(name, function, min_time)
+    finally:
+        if cleanup is not None:
+            cleanup()
+
+def run(sizes = SIZES, min_time = 0.5, end_to_end = True):
+    '''Runs every benchmark, each in a new Python process
+
+    :param sizes: (optional) The payload sizes to benchmark decoding and parsing at
+    :type sizes: (int, ...)
+    :param min_time: (optional) The minimum number of seconds to spend on each benchmark
+    :type min_time: float
+    :param end_to_end: (optional) If True, :class:`~cryptsy.managed_api.ManagedAPI` calls against a local
+                       :class:`~cryptsy.standin.StandInServer` are benchmarked as well
+    :type end_to_end: bool
+    :rtype: generator of :class:`BenchmarkResult`
+    :raise: :exc:`RuntimeError` if a benchmark process fails
+
+    '''
+    options = ['--min-time', repr(min_time), '--sizes'] + [str(size) for size in sizes]
+    if not end_to_end:
+        options.append('--no-end-to-end')
+    for name, _ in cases(sizes, end_to_end):
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run-case', name] + options,
+                                   stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        out, err = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError('Benchmark '+name+' failed:\n'+err)
+        yield BenchmarkResult(**json.loads(out.splitlines()[-1]))
+
+def compare(results, baseline, tolerance = 0.1):
+    '''Compares results against a saved baseline
+
+    :param results: The results of :func:`run`
+    :type results: [:class:`BenchmarkResult`, ...]
+    :param baseline: Maps benchmark names to ops/sec, as in the 'ops_per_sec' member of a file written by :func:`save`
+    :type baseline: dict(str, float)
+    :param tolerance: (optional) The fractional slowdown allowed before a benchmark counts as a regression
+    :type tolerance: float
+    :rtype: [(str, float, float), ...]
+    :return: (name, baseline ops/sec, current ops/sec) of every benchmark that regressed
+
+    '''
+    return [(result.name, baseline[result.name], result.ops_per_sec) for result in results
+            if result.name in baseline and result.ops_per_sec < baseline[result.name]*(1 - tolerance)]
+
+def machine():
+    '''
+    :rtype: dict(str, str)
+    :return: A description of this machine and Python, to store alongside saved results
+
+    '''
+    return {'system'    : platform.system(),
+            'machine'   : platform.machine(),
+            'processor' : platform.processor(),
+            'cpus'      : str(multiprocessing.cpu_count()),
+            'python'    : platform.python_version(),
+            'decoder'   : decoding.backend,
+            'note'      : 'Machine specific. Compare only against results measured on the same machine'}
+
+def save(results, path):
+    '''Saves the ops/sec of each result as a baseline for :func:`compare`, along with a description of this machine
+
+    :param results: The results of :func:`run`
+    :type results: [:class:`BenchmarkResult`, ...]
+    :param path: The JSON file to write
+    :type path: str
+
+    '''
+    with open(path, 'w') as f:
+        json.dump({'machine':machine(), 'ops_per_sec':dict((result.name, result.ops_per_sec) for result in results)}, f, indent = 2, separators = (',', ': '), sort_keys = True)
+
+def main():
+    '''Runs the benchmarks from the command line, printing the results
+
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Benchmarks the cryptsy client hot paths offline')
+    parser.add_argument('--min-time', type = float, default = 0.5, help = 'minimum seconds to spend on each benchmark')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = list(SIZES), help = 'payload sizes, in markets')
+    parser.add_argument('--no-end-to-end', action = 'store_true', help = 'skip the benchmarks against a local stand-in server')
+    parser.add_argument('--save', metavar = 'PATH', help = 'save the results as a baseline')
+    parser.add_argument('--compare', metavar = 'PATH', help = 'compare the results against a saved baseline')
+    parser.add_argument('--tolerance', type = float, default = 0.1, help = 'fractional slowdown allowed by --compare')
+    parser.add_argument('--run-case', metavar = 'NAME', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run_case:
+        result = run_case(args.run_case, args.sizes, args.min_time, not args.no_end_to_end)
+        print(json.dumps(result.__dict__))
+        return
+    results = []
+    for result in run(args.sizes, args.min_time, not args.no_end_to_end):
+        print(str(result))
+        sys.stdout.flush()
+        results.append(result)
+    if args.save:
+        save(results, args.save)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['ops_per_sec'], args.tolerance)
+        for name, before, after in regressions:
+            print('REGRESSION {0}: {1:,.1f} -> {2:,.1f} ops/s'.format(name, before, after))
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+.. module:: parse_stall
+   :platform: Linux, Windows, OSX
+   :synopsis: Measures how long parsing an all-markets response stalls the other threads of the calling process
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Run from the top of the repository with ``python bench/parse_stall.py``. The same response body is parsed repeatedly
+in-process, the way :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data` parses it by default, and in a
+:class:`~cryptsy.parse_pool.ParsePool`. A heartbeat thread ticks every millisecond throughout, standing in for a thread
+that places orders. For each mode the results are:
+
+* wall: median seconds per call
+* cpu: mean seconds of calling-process CPU time per call, not counting the pool's workers
+* max_stall / mean_stall: the longest and mean gap between heartbeat ticks, in seconds
+
+No server is involved, so only the client side of a call is measured. The committed ``parse_stall-*.json`` files record
+the machine they were made on and are machine specific.
+
+'''
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import MarketData
+from cryptsy.parse_pool import ParsePool
+from cryptsy import decoding
+from benchmark import market_data_payload, machine
+import json, threading, time
+
+class _Heartbeat(object):
+    '''A thread which sleeps for interval seconds at a time, recording the time between its wake-ups
+
+    '''
+    def __init__(self, interval = 0.001):
+        self.interval = interval
+        self.gaps     = []
+        self._stop    = threading.Event()
+        self._thread  = threading.Thread(target = self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        last = time.time()
+        while not self._stop.is_set():
+            time.sleep(self.interval)
+            now = time.time()
+            self.gaps.append(now - last)
+            last = now
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+def _parse_in_process(body):
+    return dict((label, MarketData(entry)) for label, entry in decoding.loads(body)['return']['markets'].iteritems())
+
+def measure(parse, body, calls):
+    '''Parses body calls times while a heartbeat thread runs
+
+    :rtype: dict(str, float)
+    :return: The 'wall', 'cpu', 'max_stall' and 'mean_stall' of the calls, as described in the module documentation
+
+    '''
+    parse(body)
+    walls = []
+    with _Heartbeat() as heartbeat:
+        time.sleep(0.05)
+        del heartbeat.gaps[:]
+        cpu = sum(os.times()[:2])
+        for _ in xrange(calls):
+            started = time.time()
+            parse(body)
+            walls.append(time.time() - started)
+        cpu = sum(os.times()[:2]) - cpu
+    walls.sort()
+    gaps = heartbeat.gaps
+    return {'wall'       : walls[len(walls)//2],
+            'cpu'        : cpu/calls,
+            'max_stall'  : max(gaps),
+            'mean_stall' : sum(gaps)/len(gaps)}
+
+def main():
+    '''Runs the measurements from the command line, printing the results
+
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Measures thread stalls caused by parsing all-markets responses')
+    parser.add_argument('--markets', type = int, default = 500, help = 'markets in the response')
+    parser.add_argument('--calls', type = int, default = 20, help = 'calls to time in each mode')
+    parser.add_argument('--processes', type = int, default = 2, help = 'worker processes in the parse pool')
+    parser.add_argument('--save', metavar = 'PATH', help = 'save the results as JSON')
+    args = parser.parse_args()
+    body = json.dumps(market_data_payload(args.markets))
+    # The pool is started before any threads, as ParsePool requires
+    with ParsePool(args.processes) as pool:
+        results = {'in-process' : measure(_parse_in_process, body, args.calls),
+                   'parse pool' : measure(pool.market_data, body, args.calls)}
+    for mode in ('in-process', 'parse pool'):
+        result = results[mode]
+        print('{0:<12} {1:>8.3f} s wall {2:>8.3f} s cpu {3:>8.1f} ms max stall {4:>8.2f} ms mean stall'.format(
+              mode, result['wall'], result['cpu'], result['max_stall']*1000, result['mean_stall']*1000))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'machine':machine(), 'markets':args.markets, 'calls':args.calls, 'processes':args.processes, 'results':results},
+                      f, indent = 2, separators = (',', ': '), sort_keys = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+'''
+.. module:: api_pool
+   :platform: Linux, Windows, OSX
+   :synopsis: A client that spreads calls across several API key pairs of one account
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+from multiprocessing.pool import ThreadPool
+from managed_api import ManagedAPI
+from cache import ResponseCache, SingleFlight
+from rate_limit import shared_limiter
+import threading, time
+
+class _Member(object):
+    '''One key pair of a :class:`ManagedAPIPool` and its usage counters
+
+    '''
+    def __init__(self, application_key, api):
+        self.application_key = application_key
+        self.api             = api
+        self.calls           = 0
+        self.errors          = 0
+        self.in_flight       = 0
+        self._acquired       = api.rate_limiter.acquired
+
+    def load(self):
+        '''
+        :rtype: float
+        :return: The calls in flight on this key less the tokens left in its rate budget. Lower is less loaded
+
+        '''
+        return self.in_flight - self.api.rate_limiter.available
+
+class ManagedAPIPool(object):
+    '''Spreads calls across several application key pairs, each with its own nonce sequence and rate budget
+
+    :type keys: [(str, str), ...]
+    :param keys: The (application key, secret key) pairs to use. Every pair must belong to the same account
+    :type owner: str
+    :param owner: (optional) The application key to place and cancel orders with. Defaults to the first key
+    :type timeout: float
+    :param timeout: Default timeout to apply to all API calls
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param transport: (optional) The transport every key sends its calls over. If None, each key creates and owns its own :class:`~cryptsy.transport.ConnectionPool`
+    :type nonces: dict(str, callable)
+    :param nonces: (optional) Maps application keys to the nonce source to sign that key's calls with. Keys not listed get their own :class:`~cryptsy.nonce.NonceGenerator`
+    :type cache: :class:`~cryptsy.cache.ResponseCache`
+    :param cache: (optional) The cache to serve repeated read-only calls from. If None, a cache with the default TTLs is used
+    :type rate: float
+    :param rate: (optional) The calls per second each key may make on average
+    :type burst: int
+    :param burst: (optional) The calls each key may make back to back after being idle
+    :type fixed_point: bool
+    :param fixed_point: (optional) Passed on to each :class:`~cryptsy.managed_api.ManagedAPI`
+
+    The pool holds one :class:`~cryptsy.managed_api.ManagedAPI` per key, using the rate limiter shared by every caller of
+    that key. Read-only calls go to the key with the fewest calls in flight relative to the tokens left in its rate
+    budget, so throughput grows with the number of keys. Order placement, cancellation and address generation always
+    use the owner key, so an account's orders keep a single nonce sequence. Each key writes its private calls one at a
+    time, in nonce order (see :func:`~cryptsy.nonce.send_lock`), so spreading calls across keys also spreads that wait.
+
+    Every key shares one response cache and one :class:`~cryptsy.cache.SingleFlight`. An identical call is only made once
+    no matter which key it is routed to, and creating or cancelling orders invalidates cached results for all keys.
+
+    '''
+    def __init__(self, keys, owner = None, timeout = None, transport = None, nonces = None, cache = None, rate = 5.0, burst = 10, fixed_point = False):
+        keys = list(keys)
+        if not keys:
+            raise ValueError('At least one key pair is needed')
+        nonces = nonces if nonces else {}
+        self.cache         = cache if cache is not None else ResponseCache() #: The :class:`~cryptsy.cache.ResponseCache` shared by every key
+        self.single_flight = SingleFlight() #: The :class:`~cryptsy.cache.SingleFlight` shared by every key
+        self.fixed_point   = fixed_point    #: Whether amounts in the returned containers are exact integer units (bool)
+        self._lock    = threading.Lock()
+        self._members = []
+        for application_key, secret_key in keys:
+            api = ManagedAPI(application_key, secret_key, timeout,
+                             transport    = transport,
+                             nonce        = nonces.get(application_key),
+                             cache        = self.cache,
+                             rate_limiter = shared_limiter(application_key, rate, burst),
+                             fixed_point  = fixed_point)
+            api.single_flight = self.single_flight
+            self._members.append(_Member(application_key, api))
+        by_key = dict((member.application_key, member) for member in self._members)
+        if owner is not None and owner not in by_key:
+            raise ValueError('The owner key is not one of the pool\'s keys: '+str(owner))
+        self._owner   = by_key[owner] if owner is not None else self._members[0]
+        self._started = time.time()
+
+    @property
+    def owner(self):
+        '''The :class:`~cryptsy.managed_api.ManagedAPI` orders are placed and cancelled with
+
+        '''
+        return self._owner.api
+
+    @property
+    def apis(self):
+        '''The :class:`~cryptsy.managed_api.ManagedAPI` of every key, in the order the keys were given
+
+        '''
+        return [member.api for member in self._members]
+
+    def stats(self):
+        '''
+        :rtype: dict(str, dict)
+        :return: Maps each application key to a dict of its 'calls' routed through the pool, 'errors' raised, calls
+                 'in_flight' and 'queued' on its rate limiter, 'tokens' left, 'mean_wait' and 'max_wait' for a token
+                 in seconds, and 'utilization': the fraction of its rate budget spent since the pool was created
+
+        '''
+        elapsed = max(time.time() - self._started, 1e-9)
+        stats   = dict()
+        for member in self._members:
+            limiter = member.api.rate_limiter
+            stats[member.application_key] = {'calls'       : member.calls,
+                                            'errors'      : member.errors,
+                                            'in_flight'   : member.in_flight,
+                                            'queued'      : limiter.queued,
+                                            'tokens'      : limiter.available,
+                                            'mean_wait'   : limiter.mean_wait,
+                                            'max_wait'    : limiter.max_wait,
+                                            'utilization' : min(1.0, (limiter.acquired - member._acquired)/(limiter.rate*elapsed))}
+        return stats
+
+    def general_market_data(self, market = None, timeout = None, parse_pool = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data`
+
+        '''
+        return self._read('general_market_data', market, timeout, parse_pool)
+
+    def general_orderbook_data(self, market = None, timeout = None, parse_pool = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.general_orderbook_data`
+
+        '''
+        return self._read('general_orderbook_data', market, timeout, parse_pool)
+
+    def iter_market_data(self, labels = None, markets = None, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.iter_market_data`. The key is picked when iteration starts,
+        and the call counts as in flight until the generator is exhausted or closed
+
+        '''
+        return self._iterate('iter_market_data', labels, markets, timeout)
+
+    def iter_orderbook_data(self, labels = None, markets = None, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.iter_orderbook_data`, counted as :meth:`iter_market_data` is
+
+        '''
+        return self._iterate('iter_orderbook_data', labels, markets, timeout)
+
+    def get_info(self, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.get_info`
+
+        '''
+        return self._read('get_info', timeout)
+
+    def get_markets(self, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.get_markets`
+
+        '''
+        return self._read('get_markets', timeout)
+
+    def get_transactions(self, timeout = None, since = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.get_transactions`
+
+        '''
+        return self._read('get_transactions', timeout, since)
+
+    def market_trades(self, market, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.market_trades`
+
+        '''
+        return self._read('market_trades', market, timeout)
+
+    def market_orders(self, market, timeout = None, columnar = False):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.market_orders`
+
+        '''
+        return self._read('market_orders', market, timeout, columnar)
+
+    def my_trades(self, market = None, limit = 200, timeout = None, after = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.my_trades`
+
+        '''
+        return self._read('my_trades', market, limit, timeout, after)
+
+    def my_orders(self, market = None, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.my_orders`
+
+        '''
+        return self._read('my_orders', market, timeout)
+
+    def depth(self, market, timeout = None, columnar = False):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.depth`
+
+        '''
+        return self._read('depth', market, timeout, columnar)
+
+    def calculate_fees(self, ordertype,  quantity, price, timeout = None):
+        '''Routed version of :meth:`~cryptsy.managed_api.ManagedAPI.calculate_fees`
+
+        '''
+        return self._read('calculate_fees', ordertype, quantity, price, timeout)
+
+    def create_order(self, market, ordertype,  quantity, price, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.create_order` on the owner key
+
+        '''
+        return self._call(self._owner, 'create_order', market, ordertype, quantity, price, timeout)
+
+    def cancel_order(self, orderid = None, market = None, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.cancel_order` on the owner key
+
+        '''
+        return self._call(self._owner, 'cancel_order', orderid, market, timeout)
+
+    def generate_new_address(self, currencycode = None, currencyid = None, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.generate_new_address` on the owner key
+
+        '''
+        return self._call(self._owner, 'generate_new_address', currencycode, currencyid, timeout)
+
+    def create_orders(self, orders, max_concurrency = 4, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.create_orders` on the owner key
+
+        '''
+        return self._call(self._owner, 'create_orders', orders, max_concurrency, timeout)
+
+    def cancel_orders(self, orderids, market = None, max_concurrency = 4, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.cancel_orders` on the owner key
+
+        '''
+        return self._call(self._owner, 'cancel_orders', orderids, market, max_concurrency, timeout)
+
+    def replace_orders(self, replacements, place_first = True, max_concurrency = 4, timeout = None):
+        ''':meth:`~cryptsy.managed_api.ManagedAPI.replace_orders` on the owner key
+
+        '''
+        return self._call(self._owner, 'replace_orders', replacements, place_first, max_concurrency, timeout)
+
+    def fetch_many(self, method, markets, max_concurrency = 8, timeout = None):
+        '''Version of :meth:`~cryptsy.managed_api.ManagedAPI.fetch_many` which routes the call for each market on its own,
+        so a batch is spread across every key
+
+        '''
+        def fetch(market):
+            try:
+                return (market, self._read(method, market, timeout), None)
+            except Exception as e:
+                return (market, None, e)
+        pool = ThreadPool(max_concurrency)
+        try:
+            for result in pool.imap_unordered(fetch, markets):
+                yield result
+        finally:
+            pool.terminate()
+
+    def _read(self, method, *args):
+        '''Calls a read-only method on the least loaded key
+
+        '''
+        with self._lock:
+            member = min(self._members, key = _Member.load)
+            member.in_flight += 1
+        return self._finish(member, method, args)
+
+    def _call(self, member, method, *args):
+        with self._lock:
+            member.in_flight += 1
+        return self._finish(member, method, args)
+
+    def _finish(self, member, method, args):
+        '''Calls a method on a key already counted as in flight, updating its counters
+
+        '''
+        try:
+            return getattr(member.api, method)(*args)
+        except Exception:
+            with self._lock:
+                member.errors += 1
+            raise
+        finally:
+            with self._lock:
+                member.calls     += 1
+                member.in_flight -= 1
+
+    def _iterate(self, method, *args):
+        with self._lock:
+            member = min(self._members, key = _Member.load)
+            member.in_flight += 1
+        try:
+            for item in getattr(member.api, method)(*args):
+                yield item
+        except Exception:
+            with self._lock:
+                member.errors += 1
+            raise
+        finally:
+            with self._lock:
+                member.calls     += 1
+                member.in_flight -= 1
@@ -0,0 +1,432 @@
+'''
+.. module:: async_api
+   :platform: Linux, Windows, OSX
+   :synopsis: A non-blocking counterpart to :class:`cryptsy.managed_api.ManagedAPI`
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+from bare_api import general_market_data, general_orderbook_data, get_info, get_markets,\
+                     get_transactions, market_trades, market_orders, my_trades, my_orders,\
+                     depth, create_order, cancel_order, calculate_fees, generate_new_address
+from managed_api import ManagedAPI, _insufficient_funds
+from nonblocking import EventLoopTransport, Future
+from transport import RedirectTransport
+from rate_limit import PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_POLL
+from StringIO import StringIO
+import heapq, itertools, threading, time, Queue
+
+class AsyncManagedAPI(object):
+    '''Non-blocking version of :class:`~cryptsy.managed_api.ManagedAPI`
+
+    :type application_key: str
+    :param application_key: The public application key used for authenticated requests
+    :type secret_key: str
+    :param secret_key: The private secret key for the user for authenticated requests
+    :type timeout: float
+    :param timeout: Default timeout to apply to all API calls
+    :type max_connections: int
+    :param max_connections: (optional) The maximum number of connections to open to each API host
+    :type nonce: callable
+    :param nonce: (optional) The nonce source used to sign private API calls. If None, a :class:`~cryptsy.nonce.NonceGenerator` is used
+    :type cache: :class:`~cryptsy.cache.ResponseCache`
+    :param cache: (optional) The cache to serve repeated read-only calls from. If None, a cache with the default TTLs is used
+    :type rate_limiter: :class:`~cryptsy.rate_limit.RateLimiter`
+    :param rate_limiter: (optional) The limiter to throttle calls with. If None, the limiter shared by every instance using application_key is used
+    :type fixed_point: bool
+    :param fixed_point: (optional) As for :class:`~cryptsy.managed_api.ManagedAPI`
+    :type address: (str, int)
+    :param address: (optional) The (host, port) to send every call to over plain HTTP, such as the :attr:`~cryptsy.standin.StandInServer.address` of a stand-in server
+    :type nonce_path: str
+    :param nonce_path: (optional) As for :class:`~cryptsy.managed_api.ManagedAPI`
+
+    Every method takes the same arguments as its :class:`~cryptsy.managed_api.ManagedAPI` counterpart plus an optional
+    callback, and returns at once with a :class:`~cryptsy.nonblocking.Future`. Calling ``get()`` on it blocks until the call
+    completes and returns the parsed data, or raises the :exc:`~cryptsy.managed_api.APIError` the call failed with. If a
+    callback is given it is called with the parsed data once the call succeeds.
+
+    All calls are sent by one :class:`~cryptsy.nonblocking.EventLoopTransport`, whose single thread drives every
+    connection with non-blocking sockets, so many calls can be in flight without a thread each. Responses are parsed and
+    callbacks run on that thread, so callbacks must not block. A callback for a result served from the cache runs at once,
+    on the calling thread.
+
+    Private calls are signed as they are sent, under the :func:`~cryptsy.nonce.send_lock` of the application key, and are
+    sent one at a time in the order they were made. However many are made at once, from any mix of threads, callbacks and
+    blocking :class:`~cryptsy.managed_api.ManagedAPI` instances using the same key, they reach the server in nonce order.
+
+    Calls share the nonce source, cache, rate limiter and fixed-point mode of :attr:`api`, and wait for a token from the
+    rate limiter without blocking, in the same priority order. Calls are not coalesced by a
+    :class:`~cryptsy.cache.SingleFlight` or reported to :mod:`cryptsy.instrumentation`, and cannot be parsed in a
+    :class:`~cryptsy.parse_pool.ParsePool`.
+
+    '''
+    def __init__(self, application_key, secret_key, timeout = None, max_connections = 16, nonce = None, cache = None, rate_limiter = None, fixed_point = False, address = None, nonce_path = None):
+        self.transport = EventLoopTransport(max_connections, address = address) #: The :class:`~cryptsy.nonblocking.EventLoopTransport` calls are sent over
+        self.api       = ManagedAPI(application_key, secret_key, timeout,
+                                    transport    = RedirectTransport(address) if address else None,
+                                    nonce        = nonce,
+                                    cache        = cache,
+                                    rate_limiter = rate_limiter,
+                                    fixed_point  = fixed_point,
+                                    nonce_path   = nonce_path) #: A blocking :class:`~cryptsy.managed_api.ManagedAPI` sharing this client's key, nonce source, cache and rate limiter
+        self._waiting  = [] # (priority, sequence, queued at, start) of calls waiting for a rate token, used on the loop thread only
+        self._counter  = itertools.count()
+        self._retrying = False
+
+    def close(self):
+        '''Waits for all in-flight calls to complete and stops the event loop
+
+        '''
+        self.transport.close()
+
+    def general_market_data(self, market = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_POLL, lambda: general_market_data(market, self.api._timeout(timeout), self.transport),
+                          lambda raw: self.api._market_data_result(self.api._check_result(raw)), callback,
+                          ('general_market_data', market, (('parse_pool', None),)))
+
+    def general_orderbook_data(self, market = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.general_orderbook_data`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_POLL, lambda: general_orderbook_data(market, self.api._timeout(timeout), self.transport),
+                          self.api._check_result, callback, ('general_orderbook_data', market, (('parse_pool', None),)))
+
+    def iter_market_data(self, labels = None, markets = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.iter_market_data`. Markets not asked for are
+        skipped without being parsed
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of (label, market data) pairs
+
+        '''
+        return self._call(PRIORITY_POLL, lambda: general_market_data(timeout = self.api._timeout(timeout), transport = self.transport, stream = True),
+                          lambda body: list(self.api._iter_market_data(StringIO(body), labels, markets)), callback)
+
+    def iter_orderbook_data(self, labels = None, markets = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.iter_orderbook_data`, filtered as :meth:`iter_market_data` is
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of (key, orderbook data) pairs
+
+        '''
+        return self._call(PRIORITY_POLL, lambda: general_orderbook_data(timeout = self.api._timeout(timeout), transport = self.transport, stream = True),
+                          lambda body: list(self.api._iter_orderbook_data(StringIO(body), labels, markets)), callback)
+
+    def get_info(self, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.get_info`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(get_info, timeout), self.api._check_result, callback, ('get_info', None, ()))
+
+    def get_markets(self, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.get_markets`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(get_markets, timeout), self.api._check_result, callback, ('get_markets', None, ()))
+
+    def get_transactions(self, timeout = None, since = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.get_transactions`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(get_transactions, timeout),
+                          lambda raw: self.api._transactions_result(self.api._check_result(raw), since), callback,
+                          ('get_transactions', None, (('since', since),)))
+
+    def market_trades(self, market, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.market_trades`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(market_trades, timeout, market = market), self.api._check_result, callback,
+                          ('market_trades', market, ()))
+
+    def market_orders(self, market, timeout = None, columnar = False, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.market_orders`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(market_orders, timeout, market = market),
+                          lambda raw: self.api._market_orders_result(self.api._check_result(raw), columnar), callback,
+                          ('market_orders', market, (('columnar', columnar),)))
+
+    def my_trades(self, market = None, limit = 200, timeout = None, after = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.my_trades`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(my_trades, timeout, market = market, limit = limit),
+                          lambda raw: self.api._my_trades_result(self.api._check_result(raw), after), callback,
+                          ('my_trades', market, (('after', after), ('limit', limit))))
+
+    def my_orders(self, market = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.my_orders`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(my_orders, timeout, market = market),
+                          lambda raw: self.api._my_orders_result(self.api._check_result(raw)), callback,
+                          ('my_orders', market, ()))
+
+    def depth(self, market, timeout = None, columnar = False, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.depth`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(depth, timeout, market = market),
+                          lambda raw: self.api._depth_result(self.api._check_result(raw), columnar), callback,
+                          ('depth', market, (('columnar', columnar),)))
+
+    def create_order(self, market, ordertype,  quantity, price, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.create_order`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ORDER, self._private(create_order, timeout, market = market, ordertype = ordertype,
+                                                        quantity = self.api._amount(quantity), price = self.api._amount(price)),
+                          lambda raw: self._order_result(raw, market), callback)
+
+    def cancel_order(self, orderid = None, market = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.cancel_order`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ORDER, self._private(cancel_order, timeout, orderid = orderid, market = market),
+                          lambda raw: self._order_result(raw, market), callback)
+
+    def calculate_fees(self, ordertype,  quantity, price, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.calculate_fees`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(calculate_fees, timeout, ordertype = ordertype,
+                                                          quantity = self.api._amount(quantity), price = self.api._amount(price)),
+                          self.api._check_result, callback,
+                          ('calculate_fees', None, (('ordertype', ordertype), ('price', price), ('quantity', quantity))))
+
+    def generate_new_address(self, currencycode = None, currencyid = None, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.generate_new_address`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        return self._call(PRIORITY_ACCOUNT, self._private(generate_new_address, timeout, currencycode = currencycode, currencyid = currencyid),
+                          self.api._check_result, callback)
+
+    def fetch_many(self, method, markets, max_concurrency = 8, timeout = None):
+        '''Version of :meth:`~cryptsy.managed_api.ManagedAPI.fetch_many` which makes the calls without a thread each
+
+        :rtype: generator of (int, data, :exc:`Exception`)
+        :return: A (market, data, error) tuple for every market, in completion order, as for :meth:`~cryptsy.managed_api.ManagedAPI.fetch_many`
+
+        The generator blocks while waiting for the next result. Another call is started each time a result is taken, so
+        no more than max_concurrency calls are in flight at once.
+
+        '''
+        call    = getattr(self, method)
+        markets = list(markets)
+        results = Queue.Queue()
+        def start(market):
+            call(market, timeout = timeout).add_callback(lambda done: results.put((market, done)))
+        for market in markets[:max_concurrency]:
+            start(market)
+        for index in xrange(len(markets)):
+            market, done = results.get()
+            if index + max_concurrency < len(markets):
+                start(markets[index + max_concurrency])
+            error = done.exception()
+            yield (market, None, error) if error is not None else (market, done.get(), None)
+
+    def create_orders(self, orders, max_concurrency = 4, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.create_orders`
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of results, which never fails
+
+        Every order is queued at once; max_concurrency is accepted for compatibility and has no effect, since the private
+        calls of one key are sent one at a time in any case.
+
+        '''
+        return self._gather([self._attempt(self.create_order, order, timeout) for order in orders], callback)
+
+    def cancel_orders(self, orderids, market = None, max_concurrency = 4, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.cancel_orders`, queued as :meth:`create_orders` is
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of results, which never fails
+
+        '''
+        return self._gather([self._attempt(self.cancel_order, (orderid, market), timeout) for orderid in orderids], callback)
+
+    def replace_orders(self, replacements, place_first = True, max_concurrency = 4, timeout = None, callback = None):
+        '''Asynchronous version of :meth:`~cryptsy.managed_api.ManagedAPI.replace_orders`, queued as :meth:`create_orders` is
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of (create result, cancel result) tuples, which never fails
+
+        Without place_first, each cancellation and its replacement are queued together, so the replacement is sent
+        straight after the cancellation is answered.
+
+        '''
+        def replace(replacement):
+            orderid, order = replacement[0], replacement[1:]
+            replaced = Future()
+            def cancel_and_create():
+                cancelled = self._attempt(self.cancel_order, (orderid, order[0]), timeout)
+                created   = self._attempt(self.create_order, order, timeout)
+                self._gather([created, cancelled]).add_callback(lambda done: replaced.set_result(tuple(done.get())))
+            def placed(done):
+                created = done.get()
+                if not isinstance(created, Exception):
+                    cancelled = self._attempt(self.cancel_order, (orderid, order[0]), timeout)
+                    cancelled.add_callback(lambda cancel: replaced.set_result((created, cancel.get())))
+                elif not _insufficient_funds(created):
+                    replaced.set_result((created, None))
+                else:
+                    cancel_and_create()
+            if place_first:
+                self._attempt(self.create_order, order, timeout).add_callback(placed)
+            else:
+                cancel_and_create()
+            return replaced
+        return self._gather([replace(replacement) for replacement in replacements], callback)
+
+    def _private(self, function, timeout, **inputs):
+        '''
+        :return: A callable making a private call from :mod:`cryptsy.bare_api` over :attr:`transport`
+
+        '''
+        return lambda: function(application_key = self.api._application_key,
+                                secret_key      = self.api._signer,
+                                timeout         = self.api._timeout(timeout),
+                                transport       = self.transport,
+                                nonce           = self.api._nonce,
+                                **inputs)
+
+    def _call(self, priority, send, parse, callback, cached = None):
+        '''Makes a call once a rate token is available
+
+        :param send: Makes the call over :attr:`transport`, returning a future of the raw response
+        :param parse: Called on the loop thread with the raw response, returning the result of the call
+        :param cached: (optional) The (method, market, arguments) the result is cached under in :attr:`api`'s cache, the same key
+                       the :class:`~cryptsy.managed_api.ManagedAPI` method uses
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+
+        '''
+        future = _with_callback(Future(), callback)
+        if cached is not None:
+            method, market, args = cached
+            hit, value = self.api.cache.get(method, market, args)
+            if hit:
+                future.set_result(value)
+                return future
+            generation = self.api.cache.generation(method, market)
+        def finish(raw):
+            try:
+                value = parse(raw.get())
+            except Exception as e:
+                future.set_exception(e)
+                return
+            if cached is not None:
+                self.api.cache.put(method, market, args, value, generation)
+            future.set_result(value)
+        def start():
+            try:
+                send().add_callback(finish)
+            except Exception as e:
+                future.set_exception(e)
+        self.transport.call_soon(self._throttle, priority, start)
+        return future
+
+    def _throttle(self, priority, start):
+        '''Runs on the loop thread. Queues start to be called once a rate token is available
+
+        '''
+        heapq.heappush(self._waiting, (priority, next(self._counter), time.time(), start))
+        self._admit()
+
+    def _admit(self):
+        '''Runs on the loop thread. Starts queued calls, most urgent first, for as long as rate tokens are available
+
+        '''
+        while self._waiting:
+            priority, _, queued, start = self._waiting[0]
+            wait = self.api.rate_limiter.try_acquire(priority, queued)
+            if wait:
+                if not self._retrying:
+                    self._retrying = True
+                    self.transport.call_later(wait, self._retry)
+                return
+            heapq.heappop(self._waiting)
+            start()
+
+    def _retry(self):
+        self._retrying = False
+        self._admit()
+
+    def _order_result(self, raw, market):
+        data = self.api._check_result(raw)
+        self.api._invalidate_orders(market)
+        return data
+
+    def _attempt(self, method, args, timeout):
+        '''Makes an order call
+
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the result of the call, or the exception it failed with
+
+        '''
+        attempt = Future()
+        method(*args, timeout = timeout).add_callback(lambda done: attempt.set_result(done.exception() if done.exception() is not None else done.get()))
+        return attempt
+
+    def _gather(self, futures, callback = None):
+        '''
+        :param futures: Futures which never fail, such as those returned by :meth:`_attempt`
+        :rtype: :class:`~cryptsy.nonblocking.Future`
+        :return: A future of the list of their results, in the same order
+
+        '''
+        gathered  = _with_callback(Future(), callback)
+        results   = [None]*len(futures)
+        remaining = [len(futures)]
+        lock      = threading.Lock()
+        def collect(index, done):
+            results[index] = done.get()
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                gathered.set_result(results)
+        if not futures:
+            gathered.set_result(results)
+        for index, future in enumerate(futures):
+            future.add_callback(lambda done, index = index: collect(index, done))
+        return gathered
+
+def _with_callback(future, callback):
+    if callback is not None:
+        future.add_callback(lambda done: callback(done.get()) if done.successful() else None)
+    return future
@@ -8,13 +8,20 @@ Licesnsed under the MIT License. See accompanying LICENSE.txt file for full lice
 Copyright (c) 2014 Adam Panzica
    
 '''
-import urllib, urllib2, json, hashlib, hmac
+import urllib, urllib2, hashlib, hmac
 import time
+from signing import Signer, template
+from nonce import send_lock
+from transport import DeferredTransport
+import decoding
+import instrumentation
 
 __PUB_API_BASE__ = 'http://pubapi.cryptsy.com/api.php?'
 __PRI_API_BASE__ = 'https://api.cryptsy.com/api'
 
-def call_pub_api(method, inputs, timeout = None):
+_NONCE_ATTEMPTS = 5 # Times a private call is sent before a rejected nonce is returned to the caller
+
+def call_pub_api(method, inputs, timeout = None, transport = None, stream = False):
     '''Calls a public API method
     
     :param method: The method to call
@@ -23,14 +30,25 @@ def call_pub_api(method, inputs, timeout = None):
     :type inputs: [(str,stringable),...]
     :param timeout: Timeout for the request in seconds
     :type timeout: float
+    :param transport: (optional) A :class:`~cryptsy.transport.Transport`, such as a :class:`~cryptsy.transport.ConnectionPool`, to send the request over. If None, a new connection is opened for the call
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param stream: (optional) If True, the undecoded response is returned as a file-like object, which the caller must close
+    :type stream: bool
     :return: file-like -- A json encoded object with the results of the API call
     
     '''
     inputs.append(('method', method))
-    api_call = urllib2.urlopen(url =  __PUB_API_BASE__, data = urllib.urlencode(inputs), timeout = timeout)
-    return json.load(api_call)
+    body = urllib.urlencode(inputs)
+    if isinstance(transport, DeferredTransport):
+        return transport.submit(__PUB_API_BASE__, lambda: (body, None), None, timeout, stream)
+    if instrumentation.observers:
+        return _instrumented_call(method, __PUB_API_BASE__, lambda: (body, None), None, timeout, transport, stream)
+    response = _open(__PUB_API_BASE__, body, None, timeout, transport)
+    if stream:
+        return response
+    return _read(response)
 
-def call_pri_api(method, inputs, application_key, secret_key, timeout = None):
+def call_pri_api(method, inputs, application_key, secret_key, timeout = None, transport = None, nonce = None):
     '''Calls a private API method
     
     :param method: The method to call
@@ -39,28 +57,155 @@ def call_pri_api(method, inputs, application_key, secret_key, timeout = None):
     :type inputs: [(str,stringable),...]
     :param application_key: The application key to apply to the API call
     :type application_key: str
-    :param secret_key: The user's secret key to apply to the API call
-    :type secret_key: str
+    :param secret_key: The user's secret key to apply to the API call, or a :class:`~cryptsy.signing.Signer` keyed with it
+    :type secret_key: str or :class:`~cryptsy.signing.Signer`
     :param timeout: Timeout for the request in seconds
     :type timeout: float
+    :param transport: (optional) A :class:`~cryptsy.transport.Transport`, such as a :class:`~cryptsy.transport.ConnectionPool`, to send the request over. If None, a new connection is opened for the call
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`. If None, the current time in seconds is used
     :return: file-like -- A json encoded object with the results of the API call
     
+    The nonce is taken under the :func:`~cryptsy.nonce.send_lock` of application_key, which is held until the request
+    has been written, so the calls of one key are sent in nonce order however many threads make them, while their
+    responses are awaited in parallel. Without a transport the lock is held until the response headers arrive.
+    Requests sent over separate connections can still reach the server out of order. The server does not act on a
+    request whose nonce it rejects, so such a call is signed with a new nonce and sent again, up to a few times.
+    Over a :class:`~cryptsy.transport.DeferredTransport` the call returns at once with what the transport's ``submit``
+    returns, and the nonce is taken when the request is sent.
+    
     '''
-    inputs.append(('method', method))
-    inputs.append(('nonce', int(time.time())))
-    signable   = urllib.urlencode(inputs)
-    sign       = hmac.new(secret_key, signable, hashlib.sha512).hexdigest()
-    headers    = {'Key':application_key, 'Sign':sign}
-    api_call = urllib2.urlopen(urllib2.Request(__PRI_API_BASE__, signable, headers), timeout=timeout)
-    return json.load(api_call)
+    request = template(method, tuple([key for key, _ in inputs]))
+    values  = [value for _, value in inputs]
+    def sign():
+        signable = request.encode(values, nonce() if nonce else int(time.time()))
+        if isinstance(secret_key, Signer):
+            sign = secret_key.sign(signable)
+        else:
+            sign = hmac.new(secret_key, signable, hashlib.sha512).hexdigest()
+        return signable, {'Key':application_key, 'Sign':sign}
+    lock = send_lock(application_key)
+    if isinstance(transport, DeferredTransport):
+        return transport.submit(__PRI_API_BASE__, sign, lock, timeout)
+    for _ in xrange(_NONCE_ATTEMPTS):
+        if instrumentation.observers:
+            result = _instrumented_call(method, __PRI_API_BASE__, sign, lock, timeout, transport, False)
+        else:
+            lock.acquire()
+            sent = _releaser(lock)
+            try:
+                signable, headers = sign()
+                response = _open(__PRI_API_BASE__, signable, headers, timeout, transport, sent)
+            finally:
+                sent()
+            result = _read(response)
+        if not _nonce_rejected(result):
+            break
+    return result
+
+def _nonce_rejected(result):
+    '''
+    :return: True if result is the server's answer to a request whose nonce was not greater than the last one it accepted
+
+    '''
+    return isinstance(result, dict) and str(result.get('success')) != '1' and 'nonce' in str(result.get('error', '')).lower()
+
+def _releaser(lock):
+    '''
+    :return: A callable which releases lock the first time it is called, and does nothing after that
+
+    '''
+    released = []
+    def release():
+        if not released:
+            released.append(True)
+            lock.release()
+    return release
+
+def _open(url, body, headers, timeout, transport, sent = None):
+    '''Sends a request and waits for the response headers
+
+    :param sent: (optional) Passed on to :meth:`~cryptsy.transport.Transport.open`
+    :return: A file-like object to read the response body from, which the caller must close
+
+    '''
+    if transport:
+        return transport.open(url, body, headers, timeout, sent)
+    return urllib2.urlopen(urllib2.Request(url, body, headers if headers else {}), timeout = timeout)
+
+def _read(response):
+    try:
+        return decoding.loads(response.read())
+    finally:
+        response.close()
+
+def _instrumented_call(method, url, prepare, lock, timeout, transport, stream):
+    '''Makes an API call while timing its phases for :mod:`cryptsy.instrumentation`. The call is reported to the observers
+    unless it is part of an enclosing call, such as a :class:`~cryptsy.managed_api.ManagedAPI` method, which is already being timed
+
+    :param prepare: Called with no arguments to get the (body, headers) of the request
+    :param lock: (optional) A lock to take the body and send the request under, such as a :func:`~cryptsy.nonce.send_lock`.
+                 It is released once the request has been written
+    
+    '''
+    owned = instrumentation.begin(method)
+    try:
+        record = instrumentation.current() or instrumentation.CallRecord(method)
+        if lock is None:
+            response = _timed_open(record, url, prepare, timeout, transport)
+        else:
+            started = time.time()
+            lock.acquire()
+            sent = _releaser(lock)
+            try:
+                record.add(instrumentation.THROTTLE, time.time() - started)
+                response = _timed_open(record, url, prepare, timeout, transport, sent)
+            finally:
+                sent()
+        result = response if stream else _timed_read(record, response)
+    except Exception as e:
+        if owned:
+            instrumentation.finish(owned, instrumentation.outcome_of(e), e)
+        raise
+    if owned:
+        failed = not stream and str(result.get('success')) != '1'
+        instrumentation.finish(owned, instrumentation.API_ERROR if failed else instrumentation.SUCCESS)
+    return result
+
+def _timed_open(record, url, prepare, timeout, transport, sent = None):
+    body, headers = prepare()
+    if transport:
+        return transport.open(url, body, headers, timeout, sent)
+    started = time.time()
+    try:
+        return urllib2.urlopen(urllib2.Request(url, body, headers if headers else {}), timeout = timeout)
+    finally:
+        record.add(instrumentation.WAIT, time.time() - started)
+
+def _timed_read(record, response):
+    started = time.time()
+    try:
+        data = response.read()
+    finally:
+        record.add(instrumentation.DOWNLOAD, time.time() - started)
+        response.close()
+    record.response_bytes = (record.response_bytes or 0) + len(data)
+    started = time.time()
+    result  = decoding.loads(data)
+    record.add(instrumentation.DECODE, time.time() - started)
+    return result
 
-def general_market_data(market = None, timeout = None):
+def general_market_data(market = None, timeout = None, transport = None, stream = False):
     '''Gets the current state of market data for either all markets or a specific market
     
     :param market: (optional) The market ID to fetch data for
     :type market: int
     :param timeout: (optional) Timeout for the request, in seconds
     :type timeout: int
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param stream: (optional) If True, the undecoded response is returned as a file-like object, which the caller must close
+    :type stream: bool
     
     '''
     if market:
@@ -69,16 +214,20 @@ def general_market_data(market = None, timeout = None):
     else:
         method = 'marketdatav2'
         inputs = []
-    data = call_pub_api(method, inputs, timeout)
+    data = call_pub_api(method, inputs, timeout, transport, stream)
     return data
 
-def general_orderbook_data(market = None, timeout = None):
+def general_orderbook_data(market = None, timeout = None, transport = None, stream = False):
     '''Gets the current state of orderbook data for either all markets or a specific market
     
     :param market: (optional) The market ID to fetch data for
     :type market: int
     :param timeout: (optional) Timeout for the request, in seconds
     :type timeout: int
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param stream: (optional) If True, the undecoded response is returned as a file-like object, which the caller must close
+    :type stream: bool
     
     '''
     if market:
@@ -87,10 +236,10 @@ def general_orderbook_data(market = None, timeout = None):
     else:
         method = 'orderdata'
         inputs = []
-    data = call_pub_api(method, inputs, timeout)
+    data = call_pub_api(method, inputs, timeout, transport, stream)
     return data
 
-def get_info(application_key, secret_key, timeout = None):
+def get_info(application_key, secret_key, timeout = None, transport = None, nonce = None):
     '''Get's the user's account info
     
     :param application_key: The application key to apply to the API call
@@ -98,12 +247,15 @@ def get_info(application_key, secret_key, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('getinfo', [], application_key, secret_key, timeout)
+    data = call_pri_api('getinfo', [], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def get_markets(application_key, secret_key, timeout = None):
+def get_markets(application_key, secret_key, timeout = None, transport = None, nonce = None):
     '''Get's the user's active markets
     
     :param application_key: The application key to apply to the API call
@@ -111,12 +263,15 @@ def get_markets(application_key, secret_key, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('getmarkets', [], application_key, secret_key, timeout)
+    data = call_pri_api('getmarkets', [], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def get_transactions(application_key, secret_key, timeout = None):
+def get_transactions(application_key, secret_key, timeout = None, transport = None, nonce = None):
     '''Get's the user's Deposit/Withdrawal history
     
     :param application_key: The application key to apply to the API call
@@ -124,12 +279,15 @@ def get_transactions(application_key, secret_key, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('mytransactions', [], application_key, secret_key, timeout)
+    data = call_pri_api('mytransactions', [], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def market_trades(application_key, secret_key, market, timeout = None):
+def market_trades(application_key, secret_key, market, timeout = None, transport = None, nonce = None):
     '''Get's the the last 1000 transactions for a market
     
     :param market: The market ID to query
@@ -139,12 +297,15 @@ def market_trades(application_key, secret_key, market, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('markettrades', [], application_key, secret_key, timeout)
+    data = call_pri_api('markettrades', [], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def market_orders(application_key, secret_key, market, timeout = None):
+def market_orders(application_key, secret_key, market, timeout = None, transport = None, nonce = None):
     '''Get's the the set of buy/sell orders for a market
     
     :param market: The market ID to query
@@ -154,12 +315,15 @@ def market_orders(application_key, secret_key, market, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('marketorders', [('marketid',market)], application_key, secret_key, timeout)
+    data = call_pri_api('marketorders', [('marketid',market)], application_key, secret_key, timeout, transport, nonce)
     return data 
 
-def my_trades(application_key, secret_key, market = None, limit = 200, timeout = None):
+def my_trades(application_key, secret_key, market = None, limit = 200, timeout = None, transport = None, nonce = None):
     '''Get's the the trade history for the user, optionally limited to a given market
     
     :param market: (optional) The market ID to query
@@ -171,6 +335,9 @@ def my_trades(application_key, secret_key, market = None, limit = 200, timeout =
     :param limit: (optional) The maximum number of transactions to list. Ignored if market is not specified
     :type limit: int
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
     if market:
@@ -179,10 +346,10 @@ def my_trades(application_key, secret_key, market = None, limit = 200, timeout =
     else:
         method = 'allmytrades'
         inputs = []
-    data = call_pri_api(method, inputs, application_key, secret_key, timeout)
+    data = call_pri_api(method, inputs, application_key, secret_key, timeout, transport, nonce)
     return data
 
-def my_orders(application_key, secret_key, market = None, timeout = None):
+def my_orders(application_key, secret_key, market = None, timeout = None, transport = None, nonce = None):
     '''Get's the the user's current open buy/sell orders, optionally limited to a a market
     
     :param market: (optional) The market ID to query
@@ -192,6 +359,9 @@ def my_orders(application_key, secret_key, market = None, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
     if market:
@@ -200,10 +370,10 @@ def my_orders(application_key, secret_key, market = None, timeout = None):
     else:
         method = 'allmyorders'
         inputs = []
-    data = call_pri_api(method, inputs, application_key, secret_key, timeout)
+    data = call_pri_api(method, inputs, application_key, secret_key, timeout, transport, nonce)
     return data 
 
-def depth(application_key, secret_key, market, timeout = None):
+def depth(application_key, secret_key, market, timeout = None, transport = None, nonce = None):
     '''Get's an array of buy and sell orders on the market representing market depth
     
     :param market: The market ID to query
@@ -213,12 +383,15 @@ def depth(application_key, secret_key, market, timeout = None):
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('depth', [('marketid',market)], application_key, secret_key, timeout)
+    data = call_pri_api('depth', [('marketid',market)], application_key, secret_key, timeout, transport, nonce)
     return data 
 
-def create_order(application_key, secret_key, market, ordertype,  quantity, price, timeout = None):
+def create_order(application_key, secret_key, market, ordertype,  quantity, price, timeout = None, transport = None, nonce = None):
     '''Creates an order on a market
     
     :param market: The market ID to query
@@ -234,12 +407,15 @@ def create_order(application_key, secret_key, market, ordertype,  quantity, pric
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('createorder', [('marketid',market), ('ordertype',ordertype), ('quantity',quantity), ('price',price)], application_key, secret_key, timeout)
+    data = call_pri_api('createorder', [('marketid',market), ('ordertype',ordertype), ('quantity',quantity), ('price',price)], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def cancel_order(application_key, secret_key, orderid = None, market = None, timeout = None):
+def cancel_order(application_key, secret_key, orderid = None, market = None, timeout = None, transport = None, nonce = None):
     '''Cancels an order, all orders on a market, or all orders across all markets
     
     :param orderid: (optional) The order to cancel
@@ -251,6 +427,9 @@ def cancel_order(application_key, secret_key, orderid = None, market = None, tim
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     If an order id is given, cancels just that order. If a market id is given (but not an order ID), cancels all orders on that market.
     If neither an order id or market id are given, cancels all open orders for the user
@@ -265,10 +444,10 @@ def cancel_order(application_key, secret_key, orderid = None, market = None, tim
     else:
         method = 'cancelallorders'       
         inputs = []
-    data = call_pri_api(method, inputs, application_key, secret_key, timeout)
+    data = call_pri_api(method, inputs, application_key, secret_key, timeout, transport, nonce)
     return data 
 
-def calculate_fees(application_key, secret_key, ordertype,  quantity, price, timeout = None):
+def calculate_fees(application_key, secret_key, ordertype,  quantity, price, timeout = None, transport = None, nonce = None):
     '''Calculates the fees that would be assessed for an order
     
     :param ordertype: Buy|Sell
@@ -282,12 +461,15 @@ def calculate_fees(application_key, secret_key, ordertype,  quantity, price, tim
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     '''
-    data = call_pri_api('calculatefees', [('ordertype',ordertype), ('quantity',quantity), ('price',price)], application_key, secret_key, timeout)
+    data = call_pri_api('calculatefees', [('ordertype',ordertype), ('quantity',quantity), ('price',price)], application_key, secret_key, timeout, transport, nonce)
     return data
 
-def generate_new_address(application_key, secret_key, currencycode = None, currencyid = None, timeout = None):
+def generate_new_address(application_key, secret_key, currencycode = None, currencyid = None, timeout = None, transport = None, nonce = None):
     '''Creates a new deposite address for the specified currency.
     
     :param currencycode: The currency code to create an address for (EX: 'BTC' = Bitcoin)
@@ -299,6 +481,9 @@ def generate_new_address(application_key, secret_key, currencycode = None, curre
     :param secret_key: The user's secret key to apply to the API call
     :type secret_key: str
     :param timeout: Timeout for the request in seconds
+    :param transport: (optional) The :class:`~cryptsy.transport.Transport` to send the request over
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param nonce: (optional) A callable returning the nonce to sign the request with, such as a :class:`~cryptsy.nonce.NonceGenerator`
     
     Only need to specify currency code OR currency id, not both
     
@@ -310,5 +495,5 @@ def generate_new_address(application_key, secret_key, currencycode = None, curre
         inputs = [('currencyid', currencyid)]
     else:
         inputs = []
-    data = call_pri_api(method, inputs, application_key, secret_key, timeout)
+    data = call_pri_api(method, inputs, application_key, secret_key, timeout, transport, nonce)
     return data  
\ No newline at end of file
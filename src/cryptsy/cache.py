@@ -0,0 +1,227 @@
+'''
+.. module:: cache
+   :platform: Linux, Windows, OSX
+   :synopsis: A TTL/LRU cache for API call results, and coalescing of identical concurrent calls
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+from collections import OrderedDict
+import threading, time
+
+#: Default number of seconds the result of each method stays valid. Methods that are not listed are never cached
+DEFAULT_TTLS = {'general_market_data'    : 5.0,
+                'general_orderbook_data' : 1.0,
+                'get_info'               : 5.0,
+                'get_markets'            : 3600.0,
+                'get_transactions'       : 60.0,
+                'market_trades'          : 5.0,
+                'market_orders'          : 0.5,
+                'my_trades'              : 10.0,
+                'my_orders'              : 2.0,
+                'depth'                  : 0.5,
+                'calculate_fees'         : 60.0,}
+
+class ResponseCache(object):
+    '''A thread-safe cache of API call results with a per-method time-to-live and a least-recently-used size bound
+
+    :param ttls: (optional) Mapping of method name to the number of seconds its results stay valid. Defaults to :data:`DEFAULT_TTLS`
+    :type ttls: dict(str, float)
+    :param max_size: (optional) The maximum number of results to hold. The least recently used result is dropped when full
+    :type max_size: int
+
+    Entries are keyed by method name, market ID and the remaining call arguments. The market is kept separately so that
+    every cached result for a market can be invalidated at once.
+
+    A call that was already in flight when its results were invalidated may return data from before the change. Take
+    the :meth:`generation` before making the call and pass it to :meth:`put`, which then drops the stale result.
+
+    '''
+    def __init__(self, ttls = None, max_size = 1024):
+        self.ttls     = dict(DEFAULT_TTLS if ttls is None else ttls) #: Mapping of method name to TTL in seconds (dict(str, float))
+        self.max_size = max_size #: The maximum number of cached results (int)
+        self.hits     = 0        #: The number of lookups that found a valid result (int)
+        self.misses   = 0        #: The number of lookups that did not find a valid result (int)
+        self._lock    = threading.Lock()
+        self._entries = OrderedDict() # (method, market, args) -> (expiry, value)
+        self._cleared = 0             # Bumped by clear
+        self._counts  = dict()        # (method, market) -> number of invalidations covering it. market is None for the whole method
+        self._any     = dict()        # method -> number of invalidations of any of its results
+
+    def get(self, method, market, args = ()):
+        '''Looks up a cached result
+
+        :param method: The name of the API method
+        :type method: str
+        :param market: The market ID the call was for, or None
+        :type market: int
+        :param args: Any other arguments the result depends on
+        :type args: tuple
+        :rtype: (bool, object)
+        :return: A tuple of (hit, value). If hit is False, value is None
+
+        '''
+        key = (method, market, args)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                self.misses += 1
+                return (False, None)
+            self._entries[key] = entry
+            self.hits += 1
+            return (True, entry[1])
+
+    def generation(self, method, market):
+        '''Gets a token which changes whenever results of a call are invalidated
+
+        :param method: The name of the API method
+        :type method: str
+        :param market: The market ID the call is for, or None
+        :type market: int
+        :return: An opaque token to pass to :meth:`put`
+
+        '''
+        with self._lock:
+            return self._generation(method, market)
+
+    def put(self, method, market, args, value, generation = None):
+        '''Stores a result, if results of method are cacheable
+
+        :param method: The name of the API method
+        :type method: str
+        :param market: The market ID the call was for, or None
+        :type market: int
+        :param args: Any other arguments the result depends on
+        :type args: tuple
+        :param value: The result to cache
+        :param generation: (optional) The :meth:`generation` of the call taken before it was made. If the call's results
+                           have been invalidated since, value is not stored
+
+        '''
+        ttl = self.ttls.get(method)
+        if not ttl:
+            return
+        key = (method, market, args)
+        with self._lock:
+            if generation is not None and generation != self._generation(method, market):
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + ttl, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last = False)
+
+    def invalidate(self, method, market = None):
+        '''Drops cached results of a method
+
+        :param method: The name of the API method
+        :type method: str
+        :param market: (optional) Only drop results for this market, along with any results that cover all markets.
+                       If None, every result of the method is dropped
+        :type market: int
+
+        '''
+        with self._lock:
+            self._counts[(method, market)] = self._counts.get((method, market), 0) + 1
+            self._any[method] = self._any.get(method, 0) + 1
+            for key in list(self._entries):
+                if key[0] == method and (market is None or key[1] is None or key[1] == market):
+                    del self._entries[key]
+
+    def clear(self):
+        '''Drops every cached result
+
+        '''
+        with self._lock:
+            self._cleared += 1
+            self._entries.clear()
+
+    def _generation(self, method, market):
+        if market is None:
+            return (self._cleared, self._any.get(method, 0))
+        return (self._cleared, self._counts.get((method, None), 0), self._counts.get((method, market), 0))
+
+    def __len__(self):
+        return len(self._entries)
+
+class _Flight(object):
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done   = threading.Event()
+        self.result = None
+        self.error  = None
+
+class SingleFlight(object):
+    '''Coalesces identical concurrent calls, so that only one of them is actually made
+
+    While a call with a given key is in flight, later calls with the same key wait for it to finish and get its result,
+    or its exception, instead of making a request of their own. Keys are (method, market, args) tuples like those of
+    :class:`ResponseCache`.
+
+    '''
+    def __init__(self):
+        self.calls   = 0 #: The number of calls that were made (int)
+        self.saved   = 0 #: The number of calls that waited on an identical call in flight instead of being made (int)
+        self._lock    = threading.Lock()
+        self._flights = dict() # (method, market, args) -> _Flight
+
+    def do(self, key, function, *args, **kwargs):
+        '''Calls function, unless a call with the same key is already in flight, in which case that call's outcome is shared
+
+        :param key: The (method, market, args) key identifying the call
+        :type key: tuple
+        :param function: The function to call
+        :type function: callable
+        :return: The result of the call
+        :raise: Whatever exception the call raised
+
+        '''
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.saved += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function(*args, **kwargs)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def forget(self, method, market = None):
+        '''Stops later calls from joining the calls of a method already in flight, because their results may be stale.
+        Callers already waiting still get the in-flight result
+
+        :param method: The name of the API method
+        :type method: str
+        :param market: (optional) Only forget calls for this market, along with any calls that cover all markets.
+                       If None, every call of the method is forgotten
+        :type market: int
+
+        '''
+        with self._lock:
+            for key in list(self._flights):
+                if key[0] == method and (market is None or key[1] is None or key[1] == market):
+                    del self._flights[key]
+
+    @property
+    def in_flight(self):
+        '''The number of distinct calls currently in flight (int)
+
+        '''
+        return len(self._flights)
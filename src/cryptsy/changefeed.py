@@ -0,0 +1,117 @@
+'''
+.. module:: changefeed
+   :platform: Linux, Windows, OSX
+   :synopsis: Reports which markets changed between successive market data snapshots
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import time
+
+class MarketChange(object):
+    '''Describes how one market changed since the previous snapshot
+
+    :param label: The market label
+    :type label: str
+    :param market_data: The market's data in the new snapshot
+    :type market_data: :class:`~cryptsy.managed_api.MarketData`
+    :param new_trades: The trades in the new snapshot which were not seen before
+    :type new_trades: [:class:`~cryptsy.managed_api.MarketTradeData`, ...]
+    :param price_changed: True if the last trade price changed
+    :type price_changed: bool
+    :param volume_changed: True if the volume changed
+    :type volume_changed: bool
+    :param book_changed: True if the best buy or sell order changed
+    :type book_changed: bool
+
+    A market seen for the first time is reported with every flag set and all of its recent trades as new.
+
+    '''
+    __slots__ = ('label', 'market_data', 'new_trades', 'price_changed', 'volume_changed', 'book_changed')
+
+    def __init__(self, label, market_data, new_trades, price_changed, volume_changed, book_changed):
+        self.label          = label          #: The market label (str)
+        self.market_data    = market_data    #: The market's data in the new snapshot (:class:`~cryptsy.managed_api.MarketData`)
+        self.new_trades     = new_trades     #: Trades not seen in any earlier snapshot ([:class:`~cryptsy.managed_api.MarketTradeData`, ...])
+        self.price_changed  = price_changed  #: True if the last trade price changed (bool)
+        self.volume_changed = volume_changed #: True if the volume changed (bool)
+        self.book_changed   = book_changed   #: True if the best buy or sell order changed (bool)
+
+    def __str__(self):
+        return '{{label:{0}, new_trades:{1}, price_changed:{2}, volume_changed:{3}, book_changed:{4}}}'.format(self.label, len(self.new_trades),
+                                                                                                                self.price_changed, self.volume_changed,
+                                                                                                                self.book_changed)
+
+class MarketDataDiffer(object):
+    '''Compares successive all-markets snapshots, such as those returned by :meth:`cryptsy.managed_api.ManagedAPI.general_market_data`,
+    and reports only the markets that changed
+
+    Only a small summary of each market is kept between snapshots: its last trade price, volume, highest trade ID and the
+    best buy and sell orders. New trades are the ones with a trade ID above the highest one previously seen for the market.
+    The best orders are taken to be the first entry of each order list, which is how the API sorts them.
+
+    '''
+    def __init__(self):
+        self.listeners = [] #: Callables which are passed each :class:`MarketChange`
+        self._previous = dict() # label -> (last_trade_price, volume, last_trade_id, best_buy, best_sell)
+
+    def diff(self, snapshot):
+        '''Compares a snapshot against the previous one and remembers it for the next call
+
+        :param snapshot: Either a dict mapping market label to :class:`~cryptsy.managed_api.MarketData`, or an iterable of
+                         (label, :class:`~cryptsy.managed_api.MarketData`) pairs such as :meth:`~cryptsy.managed_api.ManagedAPI.iter_market_data` yields
+        :rtype: [:class:`MarketChange`, ...]
+        :return: A change for every market that differs from the previous snapshot
+
+        '''
+        items   = snapshot.iteritems() if isinstance(snapshot, dict) else snapshot
+        changes = []
+        for label, market_data in items:
+            summary  = self._summarize(market_data)
+            previous = self._previous.get(label)
+            self._previous[label] = summary
+            if previous == summary:
+                continue
+            if previous is None:
+                change = MarketChange(label, market_data, list(market_data.recent_trades), True, True, True)
+            else:
+                new_trades = [trade for trade in market_data.recent_trades if trade.trade_id > previous[2]]
+                change = MarketChange(label, market_data, new_trades,
+                                      summary[0] != previous[0],
+                                      summary[1] != previous[1],
+                                      summary[3:] != previous[3:])
+            changes.append(change)
+            for listener in self.listeners:
+                listener(change)
+        return changes
+
+    def _summarize(self, market_data):
+        trades = market_data.recent_trades
+        buys   = market_data.buy_orders
+        sells  = market_data.sell_orders
+        return (market_data.last_trade_price,
+                market_data.volume,
+                max(trade.trade_id for trade in trades) if trades else None,
+                (buys[0].price, buys[0].quantity) if buys else None,
+                (sells[0].price, sells[0].quantity) if sells else None)
+
+def market_changes(api, interval = 5.0, differ = None):
+    '''Polls the market data of all markets forever, yielding only the markets that changed
+
+    :param api: The API to poll
+    :type api: :class:`~cryptsy.managed_api.ManagedAPI`
+    :param interval: (optional) Seconds between polls
+    :type interval: float
+    :param differ: (optional) The differ to use. If None, a new :class:`MarketDataDiffer` is created
+    :type differ: :class:`MarketDataDiffer`
+    :rtype: generator of :class:`MarketChange`
+
+    '''
+    differ = differ if differ else MarketDataDiffer()
+    while True:
+        started = time.time()
+        for change in differ.diff(api.general_market_data()):
+            yield change
+        time.sleep(max(0.0, interval - (time.time() - started)))
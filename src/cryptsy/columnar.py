@@ -0,0 +1,160 @@
+'''
+.. module:: columnar
+   :platform: Linux, Windows, OSX
+   :synopsis: Column-oriented order books backed by NumPy arrays
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Requires NumPy, which is only needed if this module is used.
+
+'''
+from decoding import float_columns
+import numpy
+
+class BookSide(object):
+    '''One side of a :class:`ColumnarOrderBook`, held as contiguous float64 arrays sorted best price first
+
+    :param price: Price of each level
+    :type price: :class:`numpy.ndarray`
+    :param quantity: Quantity at each level, in input currency
+    :type quantity: :class:`numpy.ndarray`
+    :param total: Total value of each level, in output currency
+    :type total: :class:`numpy.ndarray`
+    :param descending: True for the buy side, where the best price is the highest one
+    :type descending: bool
+
+    '''
+    def __init__(self, price, quantity, total, descending):
+        order = numpy.argsort(-price if descending else price, kind = 'mergesort')
+        self.price      = numpy.ascontiguousarray(price[order])    #: Price of each level (:class:`numpy.ndarray` of float64)
+        self.quantity   = numpy.ascontiguousarray(quantity[order]) #: Quantity at each level (:class:`numpy.ndarray` of float64)
+        self.total      = numpy.ascontiguousarray(total[order])    #: Total value of each level (:class:`numpy.ndarray` of float64)
+        self.descending = descending #: True if prices are sorted highest first (bool)
+
+    def __len__(self):
+        return len(self.price)
+
+    @property
+    def best(self):
+        '''The (price, quantity) of the best level, or None if the side is empty
+
+        '''
+        if not len(self.price):
+            return None
+        return (self.price[0], self.quantity[0])
+
+    def cumulative_quantity(self):
+        '''
+        :rtype: :class:`numpy.ndarray`
+        :return: The total quantity available at each level or better
+
+        '''
+        return numpy.cumsum(self.quantity)
+
+    def cumulative_total(self):
+        '''
+        :rtype: :class:`numpy.ndarray`
+        :return: The total value available at each level or better
+
+        '''
+        return numpy.cumsum(self.total)
+
+    def top(self, n):
+        '''
+        :param n: The number of levels to keep
+        :type n: int
+        :rtype: :class:`BookSide`
+        :return: The best n levels of this side
+
+        '''
+        return self._slice(0, n)
+
+    def between(self, low, high):
+        '''
+        :param low: The lowest price to keep, inclusive
+        :type low: float
+        :param high: The highest price to keep, inclusive
+        :type high: float
+        :rtype: :class:`BookSide`
+        :return: The levels priced within [low, high]
+
+        '''
+        if self.descending:
+            start = numpy.searchsorted(-self.price, -high, side = 'left')
+            stop  = numpy.searchsorted(-self.price, -low, side = 'right')
+        else:
+            start = numpy.searchsorted(self.price, low, side = 'left')
+            stop  = numpy.searchsorted(self.price, high, side = 'right')
+        return self._slice(start, stop)
+
+    def _slice(self, start, stop):
+        side = BookSide.__new__(BookSide)
+        side.price      = self.price[start:stop]
+        side.quantity   = self.quantity[start:stop]
+        side.total      = self.total[start:stop]
+        side.descending = self.descending
+        return side
+
+class ColumnarOrderBook(object):
+    '''A column-oriented order book, built directly from API JSON without creating per-order objects
+
+    :param bids: The buy side, highest price first
+    :type bids: :class:`BookSide`
+    :param asks: The sell side, lowest price first
+    :type asks: :class:`BookSide`
+
+    Use :meth:`from_market_orders` or :meth:`from_depth` to build one from the data returned by
+    :func:`cryptsy.bare_api.market_orders` or :func:`cryptsy.bare_api.depth`.
+
+    '''
+    def __init__(self, bids, asks):
+        self.bids = bids #: The buy side of the book (:class:`BookSide`)
+        self.asks = asks #: The sell side of the book (:class:`BookSide`)
+
+    @classmethod
+    def from_market_orders(cls, data):
+        '''
+        :param data: The 'return' data of a :func:`cryptsy.bare_api.market_orders` call
+        :rtype: :class:`ColumnarOrderBook`
+        :raise: :exc:`ValueError` if the data is malformed
+
+        '''
+        try:
+            return cls(_orders_side(data['buyorders'], 'buyprice', True),
+                       _orders_side(data['sellorders'], 'sellprice', False))
+        except KeyError as e:
+            raise ValueError('Mallformed Market Order Data, missing field:'+str(e))
+
+    @classmethod
+    def from_depth(cls, data):
+        '''
+        :param data: The 'return' data of a :func:`cryptsy.bare_api.depth` call
+        :rtype: :class:`ColumnarOrderBook`
+        :raise: :exc:`ValueError` if the data is malformed
+
+        '''
+        try:
+            return cls(_depth_side(data['buy'], True), _depth_side(data['sell'], False))
+        except KeyError as e:
+            raise ValueError('Mallformed Depth Data, missing field:'+str(e))
+
+    @property
+    def spread(self):
+        '''The best ask price minus the best bid price, or None if either side is empty
+
+        '''
+        if not len(self.bids) or not len(self.asks):
+            return None
+        return self.asks.price[0] - self.bids.price[0]
+
+def _orders_side(entries, price_key, descending):
+    price, quantity, total = float_columns(entries, (price_key, 'quantity', 'total'), array = True)
+    return BookSide(price, quantity, total, descending)
+
+def _depth_side(levels, descending):
+    columns  = numpy.array(levels, dtype = numpy.float64).reshape(-1, 2)
+    price    = columns[:, 0]
+    quantity = columns[:, 1]
+    return BookSide(price, quantity, price*quantity, descending)
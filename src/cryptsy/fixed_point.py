@@ -0,0 +1,183 @@
+'''
+.. module:: fixed_point
+   :platform: Linux, Windows, OSX
+   :synopsis: Exact fixed-point integer representation of prices, quantities, totals and fees
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Amounts are held as integer counts of :data:`UNIT`, the smallest amount Cryptsy reports (1e-8, one satoshi for BTC). They
+are parsed straight from the decimal strings the API sends, so no float rounding ever enters. Sums and differences are
+plain integer arithmetic and always exact. Products and quotients are rounded back to whole units, half to even.
+
+Pass ``fixed_point = True`` to :class:`~cryptsy.managed_api.ManagedAPI` to have every price, quantity, total and fee in
+the containers it returns parsed this way. Int quantities and prices passed to its order and fee calls are then taken as
+units too, and sent as :func:`to_string` gives them.
+
+'''
+from decoding import number_columns
+from decimal import Decimal
+
+DIGITS = 8            #: Decimal places held
+SCALE  = 10**DIGITS   #: Units per whole coin (int)
+UNIT   = 1.0/SCALE    #: The value of one unit (float)
+
+def parse(value):
+    '''Parses an API number into units
+
+    :param value: The number, normally a decimal string such as '0.00041230'. ints are taken as whole coins, and floats
+                  are taken at their shortest decimal representation
+    :type value: str, int, float or :class:`decimal.Decimal`
+    :rtype: int
+    :return: The number of units, with any digits past :data:`DIGITS` rounded half to even
+    :raise: :exc:`ValueError` if value is not a number
+
+    '''
+    if isinstance(value, (int, long)):
+        return value*SCALE
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, Decimal):
+        return _parse_decimal(value)
+    elif not isinstance(value, basestring):
+        raise ValueError('Not a number: '+repr(value))
+    text     = value.strip()
+    negative = text[:1] == '-'
+    if text[:1] in ('-', '+'):
+        text = text[1:]
+    whole, _, fraction = text.partition('.')
+    digits = whole + fraction
+    if not digits.isdigit():
+        return _parse_decimal(value)
+    units = int(digits)
+    if len(fraction) <= DIGITS:
+        units *= 10**(DIGITS - len(fraction))
+    else:
+        units = _divide(units, 10**(len(fraction) - DIGITS))
+    return -units if negative else units
+
+def _parse_decimal(value):
+    try:
+        number = Decimal(value)
+    except Exception:
+        raise ValueError('Not a number: '+repr(value))
+    if not number.is_finite():
+        raise ValueError('Not a finite number: '+repr(value))
+    return int(number.scaleb(DIGITS).to_integral_value())
+
+def _divide(numerator, denominator):
+    '''Integer division rounded half to even. The denominator must be positive
+
+    '''
+    quotient, remainder = divmod(numerator, denominator)
+    if 2*remainder > denominator or (2*remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+def to_string(units):
+    '''
+    :param units: An amount in units
+    :type units: int
+    :rtype: str
+    :return: The amount as a decimal string with :data:`DIGITS` places, in the form the API accepts
+
+    '''
+    sign  = '-' if units < 0 else ''
+    whole, fraction = divmod(abs(units), SCALE)
+    return '{0}{1}.{2:0{3}d}'.format(sign, whole, fraction, DIGITS)
+
+def to_float(units):
+    '''
+    :param units: An amount in units
+    :type units: int
+    :rtype: float
+    :return: The nearest float to the amount
+
+    '''
+    return units/float(SCALE)
+
+def to_decimal(units):
+    '''
+    :param units: An amount in units
+    :type units: int
+    :rtype: :class:`decimal.Decimal`
+    :return: The exact amount
+
+    '''
+    return Decimal(units).scaleb(-DIGITS)
+
+def multiply(units, factor):
+    '''Multiplies two amounts, such as a price and a quantity to get a total
+
+    :param units: An amount in units
+    :type units: int
+    :param factor: Another amount in units
+    :type factor: int
+    :rtype: int
+    :return: The product in units, rounded half to even
+
+    '''
+    return _divide(units*factor, SCALE)
+
+def divide(units, divisor):
+    '''Divides one amount by another, such as a total by a quantity to get a price
+
+    :param units: The dividend in units
+    :type units: int
+    :param divisor: The divisor in units
+    :type divisor: int
+    :rtype: int
+    :return: The quotient in units, rounded half to even
+    :raise: :exc:`ZeroDivisionError` if divisor is 0
+
+    '''
+    if divisor < 0:
+        units, divisor = -units, -divisor
+    return _divide(units*SCALE, divisor)
+
+def fee(total, rate):
+    '''Works out the fee on an amount
+
+    :param total: The amount the fee is charged on, in units
+    :type total: int
+    :param rate: The fee rate as a fraction in units, so 0.25% is parse('0.0025')
+    :type rate: int
+    :rtype: int
+    :return: The fee in units, rounded half to even
+
+    '''
+    return multiply(total, rate)
+
+def columns(entries, fields, array = False):
+    '''Parses numeric fields of a list of JSON objects into units, one whole column per field
+
+    :param entries: The decoded JSON objects
+    :type entries: [dict, ...]
+    :param fields: The names of the fields to parse
+    :type fields: (str, ...)
+    :param array: (optional) If True, each column is returned as a :class:`numpy.ndarray` of int64, which needs NumPy
+    :type array: bool
+    :rtype: tuple
+    :return: One list (or array) of units per field, in the order of fields
+    :raise: :exc:`KeyError` if an entry is missing a field, :exc:`ValueError` if a value is not numeric
+
+    int64 arrays hold amounts up to about 92 billion coins. Sums of larger amounts should be taken over the lists, which
+    use Python's unbounded integers.
+
+    '''
+    parsed = number_columns(entries, fields, parse)
+    if array:
+        return tuple(to_array(column) for column in parsed)
+    return parsed
+
+def to_array(units):
+    '''
+    :param units: Amounts in units
+    :type units: [int, ...]
+    :rtype: :class:`numpy.ndarray`
+    :return: The amounts as an int64 array, which needs NumPy
+
+    '''
+    import numpy
+    return numpy.array(units, dtype = numpy.int64)
@@ -0,0 +1,171 @@
+'''
+.. module:: history
+   :platform: Linux, Windows, OSX
+   :synopsis: Incremental, persisted sync of the user's trade and transaction history
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+from managed_api import UserTradeData, TransactionData
+import sqlite3, threading
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trades (
+    tradeid            INTEGER PRIMARY KEY,
+    tradetype          TEXT,
+    datetime           TEXT,
+    marketid           INTEGER,
+    order_id           INTEGER,
+    fee                {amount},
+    initiate_ordertype TEXT,
+    total              {amount},
+    tradeprice         {amount},
+    quantity           {amount}
+);
+CREATE INDEX IF NOT EXISTS trades_by_market ON trades (marketid, datetime);
+CREATE TABLE IF NOT EXISTS transactions (
+    trxid     TEXT PRIMARY KEY,
+    timestamp INTEGER,
+    datetime  TEXT,
+    currency  TEXT,
+    amount    {amount},
+    fee       {amount},
+    address   TEXT,
+    timezone  TEXT,
+    type      TEXT
+);
+CREATE INDEX IF NOT EXISTS transactions_by_time ON transactions (timestamp);
+'''
+
+_FLOAT = 1 # user_version of a database storing amounts as floats
+_FIXED = 2 # user_version of a database storing amounts as fixed-point integer units
+
+class HistorySync(object):
+    '''Keeps a local SQLite copy of the user's trade and transaction history, fetching only what is new on each sync
+
+    :param api: The API to sync from
+    :type api: :class:`~cryptsy.managed_api.ManagedAPI`
+    :param path: The SQLite database file to store the history in
+    :type path: str
+    :raise: :exc:`ValueError` if the database was created by an API with a different :attr:`~cryptsy.managed_api.ManagedAPI.fixed_point` setting
+
+    The high-water marks are the highest stored trade ID and the latest stored transaction timestamp. Each sync only parses
+    the records past those marks, so a reconciliation job can sync every minute without re-parsing the full history.
+    Records already stored are never returned twice.
+
+    If the API uses fixed-point amounts, they are stored as INTEGER columns, so they are read back exactly. Transaction
+    timestamps are stored as the unix time the server gave.
+
+    '''
+    def __init__(self, api, path):
+        self.api   = api #: The :class:`~cryptsy.managed_api.ManagedAPI` synced from
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread = False)
+        self._db.row_factory = sqlite3.Row
+        mode   = _FIXED if api.fixed_point else _FLOAT
+        stored = self._scalar('PRAGMA user_version')
+        if not stored and self._scalar("SELECT COUNT(*) FROM sqlite_master WHERE name = 'trades'"):
+            stored = _FLOAT
+        if stored and stored != mode:
+            self._db.close()
+            raise ValueError('History in '+str(path)+(' uses' if stored == _FIXED else ' does not use')+' fixed-point amounts')
+        self._db.executescript(_SCHEMA.format(amount = 'INTEGER' if mode == _FIXED else 'REAL'))
+        self._db.execute('PRAGMA user_version = {0}'.format(mode))
+        self._number = int if mode == _FIXED else float
+
+    def close(self):
+        self._db.close()
+
+    def sync_trades(self, timeout = None):
+        '''Fetches and stores the user's trades that are newer than the stored ones
+
+        :param timeout: Timeout for the request in seconds
+        :rtype: [:class:`~cryptsy.managed_api.UserTradeData`, ...]
+        :return: The newly stored trades
+        :raise: :exc:`~cryptsy.managed_api.APIError` if there was a problem with the API call
+
+        '''
+        mark   = self._scalar('SELECT MAX(tradeid) FROM trades')
+        trades = list(self.api.my_trades(timeout = timeout, after = mark))
+        rows   = [(trade.trade_id, trade.tradetype, trade.datetime, trade.market_id, trade.order_id, trade.fee,
+                   trade.init_ordertype, trade.total, trade.trade_price, trade.quantity) for trade in trades]
+        return self._store('INSERT OR IGNORE INTO trades VALUES (?,?,?,?,?,?,?,?,?,?)', trades, rows)
+
+    def sync_transactions(self, timeout = None):
+        '''Fetches and stores the user's deposits and withdrawals that are newer than the stored ones
+
+        :param timeout: Timeout for the request in seconds
+        :rtype: [:class:`~cryptsy.managed_api.TransactionData`, ...]
+        :return: The newly stored transactions
+        :raise: :exc:`~cryptsy.managed_api.APIError` if there was a problem with the API call
+
+        '''
+        mark         = self._scalar('SELECT MAX(timestamp) FROM transactions')
+        transactions = list(self.api.get_transactions(timeout = timeout, since = mark))
+        rows         = [(transaction.trxid, transaction.unix_time, transaction.datetime, transaction.currency,
+                         transaction.amount, transaction.fee, transaction.address, transaction.timezone, transaction.ttype)
+                        for transaction in transactions]
+        return self._store('INSERT OR IGNORE INTO transactions VALUES (?,?,?,?,?,?,?,?,?)', transactions, rows)
+
+    def trades(self, market = None, start = None, end = None):
+        '''Queries the stored trades
+
+        :param market: (optional) Only return trades on this market ID
+        :type market: int
+        :param start: (optional) Only return trades at or after this time, in the API's 'YYYY-MM-DD HH:MM:SS' form
+        :type start: str
+        :param end: (optional) Only return trades before this time, in the API's 'YYYY-MM-DD HH:MM:SS' form
+        :type end: str
+        :rtype: [:class:`~cryptsy.managed_api.UserTradeData`, ...]
+        :return: The matching trades, oldest first
+
+        '''
+        where, args = self._filters((('marketid = ?', market), ('datetime >= ?', start), ('datetime < ?', end)))
+        rows = self._query('SELECT * FROM trades' + where + ' ORDER BY tradeid', args)
+        return [UserTradeData(dict(zip(row.keys(), row)), self._number) for row in rows]
+
+    def transactions(self, currency = None, start = None, end = None):
+        '''Queries the stored deposits and withdrawals
+
+        :param currency: (optional) Only return transactions in this currency
+        :type currency: str
+        :param start: (optional) Only return transactions at or after this unix timestamp
+        :type start: int
+        :param end: (optional) Only return transactions before this unix timestamp
+        :type end: int
+        :rtype: [:class:`~cryptsy.managed_api.TransactionData`, ...]
+        :return: The matching transactions, oldest first
+
+        '''
+        where, args = self._filters((('currency = ?', currency), ('timestamp >= ?', start), ('timestamp < ?', end)))
+        rows = self._query('SELECT * FROM transactions' + where + ' ORDER BY timestamp', args)
+        return [TransactionData(dict(zip(row.keys(), row)), self._number) for row in rows]
+
+    def _store(self, sql, records, rows):
+        '''Inserts the rows of fetched records in one transaction. The fetch is made before the lock is taken, so queries
+        and other syncs never wait on the network
+
+        :return: The records whose rows were not already stored
+
+        '''
+        added = []
+        with self._lock, self._db:
+            for record, row in zip(records, rows):
+                if self._db.execute(sql, row).rowcount:
+                    added.append(record)
+        return added
+
+    def _filters(self, filters):
+        clauses = [clause for clause, value in filters if value is not None]
+        args    = [value for clause, value in filters if value is not None]
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else '', args)
+
+    def _query(self, sql, args):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def _scalar(self, sql):
+        with self._lock:
+            return self._db.execute(sql).fetchone()[0]
@@ -0,0 +1,261 @@
+'''
+.. module:: instrumentation
+   :platform: Linux, Windows, OSX
+   :synopsis: Per-call timing hooks for API calls, with a latency histogram aggregator
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Register an observer to have every :mod:`cryptsy.bare_api` and :class:`~cryptsy.managed_api.ManagedAPI` call reported to it::
+
+    histogram = LatencyHistogram()
+    add_observer(histogram)
+    ...
+    histogram.dump()
+
+A :class:`~cryptsy.managed_api.ManagedAPI` call is reported once, under the name of the method, with the phases of the
+underlying :mod:`cryptsy.bare_api` call included. While no observer is registered nothing is timed.
+
+'''
+from collections import defaultdict
+import math, socket, sys, threading, time, urllib2
+
+THROTTLE = 'throttle' #: Time spent waiting on the rate limiter
+CONNECT  = 'connect'  #: Time spent opening a new connection, including the TLS handshake
+WAIT     = 'wait'     #: Time from sending the request until the response headers arrived
+DOWNLOAD = 'download' #: Time spent reading the response body
+DECODE   = 'decode'   #: Time spent decoding the JSON response
+BUILD    = 'build'    #: Time spent building the returned objects, and anything else not covered by another phase
+PHASES   = (THROTTLE, CONNECT, WAIT, DOWNLOAD, DECODE, BUILD) #: Every phase, in the order they happen
+
+SUCCESS   = 'success'   #: The call succeeded
+API_ERROR = 'api_error' #: The API reported an error
+TIMEOUT   = 'timeout'   #: The call timed out
+FAILURE   = 'failure'   #: The call failed for any other reason, such as a connection or HTTP error
+
+observers = [] #: Callables which are passed the :class:`CallRecord` of every call made while they are registered
+
+_local = threading.local()
+
+class CallRecord(object):
+    '''The measurements of one API call
+
+    :param method: The name of the call
+    :type method: str
+
+    '''
+    __slots__ = ('method', 'phases', 'total', 'response_bytes', 'objects', 'outcome', 'error', 'cached', '_started')
+
+    def __init__(self, method):
+        self.method         = method #: The :class:`~cryptsy.managed_api.ManagedAPI` method or API method name (str)
+        self.phases         = dict() #: Seconds spent in each phase that the call went through (dict(str, float))
+        self.total          = 0.0    #: Seconds the call took in total (float)
+        self.response_bytes = None   #: Size of the response body, or None if it was streamed or never received (int)
+        self.objects        = None   #: The number of values in the returned result, or None for a bare API call (int)
+        self.outcome        = None   #: :data:`SUCCESS`, :data:`API_ERROR`, :data:`TIMEOUT` or :data:`FAILURE`
+        self.error          = None   #: The exception the call raised, if any
+        self.cached         = False  #: True if the result was served from the response cache (bool)
+        self._started       = time.time()
+
+    def add(self, phase, seconds):
+        '''Adds time to a phase
+
+        :param phase: One of :data:`PHASES`
+        :type phase: str
+        :param seconds: The time to add
+        :type seconds: float
+
+        '''
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def __str__(self):
+        phases = ', '.join('{0}:{1:.6f}'.format(phase, self.phases[phase]) for phase in PHASES if phase in self.phases)
+        return '{{method:{0}, outcome:{1}, total:{2:.6f}, {3}, bytes:{4}, objects:{5}}}'.format(self.method, self.outcome, self.total,
+                                                                                               phases, self.response_bytes, self.objects)
+
+def add_observer(observer):
+    '''Registers a callable to be passed the :class:`CallRecord` of every call
+
+    '''
+    observers.append(observer)
+
+def remove_observer(observer):
+    '''Unregisters an observer added by :func:`add_observer`
+
+    '''
+    observers.remove(observer)
+
+def current():
+    '''
+    :rtype: :class:`CallRecord`
+    :return: The record of the call being timed on this thread, or None if no call is being timed
+
+    '''
+    if not observers:
+        return None
+    return getattr(_local, 'record', None)
+
+def begin(method):
+    '''Starts timing a call on this thread, unless a call is already being timed
+
+    :param method: The name to report the call under
+    :type method: str
+    :rtype: :class:`CallRecord`
+    :return: The new record, which must be passed to :func:`finish`, or None if no observer is registered or an enclosing call is already being timed
+
+    '''
+    if not observers or getattr(_local, 'record', None) is not None:
+        return None
+    record = _local.record = CallRecord(method)
+    return record
+
+def finish(record, outcome, error = None):
+    '''Stops timing a call started by :func:`begin` and reports it to the observers. Time not attributed to another phase is added to :data:`BUILD`
+
+    :param record: The record returned by :func:`begin`
+    :type record: :class:`CallRecord`
+    :param outcome: :data:`SUCCESS`, :data:`API_ERROR`, :data:`TIMEOUT` or :data:`FAILURE`
+    :type outcome: str
+    :param error: (optional) The exception the call raised
+
+    '''
+    _local.record  = None
+    record.total   = time.time() - record._started
+    record.outcome = outcome
+    record.error   = error
+    record.phases[BUILD] = max(0.0, record.total - sum(seconds for phase, seconds in record.phases.iteritems() if phase != BUILD))
+    for observer in list(observers):
+        observer(record)
+
+def outcome_of(error):
+    '''
+    :param error: An exception raised by a call
+    :rtype: str
+    :return: :data:`TIMEOUT` if the error was a timeout, otherwise :data:`FAILURE`
+
+    '''
+    if isinstance(error, socket.timeout):
+        return TIMEOUT
+    if isinstance(error, urllib2.URLError) and isinstance(getattr(error, 'reason', None), socket.timeout):
+        return TIMEOUT
+    return FAILURE
+
+class LatencyHistogram(object):
+    '''An observer which aggregates call latencies per method and phase into log-scale histograms
+
+    :param resolution: (optional) The relative width of each bucket. Percentiles are accurate to within this fraction
+    :type resolution: float
+
+    Memory use is bounded by the number of buckets, not the number of calls. Calls served from the response cache are
+    counted but kept out of the latencies.
+
+    '''
+    _FLOOR = 1e-6
+
+    def __init__(self, resolution = 0.05):
+        self.resolution = resolution #: The relative width of each bucket (float)
+        self._log_base  = math.log(1 + resolution)
+        self._lock      = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        '''Discards everything recorded so far
+
+        '''
+        with self._lock:
+            self._buckets  = defaultdict(lambda: defaultdict(int)) # (method, phase) -> bucket -> count
+            self._counts   = defaultdict(int)                      # (method, phase) -> count
+            self._maxima   = defaultdict(float)                    # (method, phase) -> longest time
+            self._outcomes = defaultdict(lambda: defaultdict(int)) # method -> outcome -> count
+            self._bytes    = defaultdict(int)                      # method -> response bytes
+
+    def __call__(self, record):
+        with self._lock:
+            outcome = 'cached' if record.cached else record.outcome
+            self._outcomes[record.method][outcome] += 1
+            if record.cached:
+                return
+            if record.response_bytes:
+                self._bytes[record.method] += record.response_bytes
+            self._add(record.method, 'total', record.total)
+            for phase, seconds in record.phases.iteritems():
+                self._add(record.method, phase, seconds)
+
+    def _add(self, method, phase, seconds):
+        key = (method, phase)
+        self._buckets[key][self._bucket(seconds)] += 1
+        self._counts[key] += 1
+        self._maxima[key]  = max(self._maxima[key], seconds)
+
+    def _bucket(self, seconds):
+        if seconds <= self._FLOOR:
+            return 0
+        return int(math.log(seconds/self._FLOOR)/self._log_base) + 1
+
+    def percentile(self, method, percent, phase = 'total'):
+        '''
+        :param method: The method to look up
+        :type method: str
+        :param percent: The percentile to compute, from 0 to 100
+        :type percent: float
+        :param phase: (optional) One of :data:`PHASES`, or 'total' for the whole call
+        :type phase: str
+        :rtype: float
+        :return: The latency in seconds which that percentage of calls finished within, or None if nothing was recorded
+
+        '''
+        with self._lock:
+            return self._percentile((method, phase), percent)
+
+    def _percentile(self, key, percent):
+        count = self._counts.get(key)
+        if not count:
+            return None
+        rank = percent/100.0*count
+        seen = 0
+        for bucket, hits in sorted(self._buckets[key].iteritems()):
+            seen += hits
+            if seen >= rank:
+                return min(self._maxima[key], self._FLOOR*(1 + self.resolution)**bucket)
+        return self._maxima[key]
+
+    def summary(self):
+        '''
+        :rtype: dict(str, dict)
+        :return: Maps each method to a dict holding its 'outcomes' counts, its 'bytes' received, and for 'total' and each
+                 phase a dict of 'count', 'p50', 'p95', 'p99' and 'max' in seconds
+
+        '''
+        with self._lock:
+            summary = dict()
+            for method, outcomes in self._outcomes.iteritems():
+                summary[method] = {'outcomes' : dict(outcomes), 'bytes' : self._bytes.get(method, 0)}
+            for (method, phase), count in self._counts.iteritems():
+                key = (method, phase)
+                summary[method][phase] = {'count' : count,
+                                          'p50'   : self._percentile(key, 50),
+                                          'p95'   : self._percentile(key, 95),
+                                          'p99'   : self._percentile(key, 99),
+                                          'max'   : self._maxima[key]}
+            return summary
+
+    def dump(self, stream = None):
+        '''Writes a table of the latency percentiles of every method and phase, in milliseconds
+
+        :param stream: (optional) The file to write to. Defaults to stdout
+        :type stream: file
+
+        '''
+        stream = stream if stream else sys.stdout
+        stream.write('{0:<24} {1:<9} {2:>8} {3:>10} {4:>10} {5:>10} {6:>10}\n'.format('method', 'phase', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+        for method, stats in sorted(self.summary().iteritems()):
+            for phase in ('total',) + PHASES:
+                if phase not in stats:
+                    continue
+                row = stats[phase]
+                stream.write('{0:<24} {1:<9} {2:>8} {3:>10.3f} {4:>10.3f} {5:>10.3f} {6:>10.3f}\n'.format(method, phase, row['count'],
+                                                                                                       row['p50']*1000, row['p95']*1000,
+                                                                                                       row['p99']*1000, row['max']*1000))
+            outcomes = ', '.join('{0}:{1}'.format(outcome, count) for outcome, count in sorted(stats['outcomes'].iteritems()))
+            stream.write('{0:<24} outcomes  {1}, bytes:{2}\n'.format(method, outcomes, stats['bytes']))
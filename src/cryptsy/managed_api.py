@@ -9,7 +9,19 @@ Copyright (c) 2014 Adam Panzica
 from bare_api import general_market_data, general_orderbook_data, get_info, get_markets,\
     get_transactions, market_trades, market_orders, my_trades, my_orders, depth,\
     create_order, cancel_order, calculate_fees, generate_new_address
+from transport import ConnectionPool
+from nonce import NonceGenerator
+from signing import Signer
+from decoding import number_columns
+from fixed_point import parse as parse_fixed_point, to_string as fixed_point_string
+from cache import ResponseCache, SingleFlight
+from streaming import iter_items
+from rate_limit import shared_limiter, PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_POLL
+import instrumentation
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from operator import itemgetter
+import functools, inspect, time
     
 class APIError(Exception):
     '''Represents an error with an API call
@@ -46,21 +58,39 @@ class CallResult(object):
     def __str__(self):
         return 'success:{0}, error:{1}, data:{2}'.format(self.success, self.error, self.data)
 
-class TransactionData(object):
+class _Record(object):
+    '''Base class for the high-volume container classes. Subclasses list their attributes in ``__slots__`` so that instances
+    carry no per-instance ``__dict__``
+    
+    '''
+    __slots__ = ()
+    
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+    
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+class TransactionData(_Record):
     '''A container object for representing the data in a cryptsy transaction
     
     :param data: JSON data in the format returned by cryptsy's transaction api's (such as the dicts contained in the list returned by :func:`cryptsy.bare_api.get_transactions`)
+    :param number: (optional) The function numeric fields are parsed with. Pass :func:`cryptsy.fixed_point.parse` for exact integer units
     :raise: :exc:`ValueError` if the data is malformed
     
     '''
-    def __init__(self, data):
+    __slots__ = ('trxid', 'fee', 'unix_time', 'timestamp', 'datetime', 'currency', 'amount', 'address', 'timezone', 'ttype')
+    
+    def __init__(self, data, number = float):
         try:
             self.trxid     = data['trxid']          #: Transaction ID of this transaction. For everything that is not a cryptsy points transaction, this will be a string of hex values
-            self.fee       = float(data['fee'])     #: The fee from this transaction (:class:`float`)
-            self.timestamp = datetime.fromtimestamp(int(data['timestamp'])) #: A :class:`~datetime.Datetime` representing when the transaction occurred
+            self.fee       = number(data['fee'])     #: The fee from this transaction (:class:`float`)
+            self.unix_time = int(data['timestamp']) #: The unix time the server gave for the transaction (:class:`int`)
+            self.timestamp = datetime.fromtimestamp(self.unix_time) #: A local :class:`~datetime.Datetime` representing when the transaction occurred
             self.datetime  = data['datetime']                               #: String representation of the value in :attr:`timestamp`
             self.currency  = data['currency']       #: The name of the source currency from this transaction
-            self.amount    = float(data['amount'])  #: The amount of currency transacted (:class:`float`)
+            self.amount    = number(data['amount'])  #: The amount of currency transacted (:class:`float`)
             self.address   = data['address']        #: String wallet address where the funds were deposited
             self.timezone  = data['timezone']       #: String timezone that the date values are in
             self.ttype     = data['type']           #: Will be either 'Deposit' or 'Withdrawal'
@@ -91,42 +121,75 @@ class TransactionData(object):
         return '{{trxid:{0}, fee:{1}, timestamp:{2}, datetime:{3}, currency:{4}, amount:{5}, address:{6}, timezone:{7}, type:{8}}}'.format(self.trxid, self.fee, self.timestamp,
                                                                                                                                            self.datetime, self.currency, self.amount,
                                                                                                                                            self.address, self.timezone, self.ttype)
-class MarketOrderData(object):
+class MarketOrderData(_Record):
     '''Container for the short-form order data returned from calls like :func:`cryptsy.bare_api.general_market_data`
     
     :param data: JSON formatted data to parse
+    :param number: (optional) The function numeric fields are parsed with. Pass :func:`cryptsy.fixed_point.parse` for exact integer units
     :raise: :exc:`ValueError` if the data is malformed   
     
     '''
-    def __init__(self, data):
+    __slots__ = ('price', 'total', 'quantity')
+    
+    def __init__(self, data, number = float):
         try:
             if data.has_key('price'):
-                self.price    = float(data['price'])
+                self.price    = number(data['price'])
             elif data.has_key('sellprice'):
-                self.price    = float(data['sellprice'])
+                self.price    = number(data['sellprice'])
             else:
-                self.price    = float(data['buyprice'])
+                self.price    = number(data['buyprice'])
                 
-            self.total    = float(data['total'])
-            self.quantity = float(data['quantity'])
+            self.total    = number(data['total'])
+            self.quantity = number(data['quantity'])
         except KeyError as e:
             raise ValueError('Mallformed Market Order Data, missing field:'+str(e))
     
+    @classmethod
+    def build_many(cls, entries, number = float):
+        '''Builds the orders for a list of JSON entries, converting each numeric field a whole column at a time
+        
+        :param entries: The JSON entries to parse, all in the same form
+        :param number: (optional) The function numeric fields are parsed with
+        :rtype: [:class:`MarketOrderData`, ...]
+        :raise: :exc:`ValueError` if the data is malformed
+        
+        '''
+        if not entries:
+            return []
+        first = entries[0]
+        key   = 'price' if 'price' in first else 'sellprice' if 'sellprice' in first else 'buyprice'
+        try:
+            prices, totals, quantities = number_columns(entries, (key, 'total', 'quantity'), number)
+        except KeyError:
+            return [cls(entry, number) for entry in entries]
+        new    = cls.__new__
+        orders = []
+        for price, total, quantity in zip(prices, totals, quantities):
+            order = new(cls)
+            order.price    = price
+            order.total    = total
+            order.quantity = quantity
+            orders.append(order)
+        return orders
+    
     def __str__(self):
         return '{{price:{0}, total:{1}, quantity:{2}}}'.format(self.price, self.total, self.quantity)
             
         
-class UserOrderData(object):
+class UserOrderData(_Record):
     
-    def __init__(self, data):
+    __slots__ = ('order_id', 'created', 'order_type', 'price', 'quantity', 'total', 'orig_quantity')
+    
+    def __init__(self, data, number = float):
         try:
-            self.oder_id       = int(data['order_id'])          #: The unique order id of this order (int)
+            self.order_id      = int(data['order_id'])          #: The unique order id of this order (int)
             self.created       = data['created']                #: When the order was opened (str)
             self.order_type    = data['ordertype']              #: The type of order, either 'Buy' or 'Sell' (str)
-            self.price         = float(data['price'])           #: The trade price of the order (float)
-            self.quantity      = float(data['quantity'])        #: The remaining un-traded quantity on an open order, in input currency (float)
-            self.total         = float(data['total'])           #: The total value of the order = :attr:`orig_quantity`*:attr:`price`, in output currency (float) 
-            self.orig_quantity = float(data['orig_quantity'])   #: The original quantity of the order, in input currency (float)
+            self.price         = number(data['price'])           #: The trade price of the order (float)
+            self.quantity      = number(data['quantity'])        #: The remaining un-traded quantity on an open order, in input currency (float)
+            self.total         = number(data['total'])           #: The total value of the order = :attr:`orig_quantity`*:attr:`price`, in output currency (float) 
+            self.orig_quantity = number(data['orig_quantity'])   #: The original quantity of the order, in input currency (float)
         except KeyError as e:
             raise ValueError('Mallformed Order Data, missing field:'+str(e))
         
@@ -155,50 +218,124 @@ class UserOrderData(object):
                                                                                                                             self.price, self.quantity, self.total,
                                                                                                                             self.orig_quantity)
 
-class MarketTradeData(object):
+class MarketTradeData(_Record):
     '''Object for containing the truncated trade data returned in places like :func:`cryptsy.bare_api.general_market_data` 
     
     :param data: JSON formatted entry to parse
+    :param number: (optional) The function numeric fields are parsed with. Pass :func:`cryptsy.fixed_point.parse` for exact integer units
     :raise: :exc:`ValueError` if the data is malformed  
     
     '''
     
-    def __init__(self, data):
+    __slots__ = ('total', 'price', 'quantity', 'trade_id', 'time')
+    
+    def __init__(self, data, number = float):
         try:
-            self.total    = float(data['total'])    #: The total value of the trade, in output currency (float)
-            self.price    = float(data['price'])    #: The price of the trade (float)
-            self.quantity = float(data['quantity']) #: The quantity traded, in input currency (float)
+            self.total    = number(data['total'])    #: The total value of the trade, in output currency (float)
+            self.price    = number(data['price'])    #: The price of the trade (float)
+            self.quantity = number(data['quantity']) #: The quantity traded, in input currency (float)
             self.trade_id = int(data['id'])         #: The unique trade id of the trade (int)
             self.time     = data['time']            #: The time the trade occured (str)
         except KeyError as e:
             raise ValueError('Mallformed Market Trade Data, missing field:'+str(e))
+    
+    @classmethod
+    def build_many(cls, entries, number = float):
+        '''Builds the trades for a list of JSON entries, converting each numeric field a whole column at a time
+        
+        :param entries: The JSON entries to parse
+        :param number: (optional) The function numeric fields are parsed with
+        :rtype: [:class:`MarketTradeData`, ...]
+        :raise: :exc:`ValueError` if the data is malformed
+        
+        '''
+        if not entries:
+            return []
+        try:
+            totals, prices, quantities = number_columns(entries, ('total', 'price', 'quantity'), number)
+            ids   = map(int, map(itemgetter('id'), entries))
+            times = map(itemgetter('time'), entries)
+        except KeyError:
+            return [cls(entry, number) for entry in entries]
+        new    = cls.__new__
+        trades = []
+        for total, price, quantity, trade_id, time in zip(totals, prices, quantities, ids, times):
+            trade = new(cls)
+            trade.total    = total
+            trade.price    = price
+            trade.quantity = quantity
+            trade.trade_id = trade_id
+            trade.time     = time
+            trades.append(trade)
+        return trades
         
     
     def __str__(self):
         return '{{total:{0}, price:{1}, quantity:{2}, trade_id:{3}, time:{4}}}'.format(self.total, self.price, self.quantity,
                                                                                        self.trade_id, self.time)
         
+_BUILT = object() # Marks a raw attribute already replaced by its built list
+
+class _LazyList(object):
+    '''Descriptor which builds a list of container objects from raw JSON entries the first time it is read, then replaces
+    itself on the instance with the built list
+    
+    Instances may be shared between threads through the cache, so the first read is idempotent: threads racing on it may
+    each build the list, but all of them return the one stored first.
+    
+    :param name: The attribute name the descriptor is bound to
+    :type name: str
+    :param raw_name: The attribute holding the raw JSON entries
+    :type raw_name: str
+    :param container: The container class to build the entries with, which must provide a ``build_many`` classmethod
+    
+    '''
+    def __init__(self, name, raw_name, container):
+        self.name      = name
+        self.raw_name  = raw_name
+        self.container = container
+        
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        attributes = instance.__dict__
+        raw = attributes.get(self.raw_name, _BUILT)
+        if raw is _BUILT:
+            return attributes[self.name] # Another thread built it, storing it before dropping the raw entries
+        value = attributes.setdefault(self.name, self.container.build_many(raw, instance._number))
+        attributes.pop(self.raw_name, None)
+        return value
+
 class MarketData(object):
     '''Container for holding the market data returned by API calls such as :func:`cryptsy.bare_api.general_market_data`
     
     :param data: JSON formatted entry to parse
+    :param number: (optional) The function numeric fields are parsed with. Pass :func:`cryptsy.fixed_point.parse` for exact integer units
     :raise: :exc:`ValueError` if the data is malformed 
     
+    :attr:`recent_trades`, :attr:`sell_orders` and :attr:`buy_orders` are kept as raw JSON and only parsed the first time
+    they are read, so a malformed trade or order entry raises :exc:`ValueError` on that first read.
+    
     '''
-    def __init__(self, data):
+    recent_trades = _LazyList('recent_trades', '_recent_trades', MarketTradeData) #: List of recent trades ([class:`MarketTradeData`, ...])
+    sell_orders   = _LazyList('sell_orders', '_sell_orders', MarketOrderData)     #: List of open sell orders ([:class:`MarketOrderData`, ...])
+    buy_orders    = _LazyList('buy_orders', '_buy_orders', MarketOrderData)       #: List of open buy orders ([:class:`MarketOrderData`, ...])
+    
+    def __init__(self, data, number = float):
         try:
             self.market_id        = int(data['marketid'])  #: The market ID (int)
-            self.volume           = float(data['volume'])   #: The market trade volume (float)
-            self.recent_trades    = [MarketTradeData(entry) for entry in data['recenttrades']]  #: List of recent trades ([class:`MarketTradeData`, ...])
+            self.volume           = number(data['volume'])   #: The market trade volume (float)
+            self._recent_trades   = data['recenttrades']
             self.last_trade_time  = data['lasttradetime']           #: The last trade time (str)
-            self.last_trade_price = float(data['lasttradeprice'])   #: The last trade price (float)
+            self.last_trade_price = number(data['lasttradeprice'])   #: The last trade price (float)
             self.primary_code     = data['primarycode']             #: The primary currency code for the market (str)
             self.primary_name     = data['primaryname']             #: The long name of the primary currency (str)
             self.secondary_code   = data['secondarycode']           #: The secondary currency code for the market (str)
             self.secondary_name   = data['secondaryname']           #: The long name of the secondary currency (str)
             self.label            = data['label']                   #: The market label, :attr:`primary_code`/:attr:`secondary_code`
-            self.sell_orders      = [MarketOrderData(entry) for entry in data['sellorders']]    #: List of open sell orders ([:class:`MarketOrderData`, ...])
-            self.buy_orders       = [MarketOrderData(entry) for entry in data['buyorders']]     #: List of open buy orders ([:class:`MarketOrderData`, ...])
+            self._sell_orders     = data['sellorders']
+            self._buy_orders      = data['buyorders']
+            self._number          = number
         except KeyError as e:
             raise ValueError('Mallformed Market Data, missing field:'+str(e))
     
@@ -208,25 +345,28 @@ class MarketData(object):
                                                                                                                                                                                                                                             self.primary_name, self.secondary_code, self.secondary_name,
                                                                                                                                                                                                                                             self.label, self.sell_orders, self.buy_orders)
         
-class UserTradeData(object):
+class UserTradeData(_Record):
     '''A container object for representing a cryptsy Trade action
     
     :param data: JSON data in the format returned by cryptsy's transaction api's (such as the dicts contained in the list returned by :func:`cryptsy.bare_api.my_trades`)
+    :param number: (optional) The function numeric fields are parsed with. Pass :func:`cryptsy.fixed_point.parse` for exact integer units
     :raise: :exc:`ValueError` if the data is malformed
     
     '''
-    def __init__(self, data):
+    __slots__ = ('tradetype', 'trade_id', 'datetime', 'market_id', 'order_id', 'fee', 'init_ordertype', 'total', 'trade_price', 'quantity')
+    
+    def __init__(self, data, number = float):
         try:
             self.tradetype       = data['tradetype']          #: Either 'Buy' or 'Sell' (str)
             self.trade_id         = int(data['tradeid'])      #: Unique ID of this trade (int)
             self.datetime        = data['datetime']           #: Time when the trade occurred (str)
             self.market_id       = int(data['marketid'])     #: The market ID that the trade was placed on (int)
             self.order_id        = int(data['order_id'])      #: The unique order ID that the trade was part of (int)
-            self.fee             = float(data['fee'])         #: The fee imposed on the trade (float)
+            self.fee             = number(data['fee'])         #: The fee imposed on the trade (float)
             self.init_ordertype  = data['initiate_ordertype'] #: The order type that initiated this trade, either 'Buy' or 'Sell' (str)
-            self.total           = float(data['total'])       #: The amount received in the output currency, = :attr:`quantity`*:attr:`trade_price`-:attr:`fee` (float)
-            self.trade_price     = float(data['tradeprice']) #: The trade price (float)
-            self.quantity        = float(data['quantity'])    #: The quantity of the input currency
+            self.total           = number(data['total'])       #: The amount received in the output currency, = :attr:`quantity`*:attr:`trade_price`-:attr:`fee` (float)
+            self.trade_price     = number(data['tradeprice']) #: The trade price (float)
+            self.quantity        = number(data['quantity'])    #: The quantity of the input currency
         except KeyError as e:
             raise ValueError('Mallformed Trade Data, missing field:'+str(e))
         
@@ -255,6 +395,78 @@ class UserTradeData(object):
                                                                                                                                                            self.order_id, self.fee, self.init_ordertype,
                                                                                                                                                            self.total, self.trade_price, self.quantity)        
 
+def _cached(method):
+    '''Decorator for :class:`ManagedAPI` methods that serves results out of :attr:`ManagedAPI.cache` while they are still valid,
+    and shares the result of an identical call already in flight through :attr:`ManagedAPI.single_flight`.
+    The market argument is used as the market key and the timeout argument is ignored. A result is not cached if the
+    method's results for its market were invalidated while the call was in flight.
+    
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        callargs = inspect.getcallargs(method, self, *args, **kwargs)
+        del callargs['self'], callargs['timeout']
+        market   = callargs.pop('market', None)
+        key      = tuple(sorted(callargs.items()))
+        hit, value = self.cache.get(method.__name__, market, key)
+        if hit:
+            record = instrumentation.current()
+            if record is not None:
+                record.cached = True
+            return value
+        def call():
+            generation = self.cache.generation(method.__name__, market)
+            value = method(self, *args, **kwargs)
+            self.cache.put(method.__name__, market, key, value, generation)
+            return value
+        return self.single_flight.do((method.__name__, market, key), call)
+    return wrapper
+
+def _instrumented(method):
+    '''Decorator for :class:`ManagedAPI` methods that reports each call to the :mod:`cryptsy.instrumentation` observers,
+    if any are registered
+    
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not instrumentation.observers:
+            return method(self, *args, **kwargs)
+        record = instrumentation.begin(method.__name__)
+        if record is None:
+            return method(self, *args, **kwargs)
+        try:
+            result = method(self, *args, **kwargs)
+        except APIError as e:
+            instrumentation.finish(record, instrumentation.API_ERROR, e)
+            raise
+        except Exception as e:
+            instrumentation.finish(record, instrumentation.outcome_of(e), e)
+            raise
+        record.objects = _count_objects(result)
+        instrumentation.finish(record, instrumentation.SUCCESS)
+        return result
+    return wrapper
+
+def _count_objects(result):
+    '''
+    :return: The number of values in a call result, counting the contents of lists, tuples and dicts rather than the containers themselves
+    
+    '''
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return sum(_count_objects(value) for value in result)
+    if isinstance(result, dict):
+        return sum(_count_objects(value) for value in result.itervalues())
+    return 1
+
+def _insufficient_funds(error):
+    '''
+    :return: True if error is an :exc:`APIError` for an order the account's balance cannot cover
+    
+    '''
+    return isinstance(error, APIError) and 'insufficient' in str(error).lower()
+
 class ManagedAPI(object):
     '''
     
@@ -264,99 +476,190 @@ class ManagedAPI(object):
     :param secret_key: The private secret key for the user for authenticated requests
     :type timeout: float
     :param timeout: Default timeout to apply to all API calls
+    :type transport: :class:`~cryptsy.transport.Transport`
+    :param transport: (optional) The transport to send API calls over. If None, the instance creates and owns its own :class:`~cryptsy.transport.ConnectionPool`
+    :type nonce: callable
+    :param nonce: (optional) The nonce source used to sign private API calls. If None, a :class:`~cryptsy.nonce.NonceGenerator` persisting to nonce_path is used
+    :type cache: :class:`~cryptsy.cache.ResponseCache`
+    :param cache: (optional) The cache to serve repeated read-only calls from. If None, a cache with the default TTLs is used
+    :type rate_limiter: :class:`~cryptsy.rate_limit.RateLimiter`
+    :param rate_limiter: (optional) The limiter to throttle calls with. If None, the limiter shared by every instance using application_key is used
+    :type fixed_point: bool
+    :param fixed_point: (optional) If True, prices, quantities, totals and fees in the returned containers are exact integer
+                        counts of 1e-8 units, parsed by :func:`cryptsy.fixed_point.parse`, instead of floats. Raw data returned
+                        by methods such as :meth:`depth`, and :class:`~cryptsy.columnar.ColumnarOrderBook` results, are not affected
+    :type nonce_path: str
+    :param nonce_path: (optional) The file the default :class:`~cryptsy.nonce.NonceGenerator` persists its high-water mark to.
+                       Without one, nonces are seeded from the clock, so a restarted process can reuse nonces if the clock
+                       has stepped back. Ignored if nonce is given
+    
+    Results of read-only calls are cached, so callers should treat returned objects as read-only. Creating or cancelling
+    orders invalidates the cached :meth:`my_orders`, :meth:`market_orders`, :meth:`depth` and :meth:`get_info` results for the
+    affected market.
+    
+    Every call that isn't served from the cache waits on :attr:`rate_limiter` first. Order placement and cancellation are
+    given priority over account queries, which in turn go ahead of queued public market data polls. Priority applies to
+    the wait for a rate token only (see :class:`~cryptsy.rate_limit.RateLimiter`).
     
     '''
     
-    _last_api_call_time = None #: Used to rate-limit API calls
+    _invalidated_by_orders = ('my_orders', 'market_orders', 'depth', 'get_info') #: Cached methods made stale by creating or cancelling orders
     
-    def __init__(self, application_key, secret_key, timeout=None):
+    def __init__(self, application_key, secret_key, timeout=None, transport=None, nonce=None, cache=None, rate_limiter=None, fixed_point=False, nonce_path=None):
         '''
     
     
         '''
         self._application_key = application_key
-        self._secret_key      = secret_key
-        self.cache = {'general_market_data'    : (None, None),
-                      'general_orderbook_data' : (None, None),
-                      'get_info'               : (None, None),
-                      'get_markets'            : (None, None),
-                      'get_transactions'       : (None, None),
-                      'market_trades'          : (None, None),
-                      'market_orders'          : (None, None),
-                      'my_trades'              : (None, None),
-                      'my_orders'              : (None, None),
-                      'depth'                  : (None, None),
-                      'create_order'           : (None, None),
-                      'cancel_order'           : (None, None),
-                      'calculate_fees'         : (None, None),
-                      'generate_new_address'   : (None, None),}
+        self._signer          = Signer(secret_key)
+        self.cache = cache if cache is not None else ResponseCache() #: The :class:`~cryptsy.cache.ResponseCache` holding recent call results
+        self.single_flight = SingleFlight() #: The :class:`~cryptsy.cache.SingleFlight` coalescing identical read-only calls in flight
+        self.rate_limiter = rate_limiter if rate_limiter else shared_limiter(application_key) #: The :class:`~cryptsy.rate_limit.RateLimiter` all calls wait on
         self.timeout = None #: The default timeout to apply to all API calls, in seconds (:class:`float`)
+        self._transport = transport if transport else ConnectionPool()
+        self._nonce     = nonce if nonce else NonceGenerator(nonce_path)
+        self.fixed_point = fixed_point #: Whether amounts in the returned containers are exact integer units (:class:`bool`)
+        self._number     = parse_fixed_point if fixed_point else float
         
         
-    def general_market_data(self, market = None, timeout = None):
+    @_instrumented
+    @_cached
+    def general_market_data(self, market = None, timeout = None, parse_pool = None):
         '''Gets the current state of market data for either all markets or a specific market
     
         :param market: (optional) The market ID to fetch data for
         :type market: int
         :param timeout: (optional) Timeout for the request, in seconds
         :type timeout: int
+        :param parse_pool: (optional) A :class:`~cryptsy.parse_pool.ParsePool` to parse the response in, so the calling
+                           process holds the GIL only to unpack the result. This keeps other threads responsive while a
+                           large response is parsed, at the cost of a slower call
+        :type parse_pool: :class:`~cryptsy.parse_pool.ParsePool`
         :rtype: dict(str, :class:`MarketData`)
-        :return: A dictionary mapping a market label to its market data
+        :return: A dictionary mapping a market label to its market data. With a parse_pool, the market data are
+                 :class:`~cryptsy.parse_pool.PackedMarketData`
     
         '''
-        data = self._check_result(general_market_data(market, timeout))
-        md = dict()
-        for label, market_data in data['markets'].iteritems():
-            md[label] = MarketData(market_data)
-        return md
+        self.rate_limiter.acquire(PRIORITY_POLL)
+        if parse_pool is not None:
+            return parse_pool.market_data(self._read_body(general_market_data(market, timeout, self._transport, stream = True)),
+                                               self._number is not float)
+        return self._market_data_result(self._check_result(general_market_data(market, timeout, self._transport)))
     
-    def general_orderbook_data(self, market = None, timeout = None):
+    @_instrumented
+    @_cached
+    def general_orderbook_data(self, market = None, timeout = None, parse_pool = None):
         '''Gets the current state of orderbook data for either all markets or a specific market
         
         :param market: (optional) The market ID to fetch data for
         :type market: int
         :param timeout: (optional) Timeout for the request, in seconds
         :type timeout: int
+        :param parse_pool: (optional) A :class:`~cryptsy.parse_pool.ParsePool` to parse the response in, as for :meth:`general_market_data`
+        :type parse_pool: :class:`~cryptsy.parse_pool.ParsePool`
+        :return: The raw orderbook data, or with a parse_pool, a dict mapping each key of the response to a
+                 :class:`~cryptsy.parse_pool.PackedMarketData` holding that market's orders
         
         '''
-        data = self._check_result(general_orderbook_data(market, timeout))
+        self.rate_limiter.acquire(PRIORITY_POLL)
+        if parse_pool is not None:
+            return parse_pool.orderbook_data(self._read_body(general_orderbook_data(market, timeout, self._transport, stream = True)),
+                                                  self._number is not float)
+        data = self._check_result(general_orderbook_data(market, timeout, self._transport))
         return data
     
+    def iter_market_data(self, labels = None, markets = None, timeout = None):
+        '''Gets the current state of market data for all markets, parsing the response incrementally and yielding one market at a time
+        
+        :param labels: (optional) Only yield the markets with these labels. Other markets are skipped without being parsed
+        :type labels: [str, ...]
+        :param markets: (optional) Only yield the markets with these market IDs
+        :type markets: [int, ...]
+        :param timeout: (optional) Timeout for the request, in seconds
+        :type timeout: int
+        :rtype: generator of (str, :class:`MarketData`)
+        :return: (label, market data) pairs in the order they appear in the response
+        :raise: :exc:`APIError` if there was a problem with the API call
+        
+        Unlike :meth:`general_market_data`, only one market is held in memory at a time and results are not cached.
+        
+        '''
+        self.rate_limiter.acquire(PRIORITY_POLL)
+        for item in self._iter_market_data(general_market_data(timeout = timeout, transport = self._transport, stream = True), labels, markets):
+            yield item
+    
+    def iter_orderbook_data(self, labels = None, markets = None, timeout = None):
+        '''Gets the current state of orderbook data for all markets, parsing the response incrementally and yielding one market at a time
+        
+        :param labels: (optional) Only yield the markets with these labels
+        :type labels: [str, ...]
+        :param markets: (optional) Only yield the markets with these market IDs
+        :type markets: [int, ...]
+        :param timeout: (optional) Timeout for the request, in seconds
+        :type timeout: int
+        :rtype: generator of (str, dict)
+        :return: (key, orderbook data) pairs in the order they appear in the response, in the same form as the entries returned by :meth:`general_orderbook_data`
+        :raise: :exc:`APIError` if there was a problem with the API call
+        
+        '''
+        self.rate_limiter.acquire(PRIORITY_POLL)
+        for item in self._iter_orderbook_data(general_orderbook_data(timeout = timeout, transport = self._transport, stream = True), labels, markets):
+            yield item
+    
+    @_instrumented
+    @_cached
     def get_info(self, timeout = None):
         '''Get's the user's account info
         
         :param timeout: Timeout for the request in seconds
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(get_info(application_key = self._application_key,
-                                     secret_key      = self._secret_key,
-                                     timeout         = self._timeout(timeout)))
+                                     secret_key      = self._signer,
+                                     timeout         = self._timeout(timeout),
+                                     transport       = self._transport,
+                                     nonce           = self._nonce))
         return data
     
+    @_instrumented
+    @_cached
     def get_markets(self, timeout = None):
         '''Get's the user's active markets
         
         :param timeout: Timeout for the request in seconds
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(get_markets(application_key = self._application_key,
-                                        secret_key      = self._secret_key,
-                                        timeout         = self._timeout(timeout)))
+                                        secret_key      = self._signer,
+                                        timeout         = self._timeout(timeout),
+                                        transport       = self._transport,
+                                        nonce           = self._nonce))
         return data
     
-    def get_transactions(self, timeout = None):
+    @_instrumented
+    @_cached
+    def get_transactions(self, timeout = None, since = None):
         '''Get's the user's Deposit/Withdrawal history
         
         :param timeout: Timeout for the request in seconds
+        :param since: (optional) If given, only transactions with a unix timestamp of at least since are parsed and returned
+        :type since: int
         :rtype: [:class:`TransactionData`, ...]
         :return: A list of all of the user's previous transactions
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(get_transactions(application_key = self._application_key,
-                                             secret_key      = self._secret_key,
-                                             timeout         = self._timeout(timeout)))
-        return [TransactionData(entry) for entry in data]
+                                             secret_key      = self._signer,
+                                             timeout         = self._timeout(timeout),
+                                             transport       = self._transport,
+                                             nonce           = self._nonce))
+        return self._transactions_result(data, since)
     
+    @_instrumented
+    @_cached
     def market_trades(self, market, timeout = None):
         '''Get's the the last 1000 transactions for a market
         
@@ -365,27 +668,41 @@ class ManagedAPI(object):
         :param timeout: Timeout for the request in seconds
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(market_trades(application_key = self._application_key,
-                                          secret_key      = self._secret_key,
+                                          secret_key      = self._signer,
                                           market          = market,
-                                          timeout         = self._timeout(timeout)))
+                                          timeout         = self._timeout(timeout),
+                                          transport       = self._transport,
+                                          nonce           = self._nonce))
         return data
     
-    def market_orders(self, market, timeout = None):
+    @_instrumented
+    @_cached
+    def market_orders(self, market, timeout = None, columnar = False):
         '''Get's the the set of buy/sell orders for a market
         
         :param market: The market ID to query
         :type market: int
         :param timeout: Timeout for the request in seconds
+        :param columnar: (optional) If True, return a :class:`~cryptsy.columnar.ColumnarOrderBook` instead. Requires NumPy
+        :type columnar: bool
+        :rtype: ([:class:`MarketOrderData`, ...], [:class:`MarketOrderData`, ...])
+        :return: A tuple of (buy orders, sell orders)
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(market_orders(application_key = self._application_key,
-                                          secret_key      = self._secret_key,
+                                          secret_key      = self._signer,
                                           market          = market,
-                                          timeout         = self._timeout(timeout)))
-        return ([MarketOrderData(entry) for entry in data['buyorders']], [MarketOrderData(entry) for entry in data['sellorders']])
+                                          timeout         = self._timeout(timeout),
+                                          transport       = self._transport,
+                                          nonce           = self._nonce))
+        return self._market_orders_result(data, columnar)
     
-    def my_trades(self, market = None, limit = 200, timeout = None):
+    @_instrumented
+    @_cached
+    def my_trades(self, market = None, limit = 200, timeout = None, after = None):
         '''Get's the the trade history for the user, optionally limited to a given market
         
         :param market: (optional) The market ID to query
@@ -393,17 +710,24 @@ class ManagedAPI(object):
         :param limit: (optional) The maximum number of transactions to list. Ignored if market is not specified
         :type limit: int
         :param timeout: Timeout for the request in seconds
+        :param after: (optional) If given, only trades with a trade ID greater than after are parsed and returned
+        :type after: int
         :rtype: [:class:`UserTradeData`, ...]
         :return: The trade history for the user, optionally limited to the given market
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(my_trades(application_key = self._application_key,
-                                      secret_key      = self._secret_key,
+                                      secret_key      = self._signer,
                                       market          = market,
                                       limit           = limit,
-                                      timeout         = self._timeout(timeout)))
-        return [UserTradeData(entry) for entry in data]
+                                      timeout         = self._timeout(timeout),
+                                      transport       = self._transport,
+                                      nonce           = self._nonce))
+        return self._my_trades_result(data, after)
     
+    @_instrumented
+    @_cached
     def my_orders(self, market = None, timeout = None):
         '''Get's the the user's current open buy/sell orders, optionally limited to a a market
         
@@ -412,26 +736,37 @@ class ManagedAPI(object):
         :param timeout: Timeout for the request in seconds
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(my_orders(application_key = self._application_key,
-                                            secret_key      = self._secret_key,
+                                            secret_key      = self._signer,
                                             market          = market,
-                                            timeout         = self._timeout(timeout)))
-        return [UserOrderData(entry) for entry in data]
+                                            timeout         = self._timeout(timeout),
+                                            transport       = self._transport,
+                                            nonce           = self._nonce))
+        return self._my_orders_result(data)
     
-    def depth(self, market, timeout = None):
+    @_instrumented
+    @_cached
+    def depth(self, market, timeout = None, columnar = False):
         '''Get's an array of buy and sell orders on the market representing market depth
         
         :param market: The market ID to query
         :type market: int
         :param timeout: Timeout for the request in seconds
+        :param columnar: (optional) If True, return a :class:`~cryptsy.columnar.ColumnarOrderBook` instead of the raw JSON data. Requires NumPy
+        :type columnar: bool
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(depth(application_key = self._application_key,
-                                        secret_key      = self._secret_key,
+                                        secret_key      = self._signer,
                                         market          = market,
-                                        timeout         = self._timeout(timeout)))
-        return data
+                                        timeout         = self._timeout(timeout),
+                                        transport       = self._transport,
+                                        nonce           = self._nonce))
+        return self._depth_result(data, columnar)
     
+    @_instrumented
     def create_order(self, market, ordertype,  quantity, price, timeout = None):
         '''Creates an order on a market
         
@@ -439,21 +774,26 @@ class ManagedAPI(object):
         :type market: int
         :param ordertype: Buy|Sell
         :type ordertype: str
-        :param quantity: The amount of units to buy/sell
-        :type quantity: float
-        :param price: The price to buy/sell at
-        :type price: float
+        :param quantity: The amount of units to buy/sell. With :attr:`fixed_point`, an int is taken as units
+        :type quantity: float or int
+        :param price: The price to buy/sell at. With :attr:`fixed_point`, an int is taken as units
+        :type price: float or int
         :param timeout: Timeout for the request in seconds
         '''
+        self.rate_limiter.acquire(PRIORITY_ORDER)
         data = self._check_result(create_order(application_key = self._application_key,
-                                         secret_key      = self._secret_key,
+                                         secret_key      = self._signer,
                                          market          = market,
                                          ordertype       = ordertype,
-                                         quantity        = quantity,
-                                         price           = price,
-                                         timeout         = self._timeout(timeout)))
+                                         quantity        = self._amount(quantity),
+                                         price           = self._amount(price),
+                                         timeout         = self._timeout(timeout),
+                                         transport       = self._transport,
+                                         nonce           = self._nonce))
+        self._invalidate_orders(market)
         return data
     
+    @_instrumented
     def cancel_order(self, orderid = None, market = None, timeout = None):
         '''Cancels an order, all orders on a market, or all orders across all markets
         
@@ -467,33 +807,43 @@ class ManagedAPI(object):
         If neither an order id or market id are given, cancels all open orders for the user
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ORDER)
         data = self._check_result(cancel_order(application_key = self._application_key,
-                                         secret_key      = self._application_key,
+                                         secret_key      = self._signer,
                                          orderid         = orderid,
                                          market          = market,
-                                         timeout         = self._timeout(timeout)))
+                                         timeout         = self._timeout(timeout),
+                                         transport       = self._transport,
+                                         nonce           = self._nonce))
+        self._invalidate_orders(market)
         return data
     
+    @_instrumented
+    @_cached
     def calculate_fees(self, ordertype,  quantity, price, timeout = None):
         '''Calculates the fees that would be assessed for an order
         
         :param ordertype: Buy|Sell
         :type ordertype: str
-        :param quantity: The amount of units to buy/sell
-        :type quantity: float
-        :param price: The price to buy/sell at
-        :type price: float
+        :param quantity: The amount of units to buy/sell. With :attr:`fixed_point`, an int is taken as units
+        :type quantity: float or int
+        :param price: The price to buy/sell at. With :attr:`fixed_point`, an int is taken as units
+        :type price: float or int
         :param timeout: Timeout for the request in seconds
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(calculate_fees(application_key = self._application_key,
-                                           secret_key      = self._secret_key,
+                                           secret_key      = self._signer,
                                            ordertype       = ordertype,
-                                           quantity        = quantity,
-                                           price           = price,
-                                           timeout         = self._timeout(timeout)))
+                                           quantity        = self._amount(quantity),
+                                           price           = self._amount(price),
+                                           timeout         = self._timeout(timeout),
+                                           transport       = self._transport,
+                                           nonce           = self._nonce))
         return data
     
+    @_instrumented
     def generate_new_address(self, currencycode = None, currencyid = None, timeout = None):
         '''Creates a new deposite address for the specified currency.
         
@@ -506,12 +856,155 @@ class ManagedAPI(object):
         Only need to specify currency code OR currency id, not both
         
         '''
+        self.rate_limiter.acquire(PRIORITY_ACCOUNT)
         data = self._check_result(generate_new_address(application_key = self._application_key,
-                                                       secret_key      = self._secret_key,
+                                                       secret_key      = self._signer,
                                                        currencycode    = currencycode,
                                                        currencyid      = currencycode,
-                                                       timeout         = self._timeout(timeout)))
+                                                       timeout         = self._timeout(timeout),
+                                                       transport       = self._transport,
+                                                       nonce           = self._nonce))
         return data
+    
+    def fetch_many(self, method, markets, max_concurrency = 8, timeout = None):
+        '''Calls a per-market API method for many markets at once, yielding each result as soon as it completes
+        
+        :param method: The name of the method to call for each market, such as 'depth' or 'market_orders'
+        :type method: str
+        :param markets: The market IDs to query
+        :type markets: [int, ...]
+        :param max_concurrency: (optional) The maximum number of calls to have in flight at once
+        :type max_concurrency: int
+        :param timeout: Timeout for each request in seconds
+        :rtype: generator of (int, data, :exc:`Exception`)
+        :return: A (market, data, error) tuple for every market, in completion order. If the call for a market failed,
+                 data is None and error is the exception it raised, otherwise error is None
+        
+        A failure on one market does not abort the rest of the batch. Private methods of one application key are written to
+        the server one at a time, in nonce order (see :func:`~cryptsy.nonce.send_lock`), and then wait for their responses
+        concurrently.
+        
+        '''
+        call = getattr(self, method)
+        def fetch(market):
+            try:
+                return (market, call(market, timeout = timeout), None)
+            except Exception as e:
+                return (market, None, e)
+        pool = ThreadPool(max_concurrency)
+        try:
+            for result in pool.imap_unordered(fetch, markets):
+                yield result
+        finally:
+            pool.terminate()
+        
+    def create_orders(self, orders, max_concurrency = 4, timeout = None):
+        '''Creates many orders at once, submitting them concurrently
+        
+        :param orders: The orders to create, as (market, ordertype, quantity, price) tuples with the same meaning as the
+                       arguments of :meth:`create_order`
+        :type orders: [(int, str, float, float), ...]
+        :param max_concurrency: (optional) The maximum number of orders to have in flight at once
+        :type max_concurrency: int
+        :param timeout: Timeout for each request in seconds
+        :rtype: list
+        :return: For each order, in input order, the data returned by :meth:`create_order`, or the :exc:`APIError` or
+                 other exception that creating it raised
+        
+        Orders still wait their turn on :attr:`rate_limiter`, so the batch never exceeds the rate limit, and are written to
+        the server in nonce order (see :func:`~cryptsy.nonce.send_lock`), then wait for their responses concurrently.
+        
+        '''
+        return self._submit_orders(lambda order: self._attempt(self.create_order, order, timeout), orders, max_concurrency)
+    
+    def cancel_orders(self, orderids, market = None, max_concurrency = 4, timeout = None):
+        '''Cancels many orders at once, submitting the cancellations concurrently
+        
+        :param orderids: The orders to cancel
+        :type orderids: [int, ...]
+        :param market: (optional) The market the orders are on, so only that market's cached results are invalidated
+        :type market: int
+        :param max_concurrency: (optional) The maximum number of cancellations to have in flight at once
+        :type max_concurrency: int
+        :param timeout: Timeout for each request in seconds
+        :rtype: list
+        :return: For each order, in input order, the data returned by :meth:`cancel_order`, or the :exc:`APIError` or
+                 other exception that cancelling it raised
+        
+        Rate limiting and nonce ordering are handled as in :meth:`create_orders`.
+        
+        '''
+        return self._submit_orders(lambda orderid: self._attempt(self.cancel_order, (orderid, market), timeout), orderids, max_concurrency)
+    
+    def replace_orders(self, replacements, place_first = True, max_concurrency = 4, timeout = None):
+        '''Replaces many orders at once, such as when re-quoting a ladder, keeping the time each level has no order on the book short
+        
+        :param replacements: The replacements, as (orderid, market, ordertype, quantity, price) tuples where orderid is the
+                             order to replace and the rest are the arguments of :meth:`create_order` for its replacement
+        :type replacements: [(int, int, str, float, float), ...]
+        :param place_first: (optional) If True, each new order is placed before its old order is cancelled, so the level
+                            is never empty. This needs the balance to cover both orders at once. If False, each old order
+                            is cancelled and its replacement sent straight after
+        :type place_first: bool
+        :param max_concurrency: (optional) The maximum number of replacements to have in flight at once
+        :type max_concurrency: int
+        :param timeout: Timeout for each request in seconds
+        :rtype: [(object, object), ...]
+        :return: For each replacement, in input order, a tuple of (create result, cancel result), where each result is the
+                 data returned by the call or the exception it raised. The cancel result is None if the old order was left
+                 alone because it is unknown whether its replacement was placed, such as after a timeout
+        
+        Levels are replaced concurrently, each one in order. With place_first, if placing the new order is rejected for
+        insufficient funds, because the old order still holds them, the old order is cancelled and the new one is placed
+        again. If it fails for any other reason, the old order is left on the book and the cancel result is None.
+        
+        '''
+        def replace(replacement):
+            orderid, order = replacement[0], replacement[1:]
+            if place_first:
+                created = self._attempt(self.create_order, order, timeout)
+                if not isinstance(created, Exception):
+                    return (created, self._attempt(self.cancel_order, (orderid, order[0]), timeout))
+                if not _insufficient_funds(created):
+                    return (created, None)
+            cancelled = self._attempt(self.cancel_order, (orderid, order[0]), timeout)
+            return (self._attempt(self.create_order, order, timeout), cancelled)
+        return self._submit_orders(replace, replacements, max_concurrency)
+    
+    def _submit_orders(self, submit, calls, max_concurrency):
+        '''Runs submit on every item of calls on a thread pool, returning the results in input order
+        
+        '''
+        calls = list(calls)
+        if not calls:
+            return []
+        pool = ThreadPool(min(max_concurrency, len(calls)))
+        try:
+            return pool.map(submit, calls, chunksize = 1)
+        finally:
+            pool.terminate()
+    
+    def _attempt(self, method, args, timeout):
+        '''Calls an order method
+        
+        :return: The result of the call, or the exception it raised
+        
+        '''
+        try:
+            return method(*args, timeout = timeout)
+        except Exception as e:
+            return e
+        
+    def _invalidate_orders(self, market):
+        '''Drops cached results made stale by creating or cancelling orders
+        
+        :param market: The market the orders were on, or None if it isn't known
+        :type market: int
+        
+        '''
+        for method in self._invalidated_by_orders:
+            self.cache.invalidate(method, market)
+            self.single_flight.forget(method, market)
         
     def _timeout(self, timeout):
         '''
@@ -525,6 +1018,100 @@ class ManagedAPI(object):
             return timeout
         else:
             return self.timeout
+    
+    def _amount(self, value):
+        '''
+        :param value: A quantity or price passed to a call
+        :return: value in the form to send it in. With :attr:`fixed_point`, ints are units and are sent as decimal strings
+        
+        '''
+        if self.fixed_point and isinstance(value, (int, long)):
+            return fixed_point_string(value)
+        return value
+        
+    def _market_data_result(self, data):
+        return dict((label, MarketData(market_data, self._number)) for label, market_data in data['markets'].iteritems())
+    
+    def _transactions_result(self, data, since):
+        return [TransactionData(entry, self._number) for entry in data if since is None or 'timestamp' not in entry or int(entry['timestamp']) >= since]
+    
+    def _market_orders_result(self, data, columnar):
+        if columnar:
+            from columnar import ColumnarOrderBook
+            return ColumnarOrderBook.from_market_orders(data)
+        return (MarketOrderData.build_many(data['buyorders'], self._number), MarketOrderData.build_many(data['sellorders'], self._number))
+    
+    def _my_trades_result(self, data, after):
+        return [UserTradeData(entry, self._number) for entry in data if after is None or 'tradeid' not in entry or int(entry['tradeid']) > after]
+    
+    def _my_orders_result(self, data):
+        return [UserOrderData(entry, self._number) for entry in data]
+    
+    def _depth_result(self, data, columnar):
+        if columnar:
+            from columnar import ColumnarOrderBook
+            return ColumnarOrderBook.from_depth(data)
+        return data
+    
+    def _iter_market_data(self, response, labels, markets):
+        for label, market_data in self._iter_result(response, ('return', 'markets'), labels, markets):
+            yield label, MarketData(market_data, self._number)
+    
+    def _iter_orderbook_data(self, response, labels, markets):
+        # Orderbooks are keyed by market ID rather than label, so labels are checked against each orderbook's label field
+        where = None
+        if labels is not None:
+            labels = set(labels)
+            where  = [('label', lambda label: label in labels)]
+        return self._iter_result(response, ('return',), None, markets, where)
+    
+    def _iter_result(self, response, path, keys, markets, where = None):
+        '''Incrementally parses a streamed API response, yielding the members of the object at path
+        
+        :param response: The file-like response returned by a streaming call from :mod:`cryptsy.bare_api`. It is closed once parsed
+        :param path: The keys leading to the object to iterate over
+        :type path: (str, ...)
+        :param keys: Keys of the members to yield, or None for all members. Other members are skipped without being parsed
+        :type keys: [str, ...]
+        :param markets: Market IDs of the members to yield, or None for all members. Other members are skipped once their
+                        market ID has been read
+        :type markets: [int, ...]
+        :param where: (optional) Further (field, accept) pairs to filter members by, as for :func:`~cryptsy.streaming.iter_items`
+        :type where: [(str, callable), ...]
+        :raise: :exc:`APIError` if there was a problem with the API call
+        
+        '''
+        envelope = dict()
+        keys     = set(keys) if keys is not None else None
+        where    = list(where) if where else []
+        if markets is not None:
+            markets = set(int(market) for market in markets)
+            where.append(('marketid', lambda market: int(market) in markets))
+        try:
+            for key, value in iter_items(response, path, envelope, keys, where = where or None):
+                yield key, value
+        finally:
+            response.close()
+        if int(envelope.get('success', 0)) != 1:
+            raise APIError(envelope.get('error'))
+        
+    def _read_body(self, response):
+        '''Reads and closes a streamed response
+        
+        :rtype: str
+        :return: The undecoded response body
+        
+        '''
+        record  = instrumentation.current()
+        started = time.time()
+        try:
+            body = response.read()
+        finally:
+            response.close()
+        if record is not None:
+            record.add(instrumentation.DOWNLOAD, time.time() - started)
+            record.response_bytes = (record.response_bytes or 0) + len(body)
+        return body
         
     def _check_result(self, raw_data):
         '''Given a JSON object returned by a call from :mod:`cryptsy.bare_api`,
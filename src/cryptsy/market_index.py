@@ -0,0 +1,323 @@
+'''
+.. module:: market_index
+   :platform: Linux, Windows, OSX
+   :synopsis: Constant-time lookup of market metadata by ID, label and currency, persisted between processes
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Build the index once and share it through a cache file, so that later processes start without an API call::
+
+    markets = PersistentMarketIndex(api, 'markets.json')
+    markets.get().by_label('LTC/BTC').market_id
+
+'''
+import json, os, tempfile, threading, time
+
+FORMAT_VERSION = 1 #: The version of the cache file format. Files written with any other version are ignored
+
+class MarketInfo(object):
+    '''The fixed metadata of one market
+
+    :param data: JSON formatted entry of the getmarkets call to parse
+    :raise: :exc:`ValueError` if the data is malformed
+
+    '''
+    __slots__ = ('market_id', 'label', 'primary_code', 'primary_name', 'secondary_code', 'secondary_name')
+
+    def __init__(self, data):
+        try:
+            self.market_id      = int(data['marketid'])             #: The market ID (int)
+            self.label          = data['label']                     #: The market label, :attr:`primary_code`/:attr:`secondary_code` (str)
+            self.primary_code   = data['primary_currency_code']     #: The primary currency code for the market (str)
+            self.primary_name   = data['primary_currency_name']     #: The long name of the primary currency (str)
+            self.secondary_code = data['secondary_currency_code']   #: The secondary currency code for the market (str)
+            self.secondary_name = data['secondary_currency_name']   #: The long name of the secondary currency (str)
+        except KeyError as e:
+            raise ValueError('Mallformed Market Info Data, missing field:'+str(e))
+
+    def to_json(self):
+        '''
+        :rtype: dict
+        :return: The metadata in the form of a getmarkets entry, which :class:`MarketInfo` can be built back from
+
+        '''
+        return {'marketid'                : self.market_id,
+                'label'                   : self.label,
+                'primary_currency_code'   : self.primary_code,
+                'primary_currency_name'   : self.primary_name,
+                'secondary_currency_code' : self.secondary_code,
+                'secondary_currency_name' : self.secondary_name}
+
+    def __str__(self):
+        return '{{market_id:{0}, label:{1}, primary_code:{2}, primary_name:{3}, secondary_code:{4}, secondary_name:{5}}}'.format(self.market_id, self.label, self.primary_code,
+                                                                                                                             self.primary_name, self.secondary_code, self.secondary_name)
+
+class MarketIndex(object):
+    '''An immutable index of market metadata with constant-time lookups by market ID, label and currency code
+
+    :param markets: The markets to index
+    :type markets: [:class:`MarketInfo`, ...]
+    :param created: (optional) The unix time the metadata was fetched. Defaults to now
+    :type created: float
+
+    Labels and currency codes are matched case-insensitively.
+
+    '''
+    def __init__(self, markets, created = None):
+        self.created      = time.time() if created is None else created #: The unix time the metadata was fetched (float)
+        self._by_id       = dict()
+        self._by_label    = dict()
+        self._by_currency = dict()
+        for market in markets:
+            self._by_id[market.market_id]        = market
+            self._by_label[market.label.upper()] = market
+            for code in (market.primary_code.upper(), market.secondary_code.upper()):
+                self._by_currency.setdefault(code, []).append(market)
+        for code, found in self._by_currency.iteritems():
+            self._by_currency[code] = tuple(sorted(found, key = lambda market: market.market_id))
+
+    @classmethod
+    def from_markets(cls, entries):
+        '''Builds an index from the result of a getmarkets call
+
+        :param entries: The list returned by :meth:`~cryptsy.managed_api.ManagedAPI.get_markets`
+        :type entries: [dict, ...]
+        :rtype: :class:`MarketIndex`
+        :raise: :exc:`ValueError` if an entry is malformed
+
+        '''
+        return cls([MarketInfo(entry) for entry in entries])
+
+    @classmethod
+    def from_market_data(cls, snapshot):
+        '''Builds an index from an all-markets snapshot, for callers that already fetch one
+
+        :param snapshot: A dict mapping market label to :class:`~cryptsy.managed_api.MarketData`, as returned by
+                         :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data`
+        :type snapshot: dict(str, :class:`~cryptsy.managed_api.MarketData`)
+        :rtype: :class:`MarketIndex`
+
+        '''
+        return cls([MarketInfo({'marketid'                : market_data.market_id,
+                                'label'                   : market_data.label,
+                                'primary_currency_code'   : market_data.primary_code,
+                                'primary_currency_name'   : market_data.primary_name,
+                                'secondary_currency_code' : market_data.secondary_code,
+                                'secondary_currency_name' : market_data.secondary_name}) for market_data in snapshot.itervalues()])
+
+    def by_id(self, market_id):
+        '''
+        :param market_id: The market ID
+        :type market_id: int
+        :rtype: :class:`MarketInfo`
+        :return: The market, or None if there is no market with that ID
+
+        '''
+        return self._by_id.get(int(market_id))
+
+    def by_label(self, label):
+        '''
+        :param label: The market label, such as 'LTC/BTC'
+        :type label: str
+        :rtype: :class:`MarketInfo`
+        :return: The market, or None if there is no market with that label
+
+        '''
+        return self._by_label.get(label.upper())
+
+    def by_currency(self, code):
+        '''
+        :param code: The currency code, such as 'BTC'
+        :type code: str
+        :rtype: (:class:`MarketInfo`, ...)
+        :return: Every market trading that currency as its primary or secondary currency, by ascending market ID
+
+        '''
+        return self._by_currency.get(code.upper(), ())
+
+    def market_id(self, label):
+        '''
+        :param label: The market label, such as 'LTC/BTC'
+        :type label: str
+        :rtype: int
+        :return: The ID of the market
+        :raise: :exc:`KeyError` if there is no market with that label
+
+        '''
+        return self._by_label[label.upper()].market_id
+
+    def label(self, market_id):
+        '''
+        :param market_id: The market ID
+        :type market_id: int
+        :rtype: str
+        :return: The label of the market
+        :raise: :exc:`KeyError` if there is no market with that ID
+
+        '''
+        return self._by_id[int(market_id)].label
+
+    def currencies(self):
+        '''
+        :rtype: [str, ...]
+        :return: The code of every currency traded in any market, sorted
+
+        '''
+        return sorted(self._by_currency)
+
+    def age(self):
+        '''
+        :rtype: float
+        :return: Seconds since the metadata was fetched
+
+        '''
+        return time.time() - self.created
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return (self._by_id[market_id] for market_id in sorted(self._by_id))
+
+    def __contains__(self, market):
+        if isinstance(market, basestring):
+            return market.upper() in self._by_label
+        return market in self._by_id
+
+    def save(self, path):
+        '''Writes the index to a cache file. The file is replaced in one step, so readers never see a partial write
+
+        :param path: The file to write
+        :type path: str
+
+        '''
+        document  = {'version' : FORMAT_VERSION, 'created' : self.created, 'markets' : [market.to_json() for market in self]}
+        directory = os.path.dirname(os.path.abspath(path))
+        handle, temp_path = tempfile.mkstemp(dir = directory, prefix = '.markets-')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(document, f)
+            _replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        '''Reads an index written by :meth:`save`
+
+        :param path: The cache file
+        :type path: str
+        :rtype: :class:`MarketIndex`
+        :return: The index, or None if the file is missing, unreadable, or of another :data:`FORMAT_VERSION`
+
+        '''
+        try:
+            with open(path) as f:
+                document = json.load(f)
+            if document.get('version') != FORMAT_VERSION:
+                return None
+            return cls([MarketInfo(entry) for entry in document['markets']], document['created'])
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+def _replace(source, destination):
+    try:
+        os.rename(source, destination)
+    except OSError:
+        # Windows will not rename over an existing file
+        os.remove(destination)
+        os.rename(source, destination)
+
+class PersistentMarketIndex(object):
+    '''Keeps a :class:`MarketIndex` loaded from a cache file, refetching it from the API when it gets old
+
+    :param api: The API to fetch the markets from
+    :type api: :class:`~cryptsy.managed_api.ManagedAPI`
+    :param path: The cache file to share the index through
+    :type path: str
+    :param ttl: (optional) Seconds the index stays fresh
+    :type ttl: float
+    :param timeout: (optional) Timeout for the getmarkets request in seconds
+    :param retry_delay: (optional) Seconds to wait after a failed background refresh before trying again
+    :type retry_delay: float
+
+    The first :meth:`get` reads the cache file. Only when there is no usable file does it wait on the API. Once the index
+    is older than the TTL, :meth:`get` keeps returning it while one background thread fetches a new one and rewrites the
+    file; lookups never block on a refresh. If a background refresh fails, the old index stays in use and no new refresh
+    starts until ``retry_delay`` seconds have passed.
+
+    '''
+    def __init__(self, api, path, ttl = 3600.0, timeout = None, retry_delay = 60.0):
+        self.api         = api         #: The :class:`~cryptsy.managed_api.ManagedAPI` fetched from
+        self.path        = path        #: The cache file (str)
+        self.ttl         = ttl         #: Seconds the index stays fresh (float)
+        self.timeout     = timeout     #: Timeout for the getmarkets request in seconds
+        self.retry_delay = retry_delay #: Seconds to wait after a failed background refresh before trying again (float)
+        self.last_error  = None        #: The exception raised by the last failed background refresh, if any
+        self._index      = None
+        self._lock       = threading.Lock()
+        self._refreshing = False
+        self._retry_at   = 0.0
+
+    def get(self):
+        '''
+        :rtype: :class:`MarketIndex`
+        :return: The current index
+        :raise: :exc:`~cryptsy.managed_api.APIError` if there was no cache file and the API call failed
+
+        '''
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = MarketIndex.load(self.path) or self._fetch()
+                index = self._index
+        if index.age() > self.ttl and time.time() >= self._retry_at:
+            self._refresh_in_background()
+        return index
+
+    def refresh(self):
+        '''Fetches the markets from the API now and rewrites the cache file
+
+        :rtype: :class:`MarketIndex`
+        :return: The new index
+        :raise: :exc:`~cryptsy.managed_api.APIError` if there was a problem with the API call
+
+        '''
+        index = self._fetch()
+        self._index = index
+        return index
+
+    def _fetch(self):
+        # The response cache would otherwise hand back the result the stale index was built from
+        self.api.cache.invalidate('get_markets')
+        index = MarketIndex.from_markets(self.api.get_markets(timeout = self.timeout))
+        index.save(self.path)
+        return index
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        thread = threading.Thread(target = self._background_refresh)
+        thread.daemon = True
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            # Another process may have refreshed the file already
+            index = MarketIndex.load(self.path)
+            if index is None or index.age() > self.ttl:
+                index = self._fetch()
+            self._index     = index
+            self.last_error = None
+        except Exception as e:
+            self.last_error = e
+            self._retry_at  = time.time() + self.retry_delay
+        finally:
+            self._refreshing = False
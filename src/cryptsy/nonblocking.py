@@ -0,0 +1,810 @@
+'''
+.. module:: nonblocking
+   :platform: Linux, Windows, OSX
+   :synopsis: A transport which sends many API calls at once from a single thread, over non-blocking sockets
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import errno, heapq, httplib, itertools, os, select, socket, ssl, threading, time, traceback, urllib2, urlparse
+from collections import deque
+from multiprocessing import TimeoutError
+from StringIO import StringIO
+from transport import DeferredTransport
+import decoding
+
+_IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN, errno.EALREADY, getattr(errno, 'WSAEWOULDBLOCK', 10035))
+_LOCK_RETRY  = 0.001 # Seconds between attempts to take a lock held outside the loop
+_READ_SIZE   = 65536
+
+class Future(object):
+    '''The eventual result of a call made over an :class:`EventLoopTransport`
+
+    Its :meth:`get`, :meth:`wait`, :meth:`ready` and :meth:`successful` behave as those of
+    :class:`multiprocessing.pool.AsyncResult`. Callbacks run on the thread which completes the future, normally the
+    event loop's, so they must not block, or wait on other futures of the same loop.
+
+    '''
+    def __init__(self):
+        self._done      = threading.Event()
+        self._lock      = threading.Lock()
+        self._callbacks = []
+        self._value     = None
+        self._error     = None
+
+    def get(self, timeout = None):
+        '''Waits for the call to complete
+
+        :param timeout: (optional) The number of seconds to wait. If None, waits until the call completes
+        :type timeout: float
+        :return: The result of the call
+        :raise: The exception the call failed with, or :exc:`multiprocessing.TimeoutError` if it did not complete in time
+
+        '''
+        if not self._done.wait(timeout):
+            raise TimeoutError()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    def wait(self, timeout = None):
+        '''Waits for the call to complete, without returning its result
+
+        :param timeout: (optional) The number of seconds to wait. If None, waits until the call completes
+        :type timeout: float
+
+        '''
+        self._done.wait(timeout)
+
+    def ready(self):
+        '''
+        :rtype: bool
+        :return: True if the call has completed
+
+        '''
+        return self._done.is_set()
+
+    def successful(self):
+        '''
+        :rtype: bool
+        :return: True if the call completed without raising an exception
+        :raise: :exc:`ValueError` if the call has not completed
+
+        '''
+        if not self.ready():
+            raise ValueError('The call has not completed')
+        return self._error is None
+
+    def exception(self):
+        '''
+        :return: The exception the call failed with, or None if it succeeded or has not completed
+
+        '''
+        return self._error
+
+    def add_callback(self, callback):
+        '''Calls callback with this future once the call completes, or at once if it already has
+
+        :param callback: Called with this future as its only argument
+        :type callback: callable
+
+        '''
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        _run_callback(callback, self)
+
+    def then(self, function):
+        '''
+        :param function: Called with the result of the call once it succeeds
+        :type function: callable
+        :rtype: :class:`Future`
+        :return: A future of what function returns. If the call fails, or function raises, it fails with the same exception
+
+        '''
+        chained = Future()
+        def chain(future):
+            if future._error is not None:
+                chained.set_exception(future._error)
+                return
+            try:
+                value = function(future._value)
+            except Exception as e:
+                chained.set_exception(e)
+            else:
+                chained.set_result(value)
+        self.add_callback(chain)
+        return chained
+
+    def set_result(self, value):
+        '''Completes the future with a result. Has no effect if it has already completed
+
+        '''
+        self._complete(value, None)
+
+    def set_exception(self, error):
+        '''Completes the future with an exception. Has no effect if it has already completed
+
+        '''
+        self._complete(None, error)
+
+    def _complete(self, value, error):
+        with self._lock:
+            if self._done.is_set():
+                return
+            self._value = value
+            self._error = error
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run_callback(callback, self)
+
+def _run_callback(callback, future):
+    try:
+        callback(future)
+    except Exception:
+        traceback.print_exc()
+
+class _ResponseParser(object):
+    '''Incremental parser of one HTTP/1.x response
+
+    '''
+    def __init__(self):
+        self.status     = None  #: The status code, once the headers have been read (int)
+        self.reason     = None  #: The reason phrase, once the headers have been read (str)
+        self.headers    = {}    #: The headers, keyed by their lower-cased names
+        self.keep_alive = False #: Whether the connection may carry another request afterwards (bool)
+        self.started    = False #: Whether any part of the response has been received (bool)
+        self.done       = False #: Whether the whole response has been received (bool)
+        self._buffer    = ''
+        self._body      = []
+        self._mode      = None # 'length', 'chunked' or 'close'
+        self._remaining = None # Bytes left of the body, or of the current chunk and its CRLF
+        self._trailer   = False
+
+    @property
+    def body(self):
+        '''The part of the body received so far (str)
+
+        '''
+        return ''.join(self._body)
+
+    def feed(self, data):
+        '''Parses the next bytes of the response
+
+        :raise: :exc:`httplib.HTTPException` if the response is malformed
+
+        '''
+        self.started = True
+        if self.status is None:
+            self._buffer += data
+            end = self._buffer.find('\r\n\r\n')
+            if end < 0:
+                return
+            head, data   = self._buffer[:end], self._buffer[end + 4:]
+            self._buffer = ''
+            self._parse_head(head)
+        if self._mode == 'chunked':
+            self._buffer += data
+            self._parse_chunks()
+        elif data and not self.done:
+            if self._remaining is not None:
+                data = data[:self._remaining]
+                self._remaining -= len(data)
+                self.done = self._remaining == 0
+            self._body.append(data)
+
+    def feed_eof(self):
+        '''Handles the server closing the connection
+
+        :raise: :exc:`httplib.HTTPException` if the response was cut short
+
+        '''
+        if self.status is None:
+            raise httplib.BadStatusLine('')
+        if self._mode != 'close' and not self.done:
+            raise httplib.IncompleteRead(self.body)
+        self.done = True
+
+    def _parse_head(self, head):
+        lines = head.split('\r\n')
+        parts = lines[0].split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise httplib.BadStatusLine(lines[0])
+        try:
+            self.status = int(parts[1])
+        except ValueError:
+            raise httplib.BadStatusLine(lines[0])
+        self.reason = parts[2] if len(parts) > 2 else ''
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            self.headers[name.strip().lower()] = value.strip()
+        connection = self.headers.get('connection', '').lower()
+        self.keep_alive = connection == 'keep-alive' if parts[0] == 'HTTP/1.0' else connection != 'close'
+        if 'chunked' in self.headers.get('transfer-encoding', '').lower():
+            self._mode = 'chunked'
+        elif 'content-length' in self.headers:
+            self._mode      = 'length'
+            self._remaining = int(self.headers['content-length'])
+            self.done       = self._remaining == 0
+        else:
+            self._mode      = 'close'
+            self.keep_alive = False
+
+    def _parse_chunks(self):
+        while not self.done:
+            if self._remaining is None:
+                end = self._buffer.find('\r\n')
+                if end < 0:
+                    return
+                line, self._buffer = self._buffer[:end], self._buffer[end + 2:]
+                if self._trailer:
+                    self.done = not line
+                    continue
+                size = int(line.split(';', 1)[0], 16)
+                if size:
+                    self._remaining = size + 2
+                else:
+                    self._trailer = True
+            elif self._remaining > 2:
+                data = self._buffer[:self._remaining - 2]
+                if not data:
+                    return
+                self._body.append(data)
+                self._buffer     = self._buffer[len(data):]
+                self._remaining -= len(data)
+            elif len(self._buffer) >= self._remaining:
+                self._buffer    = self._buffer[self._remaining:]
+                self._remaining = None
+            else:
+                return
+
+_tls_context = None
+
+def _wrap_tls(sock, host):
+    global _tls_context
+    if _tls_context is None:
+        _tls_context = ssl.create_default_context()
+    return _tls_context.wrap_socket(sock, server_hostname = host, do_handshake_on_connect = False)
+
+class _Connection(object):
+    '''One connection of an :class:`EventLoopTransport`, carrying one request at a time
+
+    '''
+    def __init__(self, key, address):
+        scheme, host, port = key
+        family, socktype, proto, _, sockaddr = address
+        self.key       = key
+        self.request   = None  # The request in flight, if any
+        self.parser    = None  # The parser of its response
+        self.reused    = False # Whether the connection has carried a request before
+        self.eof       = False # Whether the server has closed the connection
+        self.last_used = time.time()
+        self.sock      = socket.socket(family, socktype, proto)
+        self.sock.setblocking(False)
+        self._host        = host
+        self._tls         = scheme == 'https'
+        self._connecting  = True
+        self._handshaking = False
+        self._out         = ''
+        self._wait        = 'write'
+        error = self.sock.connect_ex(sockaddr)
+        if error and error not in _IN_PROGRESS:
+            self.sock.close()
+            raise socket.error(error, os.strerror(error))
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def writing(self):
+        '''
+        :return: True if the connection is waiting for its socket to become writable, False if readable
+
+        '''
+        return self._wait == 'write'
+
+    def start(self, request):
+        self.request = request
+        self.parser  = _ResponseParser()
+        self._out    = request.data
+        if not self._connecting:
+            self._wait = 'write'
+
+    def advance(self):
+        '''Makes as much progress as the socket allows without blocking: connecting, the TLS handshake, sending the
+        request and receiving the response
+
+        '''
+        if self._connecting:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                raise socket.error(error, os.strerror(error))
+            self._connecting = False
+            if self._tls:
+                self.sock         = _wrap_tls(self.sock, self._host)
+                self._handshaking = True
+        if self._handshaking:
+            if not self._attempt(self.sock.do_handshake):
+                return
+            self._handshaking = False
+        while self._out:
+            sent = self._attempt(self.sock.send, self._out)
+            if sent is None:
+                return
+            self._out = self._out[sent:]
+        self._wait = 'read'
+        while not self.eof:
+            data = self._attempt(self.sock.recv, _READ_SIZE)
+            if data is None:
+                return
+            if self.parser is None:
+                if data:
+                    raise httplib.BadStatusLine(data)
+                self.eof = True
+            elif data:
+                self.parser.feed(data)
+                if self.parser.done:
+                    return
+            else:
+                self.eof = True
+                self.parser.feed_eof()
+
+    def close(self):
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+    def _attempt(self, function, *args):
+        '''Calls a socket method, noting what the socket is waiting for if it would block
+
+        :return: What function returned, or None if it would block
+
+        '''
+        try:
+            result = function(*args)
+        except ssl.SSLWantReadError:
+            self._wait = 'read'
+            return None
+        except ssl.SSLWantWriteError:
+            self._wait = 'write'
+            return None
+        except socket.error as e:
+            if e.args[0] not in _IN_PROGRESS:
+                raise
+            self._wait = 'write' if self._out or self._connecting else 'read'
+            return None
+        return True if result is None else result
+
+class _Request(object):
+    def __init__(self, url, prepare, lock, timeout, stream):
+        self.url      = url
+        self.prepare  = prepare
+        self.lock     = lock
+        self.stream   = stream
+        self.future   = Future()
+        self.deadline = time.time() + timeout if timeout else None
+        self.key      = None  # The (scheme, host, port) to send to, once prepared
+        self.data     = None  # The serialized request, once prepared
+        self.holding  = False # Whether the request holds its lock
+        self.retried  = False
+
+class _Host(object):
+    def __init__(self):
+        self.idle    = []      # Idle keep-alive connections, most recently used last
+        self.open    = 0       # Connections open, idle or not
+        self.waiting = deque() # Prepared requests waiting for a connection
+
+class _Ordered(object):
+    def __init__(self, lock):
+        self.lock     = lock
+        self.pending  = deque() # Requests waiting to take the lock, in the order they were submitted
+        self.current  = None    # The request holding the lock
+        self.retrying = False   # Whether a retry of the lock is scheduled
+
+class EventLoopTransport(DeferredTransport):
+    '''Sends requests over non-blocking sockets, all driven by one event loop thread
+
+    :param max_connections: (optional) The maximum number of connections to open to each host
+    :type max_connections: int
+    :param idle_timeout: (optional) Idle keep-alive connections are closed after this many seconds
+    :type idle_timeout: float
+    :param address: (optional) The (host, port) to send every request to over plain HTTP, keeping the path of the original
+                    URL, such as the :attr:`~cryptsy.standin.StandInServer.address` of a stand-in server
+    :type address: (str, int)
+
+    :meth:`submit` returns a :class:`Future` at once. The loop thread waits on every socket with :func:`select.select`,
+    connecting, performing TLS handshakes, sending requests and reading responses as each socket becomes ready, so any
+    number of calls can be in flight without a thread each. Connections are kept alive and reused per host. Requests
+    beyond max_connections to one host wait for a connection to free up.
+
+    Requests submitted with a lock are sent one at a time per lock, in the order they were submitted. The lock is taken
+    before the request is prepared and released when the response headers arrive. The loop never blocks on it: while a
+    thread outside the loop holds it, the loop tries again every millisecond.
+
+    Responses are decoded on the loop thread. Host names are resolved once per host, and that first lookup blocks the loop.
+
+    '''
+    def __init__(self, max_connections = 16, idle_timeout = 30.0, address = None):
+        self.max_connections = max_connections #: The maximum number of connections to open to each host (int)
+        self.idle_timeout    = idle_timeout    #: Seconds a connection may sit idle before it is closed (float)
+        self.address         = address         #: The (host, port) requests are redirected to, or None
+        self._lock        = threading.Lock()
+        self._incoming    = []
+        self._timers      = []
+        self._counter     = itertools.count()
+        self._hosts       = {} # (scheme, host, port) -> _Host
+        self._ordered     = {} # lock -> _Ordered
+        self._connections = set()
+        self._addresses   = {}
+        self._closing     = False
+        self._stopped     = False
+        self._wakeup, self._waker = _wakeup_pair()
+        self._thread = threading.Thread(target = self._run, name = 'EventLoopTransport')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, url, prepare, lock = None, timeout = None, stream = False):
+        '''Queues a POST to url. Takes the parameters of :meth:`~cryptsy.transport.DeferredTransport.submit`
+
+        :rtype: :class:`Future`
+        :return: A future of the decoded JSON response, or the undecoded body if stream is True. It fails with
+                 :exc:`urllib2.HTTPError` if the server responds with an error status, or :exc:`socket.timeout` if the
+                 request does not complete within timeout
+        :raise: :exc:`ValueError` if the transport is closed
+
+        '''
+        request = _Request(url, prepare, lock, timeout, stream)
+        self.call_soon(self._enqueue, request)
+        return request.future
+
+    def call_soon(self, function, *args):
+        '''Calls function(*args) on the loop thread as soon as possible. May be called from any thread
+
+        :raise: :exc:`ValueError` if the transport is closed
+
+        '''
+        with self._lock:
+            if self._stopped:
+                raise ValueError('The transport is closed')
+            self._incoming.append((function, args))
+        self._wake()
+
+    def call_later(self, delay, function, *args):
+        '''Calls function(*args) on the loop thread once delay seconds have passed. May be called from any thread
+
+        :raise: :exc:`ValueError` if the transport is closed
+
+        '''
+        self.call_soon(self._schedule, time.time() + delay, function, args)
+
+    def close(self):
+        '''Waits for every queued request to complete, then stops the loop thread and closes all connections
+
+        '''
+        with self._lock:
+            self._closing = True
+        self._wake()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _wake(self):
+        try:
+            self._waker.send('x')
+        except socket.error:
+            pass # The wakeup socket is full, so the loop is already due to wake
+
+    def _run(self):
+        try:
+            while True:
+                self._run_incoming()
+                now = time.time()
+                while self._timers and self._timers[0][0] <= now:
+                    _, _, function, args = heapq.heappop(self._timers)
+                    self._run_safely(function, args)
+                expires = self._expire(time.time())
+                if self._closing and self._finished():
+                    break
+                readers = [self._wakeup]
+                writers = []
+                for conn in self._connections:
+                    (writers if conn.writing() else readers).append(conn)
+                if self._timers:
+                    expires = min(expires, self._timers[0][0]) if expires is not None else self._timers[0][0]
+                wait = max(expires - time.time(), 0) if expires is not None else None
+                readable, writable, failed = select.select(readers, writers, writers, wait)
+                for conn in itertools.chain(readable, writable, failed):
+                    if conn is self._wakeup:
+                        self._drain_wakeup()
+                    elif conn in self._connections:
+                        self._service(conn)
+        finally:
+            with self._lock:
+                self._stopped = True
+            error = ValueError('The transport is closed')
+            for queue in self._queues():
+                while queue:
+                    self._complete(queue.popleft(), error = error)
+            for conn in list(self._connections):
+                self._drop(conn, error)
+            self._wakeup.close()
+            self._waker.close()
+
+    def _run_incoming(self):
+        with self._lock:
+            incoming, self._incoming = self._incoming, []
+        for function, args in incoming:
+            self._run_safely(function, args)
+
+    def _run_safely(self, function, args):
+        try:
+            function(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup.recv(4096):
+                pass
+        except socket.error:
+            pass
+
+    def _schedule(self, when, function, args):
+        heapq.heappush(self._timers, (when, next(self._counter), function, args))
+
+    def _finished(self):
+        '''
+        :return: True if no work is queued, scheduled or in flight
+
+        '''
+        with self._lock:
+            if self._incoming:
+                return False
+        return (not self._timers and all(conn.request is None for conn in self._connections) and
+                not any(self._queues()) and all(ordered.current is None for ordered in self._ordered.itervalues()))
+
+    def _queues(self):
+        return [host.waiting for host in self._hosts.itervalues()] + [ordered.pending for ordered in self._ordered.itervalues()]
+
+    def _expire(self, now):
+        '''Fails every request past its deadline and closes connections idle for longer than :attr:`idle_timeout`
+
+        :return: The time the next request or idle connection will expire, or None
+
+        '''
+        soonest = None
+        for conn in list(self._connections):
+            if conn.request is None:
+                expires = conn.last_used + self.idle_timeout
+                if expires <= now:
+                    self._drop(conn)
+                    continue
+            else:
+                expires = conn.request.deadline
+                if expires is not None and expires <= now:
+                    self._drop(conn, socket.timeout('timed out'))
+                    continue
+            if expires is not None and (soonest is None or expires < soonest):
+                soonest = expires
+        for queue in self._queues():
+            for request in list(queue):
+                if request.deadline is None:
+                    continue
+                if request.deadline <= now:
+                    queue.remove(request)
+                    self._complete(request, error = socket.timeout('timed out'))
+                elif soonest is None or request.deadline < soonest:
+                    soonest = request.deadline
+        return soonest
+
+    def _enqueue(self, request):
+        if request.lock is None:
+            self._send(request)
+            return
+        ordered = self._ordered.get(request.lock)
+        if ordered is None:
+            ordered = self._ordered[request.lock] = _Ordered(request.lock)
+        ordered.pending.append(request)
+        self._pump(ordered)
+
+    def _pump(self, ordered):
+        '''Sends the next requests of a lock's queue, for as long as the lock can be taken
+
+        '''
+        while ordered.current is None and ordered.pending:
+            if not ordered.lock.acquire(False):
+                if not ordered.retrying:
+                    ordered.retrying = True
+                    self._schedule(time.time() + _LOCK_RETRY, self._retry_lock, (ordered,))
+                return
+            request = ordered.pending.popleft()
+            request.holding = True
+            ordered.current = request
+            self._send(request)
+
+    def _retry_lock(self, ordered):
+        ordered.retrying = False
+        self._pump(ordered)
+
+    def _release(self, request):
+        if not request.holding:
+            return
+        request.holding = False
+        request.lock.release()
+        ordered = self._ordered[request.lock]
+        ordered.current = None
+        self._pump(ordered)
+
+    def _send(self, request):
+        try:
+            body, headers = request.prepare()
+            self._serialize(request, body, headers)
+        except Exception as e:
+            self._complete(request, error = e)
+            return
+        self._dispatch(request)
+
+    def _serialize(self, request, body, headers):
+        parts = urlparse.urlsplit(request.url)
+        if self.address:
+            scheme, host, port = 'http', self.address[0], self.address[1]
+        else:
+            scheme, host = parts.scheme, parts.hostname
+            port         = parts.port or (443 if scheme == 'https' else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        lines = ['POST {0} HTTP/1.1'.format(path),
+                 'Host: {0}:{1}'.format(host, port),
+                 'Content-Type: application/x-www-form-urlencoded',
+                 'Content-Length: {0}'.format(len(body)),
+                 'Connection: keep-alive']
+        if headers:
+            lines.extend('{0}: {1}'.format(name, value) for name, value in headers.iteritems())
+        request.key  = (scheme, host, port)
+        request.data = '\r\n'.join(lines) + '\r\n\r\n' + body
+
+    def _dispatch(self, request):
+        host = self._hosts.get(request.key)
+        if host is None:
+            host = self._hosts[request.key] = _Host()
+        host.waiting.append(request)
+        self._next(host, request.key)
+
+    def _next(self, host, key):
+        '''Starts the requests waiting on a host, for as long as connections are available
+
+        '''
+        while host.waiting:
+            if host.idle:
+                conn = host.idle.pop()
+            elif host.open < self.max_connections:
+                try:
+                    conn = _Connection(key, self._resolve(key))
+                except Exception as e:
+                    self._complete(host.waiting.popleft(), error = e)
+                    continue
+                self._connections.add(conn)
+                host.open += 1
+            else:
+                return
+            conn.start(host.waiting.popleft())
+            if conn.reused:
+                self._service(conn) # A new connection is serviced once select reports it connected
+
+    def _resolve(self, key):
+        _, host, port = key
+        address = self._addresses.get((host, port))
+        if address is None:
+            address = self._addresses[(host, port)] = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
+        return address
+
+    def _service(self, conn):
+        '''Advances a connection and handles whatever it received
+
+        '''
+        try:
+            conn.advance()
+        except Exception as e:
+            self._drop(conn, e)
+            return
+        request = conn.request
+        if request is None:
+            if conn.eof:
+                self._drop(conn)
+            return
+        if conn.parser.status is not None:
+            self._release(request)
+        if conn.parser.done:
+            self._finish(conn)
+        elif conn.eof:
+            self._drop(conn, httplib.IncompleteRead(conn.parser.body))
+
+    def _finish(self, conn):
+        request, parser = conn.request, conn.parser
+        conn.request = conn.parser = None
+        host = self._hosts[conn.key]
+        if parser.keep_alive and not conn.eof:
+            conn.reused    = True
+            conn.last_used = time.time()
+            host.idle.append(conn)
+        else:
+            self._close(conn)
+        body = parser.body
+        if parser.status >= 400:
+            self._complete(request, error = urllib2.HTTPError(request.url, parser.status, parser.reason, parser.headers, StringIO(body)))
+        elif request.stream:
+            self._complete(request, body)
+        else:
+            try:
+                value = decoding.loads(body)
+            except Exception as e:
+                self._complete(request, error = e)
+            else:
+                self._complete(request, value)
+        self._next(host, conn.key)
+
+    def _drop(self, conn, error = None):
+        '''Closes a connection, failing its request with error. A request whose reused keep-alive connection was closed
+        before any of the response arrived is sent once more on another connection
+
+        '''
+        request = conn.request
+        conn.request = None
+        self._close(conn)
+        if request is not None:
+            stale = (conn.reused and not conn.parser.started and not request.retried and
+                     isinstance(error, (socket.error, httplib.HTTPException)) and not isinstance(error, socket.timeout))
+            if stale:
+                request.retried = True
+                self._dispatch(request)
+                return
+            self._complete(request, error = error)
+        self._next(self._hosts[conn.key], conn.key)
+
+    def _close(self, conn):
+        if conn not in self._connections:
+            return
+        self._connections.discard(conn)
+        host = self._hosts[conn.key]
+        host.open -= 1
+        if conn in host.idle:
+            host.idle.remove(conn)
+        conn.close()
+
+    def _complete(self, request, value = None, error = None):
+        self._release(request)
+        if error is not None:
+            request.future.set_exception(error)
+        else:
+            request.future.set_result(value)
+
+def _wakeup_pair():
+    '''
+    :return: A connected (reader, writer) pair of non-blocking sockets, used to wake the loop from other threads
+
+    '''
+    if hasattr(socket, 'socketpair'):
+        pair = socket.socketpair()
+    else:
+        listener = socket.socket()
+        try:
+            listener.bind(('127.0.0.1', 0))
+            listener.listen(1)
+            writer = socket.create_connection(listener.getsockname())
+            reader = listener.accept()[0]
+        finally:
+            listener.close()
+        pair = (reader, writer)
+    for sock in pair:
+        sock.setblocking(False)
+    return pair
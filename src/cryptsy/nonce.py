@@ -0,0 +1,120 @@
+'''
+.. module:: nonce
+   :platform: Linux, Windows, OSX
+   :synopsis: Nonce sources for signing private Cryptsy API calls
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import os, threading, time
+
+class NonceGenerator(object):
+    '''A thread-safe, strictly increasing nonce source with microsecond resolution
+
+    :param path: (optional) File to persist the nonce high-water mark to, so that a restarted process never reuses a nonce
+    :type path: str
+    :param reserve: (optional) How many nonces to reserve each time the high-water mark is written to disk
+    :type reserve: int
+
+    Calling the generator returns the next nonce. Nonces are seeded from the current time in microseconds and incremented
+    by at least one on every call, so any number of calls may be signed within the same second. When a path is given,
+    the generator writes out a mark :attr:`reserve` nonces ahead of the last one handed out, so the file only needs to be
+    rewritten once every :attr:`reserve` calls.
+
+    '''
+    def __init__(self, path = None, reserve = 10000):
+        self.path    = path    #: File the high-water mark is persisted to, or None (str)
+        self.reserve = reserve #: Number of nonces reserved per write of the high-water mark (int)
+        self._lock     = threading.Lock()
+        self._last     = self._load()
+        self._reserved = self._last
+
+    def __call__(self):
+        '''
+        :rtype: int
+        :return: The next nonce, which is always greater than any nonce previously returned
+
+        '''
+        with self._lock:
+            self._last = max(int(time.time()*1000000), self._last+1)
+            if self.path and self._last >= self._reserved:
+                self._reserved = self._last + self.reserve
+                self._store(self._reserved)
+            return self._last
+
+    def _load(self):
+        '''
+        :rtype: int
+        :return: The persisted high-water mark, or 0 if there isn't a usable one
+
+        '''
+        if not self.path:
+            return 0
+        # A crash between writing the new mark and renaming it into place can leave it in the temporary file
+        return max(self._read(self.path), self._read(self.path + '.tmp'))
+
+    def _read(self, path):
+        try:
+            with open(path, 'r') as f:
+                return int(f.read().strip())
+        except (IOError, ValueError):
+            return 0
+
+    def _store(self, mark):
+        '''Writes the high-water mark to a temporary file and renames it over :attr:`path`, so a crash mid-write never
+        leaves :attr:`path` empty or truncated
+
+        '''
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(str(mark))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.rename(temp_path, self.path)
+        except OSError:
+            # Windows will not rename over an existing file
+            os.remove(self.path)
+            os.rename(temp_path, self.path)
+        self._sync_directory()
+
+    def _sync_directory(self):
+        '''Flushes the rename to disk. Directories can't be opened for syncing on Windows, where this does nothing
+
+        '''
+        try:
+            fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        except (OSError, AttributeError):
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+_send_locks_lock = threading.Lock()
+_send_locks      = {}
+
+def send_lock(application_key):
+    '''Gets the lock that private calls made with an application key hold from taking their nonce until their request has
+    been written, creating it if needed
+
+    :param application_key: The application key the lock applies to
+    :type application_key: str
+    :rtype: :class:`threading.Lock`
+
+    The server rejects a nonce that is not greater than the last one it accepted for the key. Requests sent concurrently
+    over separate connections can reach it in any order, so a key's private calls are written one at a time, in nonce
+    order, and only then wait for their responses in parallel. The server is assumed to check nonces in the order requests
+    arrive; a request that overtakes an earlier one on the way is rejected. Calls made with different keys do not wait on
+    each other.
+
+    '''
+    with _send_locks_lock:
+        lock = _send_locks.get(application_key)
+        if lock is None:
+            lock = _send_locks[application_key] = threading.Lock()
+        return lock
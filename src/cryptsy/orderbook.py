@@ -0,0 +1,176 @@
+'''
+.. module:: orderbook
+   :platform: Linux, Windows, OSX
+   :synopsis: A locally maintained, incrementally updated order book
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+BID = 'bid' #: Side of a :class:`LevelChange` on the buy side
+ASK = 'ask' #: Side of a :class:`LevelChange` on the sell side
+
+ADDED   = 'added'   #: A new price level appeared
+CHANGED = 'changed' #: The quantity at an existing price level changed
+REMOVED = 'removed' #: A price level disappeared
+
+class LevelChange(namedtuple('LevelChange', ('side', 'action', 'price', 'quantity', 'previous'))):
+    '''A change to one price level of an :class:`OrderBook`
+
+    :ivar side: :data:`BID` or :data:`ASK`
+    :ivar action: :data:`ADDED`, :data:`CHANGED` or :data:`REMOVED`
+    :ivar price: The price of the level (float)
+    :ivar quantity: The quantity now at the level, 0.0 if it was removed (float)
+    :ivar previous: The quantity at the level before the change, 0.0 if it was added (float)
+
+    '''
+    __slots__ = ()
+
+class _Side(object):
+    '''One side of an :class:`OrderBook`: a map of price to quantity plus an ascending list of the prices
+
+    '''
+    def __init__(self, side):
+        self.side       = side
+        self.quantities = dict()
+        self.prices     = []
+
+    def replace(self, levels):
+        '''Replaces the levels of this side with a new snapshot
+
+        :param levels: The (price, quantity) pairs of the snapshot. Quantities at the same price are summed, and a level
+                       whose quantity comes to zero is left out, as if it were not in the snapshot
+        :rtype: [:class:`LevelChange`, ...]
+        :return: The changes needed to turn the old levels into the snapshot
+
+        '''
+        snapshot = dict()
+        for price, quantity in levels:
+            snapshot[price] = snapshot.get(price, 0.0) + quantity
+        for price, quantity in snapshot.items():
+            if quantity <= 0:
+                del snapshot[price]
+
+        changes = []
+        for price, previous in self.quantities.items():
+            if price not in snapshot:
+                del self.quantities[price]
+                del self.prices[bisect_left(self.prices, price)]
+                changes.append(LevelChange(self.side, REMOVED, price, 0.0, previous))
+        for price, quantity in snapshot.iteritems():
+            previous = self.quantities.get(price)
+            if previous is None:
+                insort(self.prices, price)
+                changes.append(LevelChange(self.side, ADDED, price, quantity, 0.0))
+            elif previous != quantity:
+                changes.append(LevelChange(self.side, CHANGED, price, quantity, previous))
+            else:
+                continue
+            self.quantities[price] = quantity
+        return changes
+
+class OrderBook(object):
+    '''An order book for one market, kept up to date by diffing each new poll of the market against the current state
+
+    :param market: (optional) The market ID this book is for
+    :type market: int
+
+    Prices on each side are kept sorted, so the best bid and ask are read in constant time, and levels are found by
+    binary search when they are added or removed. Each update works out which levels were added, changed or removed,
+    returns them as :class:`LevelChange` events and passes them to any registered listeners.
+
+    '''
+    def __init__(self, market = None):
+        self.market    = market #: The market ID this book is for (int)
+        self.listeners = []     #: Callables which are passed the list of :class:`LevelChange` events of each update that changed the book
+        self._bids = _Side(BID)
+        self._asks = _Side(ASK)
+
+    def update(self, bids, asks):
+        '''Replaces the contents of the book with a new snapshot
+
+        :param bids: The (price, quantity) pairs of the buy side
+        :type bids: [(float, float), ...]
+        :param asks: The (price, quantity) pairs of the sell side
+        :type asks: [(float, float), ...]
+        :rtype: [:class:`LevelChange`, ...]
+        :return: The levels that changed. The first update of an empty book reports every level as added
+
+        '''
+        changes = self._bids.replace(bids) + self._asks.replace(asks)
+        if changes:
+            for listener in self.listeners:
+                listener(changes)
+        return changes
+
+    def update_from_depth(self, data):
+        '''Updates the book from the data returned by :meth:`cryptsy.managed_api.ManagedAPI.depth`
+
+        :param data: The raw depth data
+        :rtype: [:class:`LevelChange`, ...]
+        :raise: :exc:`ValueError` if the data is malformed
+
+        '''
+        try:
+            bids = [(float(price), float(quantity)) for price, quantity in data['buy']]
+            asks = [(float(price), float(quantity)) for price, quantity in data['sell']]
+        except KeyError as e:
+            raise ValueError('Mallformed Depth Data, missing field:'+str(e))
+        return self.update(bids, asks)
+
+    def update_from_market_orders(self, orders):
+        '''Updates the book from the data returned by :meth:`cryptsy.managed_api.ManagedAPI.market_orders`
+
+        :param orders: The (buy orders, sell orders) tuple of :class:`~cryptsy.managed_api.MarketOrderData` lists
+        :rtype: [:class:`LevelChange`, ...]
+
+        '''
+        buy_orders, sell_orders = orders
+        return self.update([(order.price, order.quantity) for order in buy_orders],
+                           [(order.price, order.quantity) for order in sell_orders])
+
+    @property
+    def best_bid(self):
+        '''The (price, quantity) of the highest bid, or None if there are no bids
+
+        '''
+        if not self._bids.prices:
+            return None
+        price = self._bids.prices[-1]
+        return (price, self._bids.quantities[price])
+
+    @property
+    def best_ask(self):
+        '''The (price, quantity) of the lowest ask, or None if there are no asks
+
+        '''
+        if not self._asks.prices:
+            return None
+        price = self._asks.prices[0]
+        return (price, self._asks.quantities[price])
+
+    def bids(self, depth = None):
+        '''
+        :param depth: (optional) The maximum number of levels to return
+        :type depth: int
+        :rtype: [(float, float), ...]
+        :return: The (price, quantity) levels of the buy side, highest price first
+
+        '''
+        prices = self._bids.prices[::-1] if depth is None else self._bids.prices[:-depth-1:-1]
+        return [(price, self._bids.quantities[price]) for price in prices]
+
+    def asks(self, depth = None):
+        '''
+        :param depth: (optional) The maximum number of levels to return
+        :type depth: int
+        :rtype: [(float, float), ...]
+        :return: The (price, quantity) levels of the sell side, lowest price first
+
+        '''
+        prices = self._asks.prices if depth is None else self._asks.prices[:depth]
+        return [(price, self._asks.quantities[price]) for price in prices]
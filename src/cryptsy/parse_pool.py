@@ -0,0 +1,222 @@
+'''
+.. module:: parse_pool
+   :platform: Linux, Windows, OSX
+   :synopsis: Parsing of large all-markets responses in worker processes, off the calling interpreter's GIL
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Pass a pool to :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data` or
+:meth:`~cryptsy.managed_api.ManagedAPI.general_orderbook_data` to have that call's response parsed in it::
+
+    with ParsePool(2) as pool:
+        markets = api.general_market_data(parse_pool = pool)
+
+The calling process only reads the response body, hands it to a worker, and unpacks the compact result. The worker
+decodes the JSON and packs every market's trades and orders as columns of one float64 buffer, so the result crosses
+back as a single byte string plus one small tuple per market. Such calls return :class:`PackedMarketData` rather than
+the usual containers.
+
+A call parsed in the pool takes longer than one parsed in-process, since the body and the result are copied between
+processes. What it saves is the time the calling process spends holding the GIL, during which none of its other
+threads can run. Use it for the large all-markets polls of processes whose other threads must stay responsive, such as
+ones placing orders. ``bench/parse_stall.py`` measures both effects.
+
+'''
+from multiprocessing import Pool
+from array import array
+from operator import itemgetter
+from managed_api import APIError, MarketData, MarketOrderData, MarketTradeData
+from decoding import number_columns
+import decoding, fixed_point
+
+_SECTIONS = ('recent_trades', 'sell_orders', 'buy_orders') # The order of the packed sections of each market
+
+class _PackedList(object):
+    '''Descriptor which builds a list of container objects from the packed columns of a :class:`PackedMarketData` the
+    first time it is read, then replaces itself on the instance with the built list
+
+    '''
+    def __init__(self, name, build):
+        self.name  = name
+        self.build = build
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__.setdefault(self.name, self.build(instance))
+
+def _build_trades(market):
+    prices, quantities, totals = market.columns('recent_trades')
+    new    = MarketTradeData.__new__
+    trades = []
+    for price, quantity, total, trade_id, time in zip(prices, quantities, totals, market.trade_ids, market._trade_times):
+        trade = new(MarketTradeData)
+        trade.total    = total
+        trade.price    = price
+        trade.quantity = quantity
+        trade.trade_id = trade_id
+        trade.time     = time
+        trades.append(trade)
+    return trades
+
+def _build_orders(side):
+    def build(market):
+        prices, quantities, totals = market.columns(side)
+        new    = MarketOrderData.__new__
+        orders = []
+        for price, quantity, total in zip(prices, quantities, totals):
+            order = new(MarketOrderData)
+            order.price    = price
+            order.total    = total
+            order.quantity = quantity
+            orders.append(order)
+        return orders
+    return build
+
+class PackedMarketData(MarketData):
+    '''Market data unpacked from the result of a :class:`ParsePool`
+
+    It has the attributes of :class:`~cryptsy.managed_api.MarketData`. :attr:`recent_trades`, :attr:`sell_orders` and
+    :attr:`buy_orders` are built from the packed columns the first time they are read, and :meth:`columns` reads the
+    columns without building any objects. Markets from an orderbook response have no trades, and their
+    :attr:`last_trade_time`, :attr:`last_trade_price` and :attr:`volume` are None.
+
+    '''
+    recent_trades = _PackedList('recent_trades', _build_trades)              #: List of recent trades ([class:`~cryptsy.managed_api.MarketTradeData`, ...])
+    sell_orders   = _PackedList('sell_orders', _build_orders('sell_orders')) #: List of open sell orders ([:class:`~cryptsy.managed_api.MarketOrderData`, ...])
+    buy_orders    = _PackedList('buy_orders', _build_orders('buy_orders'))   #: List of open buy orders ([:class:`~cryptsy.managed_api.MarketOrderData`, ...])
+
+    def __init__(self, record, values):
+        (self.label, self.market_id, self.primary_code, self.primary_name, self.secondary_code, self.secondary_name,
+         self.last_trade_time, self.last_trade_price, self.volume, self.trade_ids, self._trade_times, self._sections) = record
+        self._values = values
+
+    def columns(self, name):
+        '''
+        :param name: 'recent_trades', 'sell_orders' or 'buy_orders'
+        :type name: str
+        :rtype: (array, array, array)
+        :return: The price, quantity and total columns. They are :class:`array.array` of float64, or lists of ints in
+                 fixed-point mode. The trade IDs are in :attr:`trade_ids`
+        :raise: :exc:`KeyError` if name is not one of the three
+
+        '''
+        if name not in _SECTIONS:
+            raise KeyError(name)
+        offset, count = self._sections[_SECTIONS.index(name)]
+        values = self._values
+        return (values[offset:offset + count], values[offset + count:offset + 2*count], values[offset + 2*count:offset + 3*count])
+
+class ParsePool(object):
+    '''A pool of worker processes which parse all-markets responses
+
+    :param processes: (optional) The number of worker processes. Defaults to the number of CPUs
+
+    Each response is decoded and packed by one worker; concurrent calls are spread across the workers. The pool must be
+    created before any threads are started, and closed when no longer needed.
+
+    '''
+    def __init__(self, processes = None):
+        self._pool = Pool(processes)
+
+    def close(self):
+        '''Waits for any parsing in progress to finish and stops the worker processes
+
+        '''
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def market_data(self, body, fixed_point = False):
+        '''Parses a marketdatav2 or singlemarketdata response
+
+        :param body: The undecoded response body
+        :type body: str
+        :param fixed_point: (optional) If True, numbers are parsed into exact integer units by :func:`cryptsy.fixed_point.parse`
+        :type fixed_point: bool
+        :rtype: dict(str, :class:`PackedMarketData`)
+        :return: A dictionary mapping a market label to its market data
+        :raise: :exc:`~cryptsy.managed_api.APIError` if the API reported an error, :exc:`ValueError` if the data is malformed
+
+        '''
+        return self._parse(body, fixed_point)
+
+    def orderbook_data(self, body, fixed_point = False):
+        '''Parses an orderdata or singleorderdata response
+
+        :param body: The undecoded response body
+        :type body: str
+        :param fixed_point: (optional) If True, numbers are parsed into exact integer units by :func:`cryptsy.fixed_point.parse`
+        :type fixed_point: bool
+        :rtype: dict(str, :class:`PackedMarketData`)
+        :return: A dictionary mapping each key of the response to that market's orders
+        :raise: :exc:`~cryptsy.managed_api.APIError` if the API reported an error, :exc:`ValueError` if the data is malformed
+
+        '''
+        return self._parse(body, fixed_point)
+
+    def _parse(self, body, fixed_point):
+        error, records, packed = self._pool.apply(_pack, (body, fixed_point))
+        if error is not None:
+            raise APIError(error)
+        if fixed_point:
+            values = packed
+        else:
+            values = array('d')
+            values.fromstring(packed)
+        return dict((record[0], PackedMarketData(record, values)) for record in records)
+
+def _pack(body, fixed):
+    '''Runs in a worker process. Decodes a response and packs every market in it
+
+    :rtype: (str, [tuple, ...], str or list)
+    :return: The API error, or None. Then one record per market, and the float64 buffer as a string, or a list of ints if fixed is True
+
+    '''
+    envelope = decoding.loads(body)
+    if int(envelope.get('success', 0)) != 1:
+        return envelope.get('error'), None, None
+    data    = envelope['return']
+    markets = data['markets'] if 'markets' in data else data
+    number  = fixed_point.parse if fixed else float
+    values  = []
+    records = []
+    try:
+        for key, entry in markets.iteritems():
+            trades   = entry.get('recenttrades', [])
+            sections = (_pack_section(values, trades, 'price', number),
+                        _pack_section(values, entry['sellorders'], _price_key(entry['sellorders']), number),
+                        _pack_section(values, entry['buyorders'], _price_key(entry['buyorders']), number))
+            records.append((key, int(entry['marketid']), entry['primarycode'], entry['primaryname'],
+                            entry['secondarycode'], entry['secondaryname'], entry.get('lasttradetime'),
+                            number(entry['lasttradeprice']) if 'lasttradeprice' in entry else None,
+                            number(entry['volume']) if 'volume' in entry else None,
+                            map(int, map(itemgetter('id'), trades)), map(itemgetter('time'), trades), sections))
+    except KeyError as e:
+        raise ValueError('Mallformed Market Data, missing field:'+str(e))
+    return None, records, values if fixed else array('d', values).tostring()
+
+def _pack_section(values, entries, price_key, number):
+    '''Appends the price, quantity and total columns of entries to values
+
+    :rtype: (int, int)
+    :return: The offset of the columns in values and the number of entries
+
+    '''
+    offset = len(values)
+    for column in number_columns(entries, (price_key, 'quantity', 'total'), number):
+        values.extend(column)
+    return (offset, len(entries))
+
+def _price_key(entries):
+    if not entries:
+        return 'price'
+    first = entries[0]
+    return 'price' if 'price' in first else 'sellprice' if 'sellprice' in first else 'buyprice'
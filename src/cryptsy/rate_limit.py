@@ -0,0 +1,149 @@
+'''
+.. module:: rate_limit
+   :platform: Linux, Windows, OSX
+   :synopsis: Client-side rate limiting of Cryptsy API calls
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import heapq, itertools, threading, time
+import instrumentation
+
+PRIORITY_ORDER   = 0 #: Priority of calls which create or cancel orders
+PRIORITY_ACCOUNT = 1 #: Priority of private calls which read account or market state
+PRIORITY_POLL    = 2 #: Priority of public market data polls
+
+class RateLimiter(object):
+    '''A thread-safe token bucket which hands out tokens in priority order
+
+    :param rate: The number of calls per second to allow on average
+    :type rate: float
+    :param burst: The maximum number of calls which may be made back to back after the limiter has been idle
+    :type burst: int
+
+    Callers block in :meth:`acquire` until a token is available. When several callers are waiting, the one with the lowest
+    priority value goes first, and callers with equal priority go in the order they arrived.
+
+    Priority only orders the handing out of tokens. Private calls then take the :func:`~cryptsy.nonce.send_lock` of their
+    key, which is not fair and ignores priority. It is only held while a request is signed and written, so the wait for
+    it is short next to the wait for a token.
+
+    '''
+    def __init__(self, rate = 5.0, burst = 10):
+        self.rate       = float(rate) #: Tokens added to the bucket per second (float)
+        self.burst      = burst       #: The capacity of the bucket (int)
+        self.acquired   = 0           #: The number of tokens handed out (int)
+        self.total_wait = 0.0         #: The total time callers have spent queued, in seconds (float)
+        self.max_wait   = 0.0         #: The longest time a single caller has spent queued, in seconds (float)
+        self._cond    = threading.Condition()
+        self._tokens  = float(burst)
+        self._updated = time.time()
+        self._waiters = []
+        self._counter = itertools.count()
+
+    def acquire(self, priority = PRIORITY_ACCOUNT):
+        '''Blocks until a token is available for a call of the given priority and takes it
+
+        :param priority: The priority of the call. Lower values go first
+        :type priority: int
+        :rtype: float
+        :return: The time spent waiting for the token, in seconds
+
+        '''
+        start  = time.time()
+        waiter = (priority, next(self._counter))
+        with self._cond:
+            heapq.heappush(self._waiters, waiter)
+            while True:
+                self._refill()
+                if self._waiters[0] == waiter:
+                    if self._tokens >= 1:
+                        break
+                    self._cond.wait((1 - self._tokens)/self.rate)
+                else:
+                    self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            waited = time.time() - start
+            self.acquired   += 1
+            self.total_wait += waited
+            self.max_wait    = max(self.max_wait, waited)
+            self._cond.notify_all()
+        record = instrumentation.current()
+        if record is not None:
+            record.add(instrumentation.THROTTLE, waited)
+        return waited
+
+    def try_acquire(self, priority = PRIORITY_ACCOUNT, since = None):
+        '''Takes a token without blocking, if one is available and no caller of the same or a more urgent priority is
+        waiting in :meth:`acquire`
+
+        :param priority: The priority of the call. Lower values go first
+        :type priority: int
+        :param since: (optional) The time the caller started waiting for a token, counted as its wait if one is taken
+        :type since: float
+        :rtype: float
+        :return: 0.0 if a token was taken, otherwise the number of seconds until one is expected to be available
+
+        '''
+        with self._cond:
+            self._refill()
+            if self._tokens < 1 or any(waiter[0] <= priority for waiter in self._waiters):
+                return max((1 - self._tokens)/self.rate, 0.001)
+            self._tokens -= 1
+            waited = time.time() - since if since is not None else 0.0
+            self.acquired   += 1
+            self.total_wait += waited
+            self.max_wait    = max(self.max_wait, waited)
+            return 0.0
+
+    @property
+    def mean_wait(self):
+        '''The mean time callers have spent queued for a token, in seconds (float)
+
+        '''
+        return self.total_wait/self.acquired if self.acquired else 0.0
+
+    @property
+    def queued(self):
+        '''The number of callers currently waiting for a token (int)
+
+        '''
+        return len(self._waiters)
+
+    @property
+    def available(self):
+        '''The number of tokens in the bucket right now, which may be fractional (float)
+
+        '''
+        with self._cond:
+            self._refill()
+            return self._tokens
+
+    def _refill(self):
+        now = time.time()
+        self._tokens  = min(self.burst, self._tokens + (now - self._updated)*self.rate)
+        self._updated = now
+
+_shared_lock     = threading.Lock()
+_shared_limiters = {}
+
+def shared_limiter(application_key, rate = 5.0, burst = 10):
+    '''Gets the :class:`RateLimiter` shared by every caller using an application key, creating it if needed
+
+    :param application_key: The application key the limiter applies to
+    :type application_key: str
+    :param rate: The rate to create the limiter with, if it doesn't exist yet
+    :type rate: float
+    :param burst: The burst size to create the limiter with, if it doesn't exist yet
+    :type burst: int
+    :rtype: :class:`RateLimiter`
+
+    '''
+    with _shared_lock:
+        limiter = _shared_limiters.get(application_key)
+        if limiter is None:
+            limiter = _shared_limiters[application_key] = RateLimiter(rate, burst)
+        return limiter
@@ -0,0 +1,91 @@
+'''
+.. module:: signing
+   :platform: Linux, Windows, OSX
+   :synopsis: Fast encoding and signing of private API requests
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import hashlib, hmac, threading, urllib
+
+class Signer(object):
+    '''Signs request bodies with HMAC-SHA512 under one secret key
+
+    :param secret_key: The user's secret key
+    :type secret_key: str
+
+    The key is padded and hashed into the inner and outer HMAC states once, when the signer is created. Each signature
+    starts from a copy of those states instead of keying a new HMAC from scratch. A signer can be passed anywhere
+    :mod:`cryptsy.bare_api` takes a secret key.
+
+    '''
+    __slots__ = ('_hmac',)
+
+    def __init__(self, secret_key):
+        self._hmac = hmac.new(secret_key, digestmod = hashlib.sha512)
+
+    def sign(self, body):
+        '''
+        :param body: The url-encoded request body
+        :type body: str
+        :rtype: str
+        :return: The hex HMAC-SHA512 of the body
+
+        '''
+        mac = self._hmac.copy()
+        mac.update(body)
+        return mac.hexdigest()
+
+class RequestTemplate(object):
+    '''Encodes the body of one kind of private API request
+
+    :param method: The API method the request calls
+    :type method: str
+    :param fields: The names of the input fields, in the order their values will be given
+    :type fields: (str, ...)
+
+    The field names and method are quoted once, so encoding a request only quotes its values and nonce. The body is
+    identical to url-encoding the inputs followed by the method and nonce.
+
+    '''
+    __slots__ = ('method', 'fields', '_prefixes', '_suffix')
+
+    def __init__(self, method, fields):
+        self.method     = method        #: The API method the request calls (str)
+        self.fields     = tuple(fields) #: The names of the input fields ((str, ...))
+        self._prefixes  = tuple(urllib.quote_plus(str(field)) + '=' for field in self.fields)
+        self._suffix    = '{0}method={1}&nonce='.format('&' if self.fields else '', urllib.quote_plus(method))
+
+    def encode(self, values, nonce):
+        '''
+        :param values: The value of each field, in the order of :attr:`fields`
+        :param nonce: The nonce of the request
+        :type nonce: int
+        :rtype: str
+        :return: The url-encoded request body
+
+        '''
+        quote = urllib.quote_plus
+        return '&'.join([prefix + quote(str(value)) for prefix, value in zip(self._prefixes, values)]) + self._suffix + str(nonce)
+
+_templates      = dict()
+_templates_lock = threading.Lock()
+
+def template(method, fields):
+    '''Gets the shared :class:`RequestTemplate` for a method and its fields, creating it if needed
+
+    :param method: The API method the request calls
+    :type method: str
+    :param fields: The names of the input fields
+    :type fields: (str, ...)
+    :rtype: :class:`RequestTemplate`
+
+    '''
+    key = (method, fields)
+    found = _templates.get(key)
+    if found is None:
+        with _templates_lock:
+            found = _templates.setdefault(key, RequestTemplate(method, fields))
+    return found
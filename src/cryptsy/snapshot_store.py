@@ -0,0 +1,335 @@
+'''
+.. module:: snapshot_store
+   :platform: Linux, Windows, OSX
+   :synopsis: Append-only on-disk recording and memory-mapped replay of market data polls
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+File format, all little-endian::
+
+    file      := MAGIC snapshot*
+    snapshot  := header index market*
+    header    := '<4sdIIII' b'SNAP', unix timestamp, market count, length of index + markets in bytes, flags, scale
+    index     := '<II'     market ID, offset of the market from the start of the index; one per market
+    market    := '<IHddIII' market ID, label length, last trade price, volume, trade count, buy order count, sell order
+                 count, then the UTF-8 label, then the trades, buy orders and sell orders as float64 records of
+                 (trade ID, price, quantity, total) and (price, quantity, total)
+
+If the :data:`FIXED_POINT` flag is set, the last trade price, volume and every record field are int64 counts of
+1/scale instead (``'<IHqqIII'`` for the market), as :mod:`cryptsy.fixed_point` units are. Otherwise the scale is 1.
+
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+from fixed_point import SCALE
+import mmap, struct, sys, time
+
+MAGIC = 'CRYSNAP2' #: Marks the start of a snapshot file
+
+FIXED_POINT = 1 #: Header flag set on snapshots whose amounts are integer units
+
+_HEADER       = struct.Struct('<4sdIIII')
+_INDEX        = struct.Struct('<II')
+_MARKET       = struct.Struct('<IHddIII')
+_FIXED_MARKET = struct.Struct('<IHqqIII')
+_TRADE_FIELDS = 4
+_ORDER_FIELDS = 3
+_SWAP = sys.byteorder != 'little'
+
+def _doubles(values):
+    values = array('d', values)
+    if _SWAP:
+        values.byteswap()
+    return values.tostring()
+
+def _integers(values):
+    return struct.pack('<{0}q'.format(len(values)), *values)
+
+def _is_units(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool)
+
+class SnapshotWriter(object):
+    '''Appends market data snapshots to a file
+
+    :param path: The file to append to. It is created if it doesn't exist
+    :type path: str
+
+    Each snapshot is written with a single call and flushed, so a reader never sees a partially written snapshot unless
+    the process dies mid-write.
+
+    '''
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._file.flush()
+        else:
+            with open(path, 'rb') as existing:
+                if existing.read(len(MAGIC)) != MAGIC:
+                    self._file.close()
+                    raise ValueError('Not a snapshot file of this version: '+path)
+
+    def close(self):
+        self._file.close()
+
+    def record_market_data(self, snapshot, timestamp = None):
+        '''Appends an all-markets snapshot
+
+        :param snapshot: A dict mapping market label to :class:`~cryptsy.managed_api.MarketData`, as returned by
+                         :meth:`~cryptsy.managed_api.ManagedAPI.general_market_data`, or an iterable of (label, market data) pairs
+        :param timestamp: (optional) The unix time of the snapshot. Defaults to now
+        :type timestamp: float
+        :raise: :exc:`ValueError` if some markets hold fixed-point units and others floats
+
+        A snapshot of fixed-point market data, from a :class:`~cryptsy.managed_api.ManagedAPI` made with
+        ``fixed_point = True``, is stored as integer units and flagged :data:`FIXED_POINT`, so it replays exactly.
+
+        '''
+        items   = snapshot.iteritems() if isinstance(snapshot, dict) else snapshot
+        markets = []
+        kinds   = set()
+        for label, market_data in items:
+            kinds.add(_is_units(market_data.volume))
+            trades = []
+            for trade in market_data.recent_trades:
+                trades.extend((trade.trade_id, trade.price, trade.quantity, trade.total))
+            markets.append((market_data.market_id, label, market_data.last_trade_price, market_data.volume,
+                            trades, self._orders(market_data.buy_orders), self._orders(market_data.sell_orders)))
+        if len(kinds) > 1:
+            raise ValueError('A snapshot cannot mix fixed-point and float market data')
+        self._write(timestamp, markets, True in kinds)
+
+    def record_depth(self, market, data, timestamp = None):
+        '''Appends a single-market depth snapshot. The last trade price and volume are recorded as NaN
+
+        :param market: The market ID the depth is for
+        :type market: int
+        :param data: The raw depth data returned by :meth:`~cryptsy.managed_api.ManagedAPI.depth`
+        :param timestamp: (optional) The unix time of the snapshot. Defaults to now
+        :type timestamp: float
+
+        '''
+        buys  = []
+        sells = []
+        for levels, out in ((data['buy'], buys), (data['sell'], sells)):
+            for price, quantity in levels:
+                price    = float(price)
+                quantity = float(quantity)
+                out.extend((price, quantity, price*quantity))
+        self._write(timestamp, [(market, '', float('nan'), float('nan'), [], buys, sells)])
+
+    def _orders(self, orders):
+        values = []
+        for order in orders:
+            values.extend((order.price, order.quantity, order.total))
+        return values
+
+    def _write(self, timestamp, markets, fixed_point = False):
+        market_struct, pack = (_FIXED_MARKET, _integers) if fixed_point else (_MARKET, _doubles)
+        blocks = []
+        index  = []
+        offset = _INDEX.size*len(markets)
+        for market_id, label, last_trade_price, volume, trades, buys, sells in markets:
+            label = label.encode('utf-8') if isinstance(label, unicode) else label
+            block = ''.join((market_struct.pack(market_id, len(label), last_trade_price, volume,
+                                                len(trades)//_TRADE_FIELDS, len(buys)//_ORDER_FIELDS, len(sells)//_ORDER_FIELDS),
+                             label, pack(trades), pack(buys), pack(sells)))
+            index.append(_INDEX.pack(market_id, offset))
+            blocks.append(block)
+            offset += len(block)
+        body   = ''.join(index + blocks)
+        header = _HEADER.pack('SNAP', time.time() if timestamp is None else timestamp, len(markets), len(body),
+                              FIXED_POINT if fixed_point else 0, SCALE if fixed_point else 1)
+        self._file.write(header + body)
+        self._file.flush()
+
+class MarketSnapshot(object):
+    '''A view of one market in a recorded snapshot. Trades and orders are read out of the mapped file on first access
+
+    In a fixed-point snapshot, every amount is an int count of 1/:attr:`Snapshot.scale` rather than a float.
+
+    '''
+    def __init__(self, buf, offset, fixed_point = False):
+        market_struct = _FIXED_MARKET if fixed_point else _MARKET
+        market_id, length, last_trade_price, volume, n_trades, n_buys, n_sells = market_struct.unpack_from(buf, offset)
+        start = offset + market_struct.size
+        self.market_id        = market_id                                 #: The market ID (int)
+        self.label            = buf[start:start + length].decode('utf-8') #: The market label (unicode)
+        self.last_trade_price = last_trade_price                          #: The last trade price, NaN for depth snapshots (float)
+        self.volume           = volume                                    #: The market trade volume, NaN for depth snapshots (float)
+        start += length
+        self._fixed_point = fixed_point
+        self._spans = []
+        for count, fields in ((n_trades, _TRADE_FIELDS), (n_buys, _ORDER_FIELDS), (n_sells, _ORDER_FIELDS)):
+            end = start + count*fields*8
+            self._spans.append((start, end))
+            start = end
+        self._buf = buf
+
+    @property
+    def recent_trades(self):
+        '''The recent trades as (trade ID, price, quantity, total) tuples ([(int, float, float, float), ...])
+
+        '''
+        values = self._read(0)
+        return [(int(values[i]), values[i+1], values[i+2], values[i+3]) for i in xrange(0, len(values), _TRADE_FIELDS)]
+
+    @property
+    def buy_orders(self):
+        '''The buy orders as (price, quantity, total) tuples ([(float, float, float), ...])
+
+        '''
+        values = self._read(1)
+        return zip(values[0::3], values[1::3], values[2::3])
+
+    @property
+    def sell_orders(self):
+        '''The sell orders as (price, quantity, total) tuples ([(float, float, float), ...])
+
+        '''
+        values = self._read(2)
+        return zip(values[0::3], values[1::3], values[2::3])
+
+    def _read(self, span):
+        start, end = self._spans[span]
+        if self._fixed_point:
+            return struct.unpack_from('<{0}q'.format((end - start)//8), self._buf, start)
+        values = array('d')
+        values.fromstring(self._buf[start:end])
+        if _SWAP:
+            values.byteswap()
+        return values
+
+class Snapshot(object):
+    '''A view of one recorded snapshot
+
+    '''
+    def __init__(self, buf, offset):
+        _, timestamp, count, _, flags, scale = _HEADER.unpack_from(buf, offset)
+        self.timestamp   = timestamp                 #: The unix time of the snapshot (float)
+        self.fixed_point = bool(flags & FIXED_POINT) #: Whether amounts are integer units rather than floats (bool)
+        self.scale       = scale                     #: Units per whole coin, 1 unless :attr:`fixed_point` (int)
+        self._buf   = buf
+        self._base  = offset + _HEADER.size
+        self._count = count
+
+    def market_ids(self):
+        '''
+        :rtype: [int, ...]
+        :return: The IDs of the markets in the snapshot, in recorded order
+
+        '''
+        return [_INDEX.unpack_from(self._buf, self._base + i*_INDEX.size)[0] for i in xrange(self._count)]
+
+    def markets(self):
+        '''
+        :rtype: generator of :class:`MarketSnapshot`
+
+        '''
+        for i in xrange(self._count):
+            _, offset = _INDEX.unpack_from(self._buf, self._base + i*_INDEX.size)
+            yield MarketSnapshot(self._buf, self._base + offset, self.fixed_point)
+
+    def market(self, market_id):
+        '''
+        :param market_id: The market to look up
+        :type market_id: int
+        :rtype: :class:`MarketSnapshot`
+        :return: The market's data, or None if it isn't in the snapshot
+
+        '''
+        for i in xrange(self._count):
+            found, offset = _INDEX.unpack_from(self._buf, self._base + i*_INDEX.size)
+            if found == market_id:
+                return MarketSnapshot(self._buf, self._base + offset, self.fixed_point)
+        return None
+
+class SnapshotReader(object):
+    '''Memory-maps a snapshot file for replay
+
+    :param path: The file written by a :class:`SnapshotWriter`
+    :type path: str
+    :raise: :exc:`ValueError` if the file is not a snapshot file
+
+    Opening the file only walks the snapshot headers to build a timestamp index. Market data is read out of the mapping
+    as it is accessed, so replaying a range of a large file does not load the whole file. Snapshots appended after the
+    file was opened are picked up by :meth:`refresh`. A partially written snapshot at the end of the file is ignored.
+    Snapshots read before a refresh keep the mapping they were read from, which is released once none of them are left.
+
+    '''
+    def __init__(self, path):
+        self._file       = open(path, 'rb')
+        self._map        = None
+        self._timestamps = []
+        self._offsets    = []
+        self._sorted     = True # Whether the timestamps are in non-decreasing order, so ranges can be found by bisection
+        self.refresh()
+
+    def refresh(self):
+        '''Re-maps the file and indexes any snapshots appended since it was last mapped
+
+        '''
+        self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a snapshot file of this version')
+        offset = self._offsets[-1] if self._offsets else len(MAGIC)
+        if self._offsets:
+            offset += _HEADER.size + _HEADER.unpack_from(self._map, offset)[3]
+        while offset + _HEADER.size <= len(self._map):
+            _, timestamp, _, length, _, _ = _HEADER.unpack_from(self._map, offset)
+            if offset + _HEADER.size + length > len(self._map):
+                break
+            if self._timestamps and timestamp < self._timestamps[-1]:
+                self._sorted = False
+            self._timestamps.append(timestamp)
+            self._offsets.append(offset)
+            offset += _HEADER.size + length
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def snapshots(self, start = None, end = None):
+        '''
+        :param start: (optional) Only yield snapshots at or after this unix time
+        :type start: float
+        :param end: (optional) Only yield snapshots at or before this unix time
+        :type end: float
+        :rtype: generator of :class:`Snapshot`
+        :return: The snapshots in the range, in the order they were written
+
+        A file whose timestamps only increase is searched by bisection. If a snapshot was written with an earlier
+        timestamp than the one before it, such as after the clock was set back, every snapshot is checked instead.
+
+        '''
+        if self._sorted:
+            first = 0 if start is None else bisect_left(self._timestamps, start)
+            last  = len(self._offsets) if end is None else bisect_right(self._timestamps, end)
+            for i in xrange(first, last):
+                yield Snapshot(self._map, self._offsets[i])
+            return
+        for i, timestamp in enumerate(self._timestamps):
+            if (start is None or timestamp >= start) and (end is None or timestamp <= end):
+                yield Snapshot(self._map, self._offsets[i])
+
+    def market_history(self, market_id, start = None, end = None):
+        '''
+        :param market_id: The market to replay
+        :type market_id: int
+        :param start: (optional) Only yield snapshots at or after this unix time
+        :type start: float
+        :param end: (optional) Only yield snapshots at or before this unix time
+        :type end: float
+        :rtype: generator of (float, :class:`MarketSnapshot`)
+        :return: (timestamp, market data) for every snapshot in the range that contains the market
+
+        '''
+        for snapshot in self.snapshots(start, end):
+            market = snapshot.market(market_id)
+            if market is not None:
+                yield snapshot.timestamp, market
@@ -0,0 +1,226 @@
+'''
+.. module:: standin
+   :platform: Linux, Windows, OSX
+   :synopsis: A local HTTP server that stands in for the Cryptsy API, replaying recorded responses
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+Record real responses by sending calls over a :class:`~cryptsy.transport.RecordingTransport`, then replay them offline::
+
+    with StandInServer(recordings = 'calls.jsonl', secret_keys = {'key':'secret'}, latency = 0.05) as server:
+        api = ManagedAPI('key', 'secret', transport = server.transport())
+
+'''
+from transport import RedirectTransport
+import BaseHTTPServer, SocketServer, urlparse
+import hashlib, hmac, json, random, threading, time
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version        = 'HTTP/1.1'
+    wbufsize                = -1   # Send each response in one write, not one per header line
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body   = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status, data = self.server.respond(urlparse.urlsplit(self.path).path, body, self.headers)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''Serves recorded API responses on a local port, with configurable latency, jitter and error injection
+
+    :param recordings: (optional) The file written by a :class:`~cryptsy.transport.RecordingTransport` to replay
+    :type recordings: str
+    :param secret_keys: (optional) Maps each accepted application key to its secret key. Private calls made with any
+                        other key are rejected. If None, private calls are not authenticated
+    :type secret_keys: dict(str, str)
+    :param latency: (optional) Seconds to wait before answering each request
+    :type latency: float
+    :param jitter: (optional) Up to this many seconds are randomly added to or taken from the latency
+    :type jitter: float
+    :param error_rate: (optional) The fraction of requests, from 0.0 to 1.0, answered with a 503 error
+    :type error_rate: float
+    :param handlers: (optional) Maps API method names to callables which are passed the request parameters as a dict and
+                     return the response to encode. Handlers take precedence over recordings
+    :type handlers: dict(str, callable)
+    :param port: (optional) The port to listen on. If 0, a free port is picked
+    :type port: int
+
+    Private calls are checked the way the real API checks them: the Sign header must be the HMAC-SHA512 of the request
+    body under the key's secret, and each nonce must be greater than the last one accepted for that key. Failed checks
+    are answered with an unsuccessful API response rather than an HTTP error. Nonces are checked in the order requests
+    arrive, before the latency is waited out, so requests in flight together are not reordered by jitter.
+
+    A call is answered with the recordings made for the same method and parameters, cycling through them if there are
+    several. If there are none, any recording of the same method is used instead.
+
+    '''
+    daemon_threads      = True
+    allow_reuse_address = True
+    request_queue_size  = 128 # Accept a burst of new connections without any waiting for the SYN to be resent
+
+    def __init__(self, recordings = None, secret_keys = None, latency = 0.0, jitter = 0.0, error_rate = 0.0, handlers = None, port = 0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        self.secret_keys = secret_keys           #: Maps accepted application keys to secret keys (dict(str, str))
+        self.latency     = latency               #: Seconds to wait before answering each request (float)
+        self.jitter      = jitter                #: Maximum random deviation from the latency in seconds (float)
+        self.error_rate  = error_rate            #: Fraction of requests answered with a 503 error (float)
+        self.handlers    = dict(handlers or {})  #: Maps API method names to response callables (dict(str, callable))
+        self.requests    = 0                     #: The number of requests answered
+        self.rejected    = 0                     #: The number of private calls rejected because their nonce was not greater than the last one
+        self._lock       = threading.Lock()
+        self._nonces     = dict()
+        self._exact      = dict()
+        self._by_method  = dict()
+        self._cursors    = dict()
+        self._thread     = None
+        if recordings:
+            self.load(recordings)
+
+    @property
+    def address(self):
+        '''The (host, port) the server listens on
+
+        '''
+        return self.server_address
+
+    def load(self, path):
+        '''Adds the recordings in a file to the ones being replayed
+
+        :param path: The file written by a :class:`~cryptsy.transport.RecordingTransport`
+        :type path: str
+
+        '''
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                recording = json.loads(line)
+                response  = (recording['status'], recording['body'].encode('utf-8'))
+                method    = recording['method']
+                self._exact.setdefault(self._key(method, recording['params']), []).append(response)
+                self._by_method.setdefault(method, []).append(response)
+
+    def start(self):
+        '''Starts serving requests on a background thread
+
+        '''
+        self._thread = threading.Thread(target = self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''Stops serving requests and closes the listening socket
+
+        '''
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def transport(self, transport = None):
+        '''
+        :param transport: (optional) The transport to send the redirected requests over
+        :type transport: :class:`~cryptsy.transport.Transport`
+        :rtype: :class:`~cryptsy.transport.RedirectTransport`
+        :return: A transport that sends every API call to this server
+
+        '''
+        return RedirectTransport(self.address, transport)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, body, headers):
+        '''Works out the answer to one request
+
+        :param path: The path of the request URL
+        :type path: str
+        :param body: The url-encoded request body
+        :type body: str
+        :param headers: The request headers
+        :rtype: (int, str)
+        :return: The HTTP status and body to answer with
+
+        '''
+        pairs  = urlparse.parse_qsl(body)
+        params = dict(pairs)
+        method = params.get('method')
+        error  = self._authenticate(body, params, headers) if path != '/api.php' else None
+
+        delay = self.latency + random.uniform(-self.jitter, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay)
+        with self._lock:
+            self.requests += 1
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, json.dumps({'success':0, 'error':'Service unavailable'})
+        if error:
+            return 200, json.dumps({'success':0, 'error':error})
+
+        if method in self.handlers:
+            return 200, json.dumps(self.handlers[method](params))
+        key = self._key(method, [pair for pair in pairs if pair[0] not in ('method', 'nonce')])
+        with self._lock:
+            responses = self._exact.get(key) or self._by_method.get(method)
+            if not responses:
+                return 200, json.dumps({'success':0, 'error':'No recording for method '+str(method)})
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+        return responses[cursor % len(responses)]
+
+    def _authenticate(self, body, params, headers):
+        key = headers.get('Key')
+        if self.secret_keys is not None:
+            secret_key = self.secret_keys.get(key)
+            if secret_key is None:
+                return 'Unable to Authorize Request - Check Your Post Data'
+            if headers.get('Sign') != hmac.new(secret_key, body, hashlib.sha512).hexdigest():
+                return 'Unable to Authorize Request - Check Your Post Data'
+        try:
+            nonce = int(params['nonce'])
+        except (KeyError, ValueError):
+            return 'Unable to Authorize Request - Check Your Post Data'
+        with self._lock:
+            if nonce <= self._nonces.get(key, 0):
+                self.rejected += 1
+                return 'Nonce must be greater than the last one used'
+            self._nonces[key] = nonce
+        return None
+
+    def _key(self, method, params):
+        return (method, tuple(sorted(tuple(pair) for pair in params)))
+
+def main():
+    '''Runs a stand-in server from the command line until interrupted
+
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Replays recorded Cryptsy API responses')
+    parser.add_argument('recordings', help = 'file written by a RecordingTransport')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds to wait before each response')
+    parser.add_argument('--jitter', type = float, default = 0.0, help = 'maximum random deviation from the latency')
+    parser.add_argument('--error-rate', type = float, default = 0.0, help = 'fraction of requests answered with a 503')
+    parser.add_argument('--key', nargs = 2, action = 'append', metavar = ('APPLICATION_KEY', 'SECRET_KEY'),
+                        help = 'accept private calls signed with this key pair; may be repeated')
+    args   = parser.parse_args()
+    server = StandInServer(args.recordings, dict(args.key) if args.key else None, args.latency, args.jitter, args.error_rate, port = args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
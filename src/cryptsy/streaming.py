@@ -0,0 +1,215 @@
+'''
+.. module:: streaming
+   :platform: Linux, Windows, OSX
+   :synopsis: Incremental parsing of large JSON API responses
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import json, re
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURE  = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]]')
+_DECODER    = json.JSONDecoder()
+
+class _Reader(object):
+    '''Buffers a file-like object in chunks, decoding one JSON value at a time from it
+
+    '''
+    def __init__(self, fp, chunk_size):
+        self._fp         = fp
+        self._chunk_size = chunk_size
+        self._eof        = False
+        self.buf = ''
+        self.pos = 0
+
+    def fill(self):
+        '''Drops the consumed part of the buffer and reads more data onto the end of it. At least a chunk is read, and
+        the unconsumed part of the buffer is doubled each time, so that a value spanning many chunks is only re-decoded
+        a logarithmic number of times
+
+        :rtype: bool
+        :return: False if the end of the input has been reached
+
+        '''
+        data = self._fp.read(max(self._chunk_size, len(self.buf) - self.pos)) if not self._eof else ''
+        if not data:
+            self._eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        '''
+        :return: The next non-whitespace character, without consuming it
+        :raise: :exc:`ValueError` if the input ends first
+
+        '''
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON data')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('Expected {0!r} at offset {1} of JSON data'.format(char, self.pos))
+        self.pos += 1
+
+    def decode(self):
+        '''Decodes and consumes the next JSON value
+
+        '''
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+            # A number which ends the buffer may continue in the next chunk
+            if end == len(self.buf) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def decode_if(self, conditions):
+        '''Decodes and consumes the next JSON value, unless it is an object with a field that is rejected. The members
+        before that field are decoded as they are reached, and the rest of a rejected object is skipped without being decoded
+
+        :param conditions: Maps each member to check to a callable, called with its value, which returns True if the
+                           object should be decoded
+        :type conditions: dict(str, callable)
+        :rtype: (bool, object)
+        :return: (False, None) if the object was skipped, otherwise (True, the decoded value)
+
+        '''
+        if self.peek() != '{':
+            return True, self.decode()
+        self.pos += 1
+        value   = dict()
+        while True:
+            char = self.peek()
+            if char == '}':
+                self.pos += 1
+                return True, value
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self.decode()
+            self.expect(':')
+            checked    = key in value
+            value[key] = self.decode()
+            accept     = conditions.get(key)
+            if accept is not None and not checked and not accept(value[key]):
+                self._skip_members()
+                return False, None
+
+    def _skip_members(self):
+        '''Consumes the rest of an object, up to and including its closing brace, without building it
+
+        '''
+        while True:
+            char = self.peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if char in ',:':
+                self.pos += 1
+                continue
+            self.skip()
+
+    def skip(self):
+        '''Consumes the next JSON value without building it
+
+        '''
+        if self.peek() not in '{[':
+            self.decode()
+            return
+        depth = 0
+        scan  = self.pos
+        while True:
+            for match in _STRUCTURE.finditer(self.buf, scan):
+                token = match.group()
+                if token == '"':
+                    # An unterminated string, rescan it once more data has been read
+                    scan = match.start()
+                    break
+                if token in '{[':
+                    depth += 1
+                elif token in '}]':
+                    depth -= 1
+                    if depth == 0:
+                        self.pos = match.end()
+                        return
+            else:
+                scan = len(self.buf)
+            scan -= self.pos
+            if not self.fill():
+                raise ValueError('Unexpected end of JSON data')
+            scan += self.pos
+
+def iter_items(fp, path, envelope = None, keys = None, chunk_size = 65536, where = None):
+    '''Incrementally parses a JSON document, yielding the members of one of its nested objects one at a time
+
+    :param fp: The file-like object to read the document from
+    :param path: The keys leading from the top-level object to the object whose members should be yielded, such as ('return', 'markets')
+    :type path: (str, ...)
+    :param envelope: (optional) A dict to store the scalar members of the top-level object in, such as 'success' and 'error'
+    :type envelope: dict
+    :param keys: (optional) If given, members whose key is not in keys are skipped without being decoded
+    :type keys: set(str)
+    :param chunk_size: (optional) The number of bytes to read from fp at a time
+    :type chunk_size: int
+    :param where: (optional) A (field, accept) pair, or a list of them. Members which are objects are skipped once a field
+                  is read, if its accept returns False for its value, without decoding the rest of them. Fields a member
+                  does not have are not checked
+    :type where: (str, callable) or [(str, callable), ...]
+    :rtype: generator of (str, object)
+    :raise: :exc:`ValueError` if the data is malformed
+
+    Only one member is held in memory at a time, so peak memory use is bounded by the largest member rather than the
+    size of the whole document. If the document does not contain path, nothing is yielded. Members of path that are not
+    objects are skipped.
+
+    '''
+    if where is not None:
+        where = dict([where] if isinstance(where[0], basestring) else where)
+    reader = _Reader(fp, chunk_size)
+    reader.expect('{')
+    depth = 0
+    while True:
+        char = reader.peek()
+        if char == '}':
+            # Keep going after the end of a nested object, so that envelope members which follow it are still read
+            if depth == 0:
+                return
+            reader.pos += 1
+            depth      -= 1
+            continue
+        if char == ',':
+            reader.pos += 1
+            continue
+        key = reader.decode()
+        reader.expect(':')
+        if depth == len(path):
+            if keys is not None and key not in keys:
+                reader.skip()
+            elif where is not None:
+                accepted, value = reader.decode_if(where)
+                if accepted:
+                    yield key, value
+            else:
+                yield key, reader.decode()
+        elif key == path[depth] and reader.peek() == '{':
+            reader.pos += 1
+            depth      += 1
+        elif depth == 0 and envelope is not None and reader.peek() not in '{[':
+            envelope[key] = reader.decode()
+        else:
+            reader.skip()
@@ -0,0 +1,339 @@
+'''
+.. module:: transport
+   :platform: Linux, Windows, OSX
+   :synopsis: Pluggable HTTP transports for the Cryptsy API
+..  moduleauthor:: Adam Panzica
+
+Licesnsed under the MIT License. See accompanying LICENSE.txt file for full licesnse terms.
+Copyright (c) 2014 Adam Panzica
+
+'''
+import httplib, urllib2, urlparse, socket, threading, time, json
+import instrumentation
+from StringIO import StringIO
+
+class Transport(object):
+    '''Base class for the transports that :mod:`cryptsy.bare_api` calls can be sent over. Subclasses implement :meth:`open`
+
+    '''
+    def request(self, url, body, headers = None, timeout = None):
+        '''POSTs body to url
+
+        :param url: The full URL to post to
+        :type url: str
+        :param body: The url-encoded request body
+        :type body: str
+        :param headers: (optional) Extra headers to send with the request
+        :type headers: dict(str, str)
+        :param timeout: (optional) Timeout for the request in seconds
+        :type timeout: float
+        :rtype: str
+        :return: The body of the response
+        :raise: :exc:`urllib2.HTTPError` if the server responds with an error status
+
+        '''
+        response = self.open(url, body, headers, timeout)
+        try:
+            return response.read()
+        finally:
+            response.close()
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        '''POSTs body to url, without reading the response body
+
+        Takes the same parameters as :meth:`request`, and:
+
+        :param sent: (optional) Called with no arguments once the request has been written, before waiting for the response.
+                     :mod:`cryptsy.bare_api` uses it to release the :func:`~cryptsy.nonce.send_lock` early. A transport which
+                     does not call it holds the lock until open returns
+        :type sent: callable
+        :return: A file-like object to read the response body from, which the caller must close
+        :raise: :exc:`urllib2.HTTPError` if the server responds with an error status
+
+        '''
+        raise NotImplementedError()
+
+class DeferredTransport(Transport):
+    '''Base class for transports which queue requests rather than sending them while the caller waits. Subclasses implement :meth:`submit`
+
+    A :mod:`cryptsy.bare_api` call made over a deferred transport returns whatever :meth:`submit` returns, such as a
+    :class:`~cryptsy.nonblocking.Future`, in place of the decoded response.
+
+    '''
+    def submit(self, url, prepare, lock = None, timeout = None, stream = False):
+        '''Queues a POST to url
+
+        :param url: The full URL to post to
+        :type url: str
+        :param prepare: Called with no arguments just before the request is sent, to get its (body, headers)
+        :type prepare: callable
+        :param lock: (optional) A lock which must be held from calling prepare until the response headers arrive, such as a :func:`~cryptsy.nonce.send_lock`
+        :type lock: :class:`threading.Lock`
+        :param timeout: (optional) Timeout for the request in seconds, counted from when it is queued
+        :type timeout: float
+        :param stream: (optional) If True, the result is the undecoded response body rather than the decoded JSON
+        :type stream: bool
+        :return: An object through which the result of the request is delivered
+
+        '''
+        raise NotImplementedError()
+
+class ConnectionPool(Transport):
+    '''A thread-safe pool of persistent HTTP(S) connections, keeping one set of idle keep-alive connections per host
+
+    :param max_size: The maximum number of idle connections to keep open per host
+    :type max_size: int
+    :param idle_timeout: Idle connections older than this many seconds are closed instead of being reused
+    :type idle_timeout: float
+
+    Connections are checked out for the duration of a single request and returned to the pool once the response has been
+    fully read. If more than :attr:`max_size` requests are in flight to the same host at once, the extra connections are
+    opened as needed and closed when they are returned.
+
+    '''
+    def __init__(self, max_size = 4, idle_timeout = 30.0):
+        self.max_size     = max_size     #: The maximum number of idle connections to keep open per host (int)
+        self.idle_timeout = idle_timeout #: Seconds a connection may sit idle before it is evicted (float)
+        self._lock  = threading.Lock()
+        self._idle  = {} # (scheme, host, port) -> [(connection, last_used), ...]
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        '''POSTs body to url over a pooled connection, without reading the response body
+
+        Takes the same parameters as :meth:`Transport.open`.
+
+        :rtype: :class:`PooledResponse`
+        :return: A file-like object to read the response body from. The connection goes back to the pool when it is closed
+        :raise: :exc:`urllib2.HTTPError` if the server responds with an error status
+
+        '''
+        parts = urlparse.urlsplit(url)
+        key   = (parts.scheme, parts.hostname, parts.port)
+        path  = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        send_headers = {'Content-Type' : 'application/x-www-form-urlencoded',
+                        'Connection'   : 'keep-alive'}
+        if headers:
+            send_headers.update(headers)
+
+        conn, reused = self._acquire(key, timeout)
+        try:
+            try:
+                response = self._send(conn, path, body, send_headers, sent, reused)
+            except _StaleConnection:
+                # If sent was already called, the resent request may now be out of nonce order. The server then rejects
+                # its nonce, which is still better than acting on it twice
+                conn.close()
+                conn     = self._connect(key, timeout)
+                response = self._send(conn, path, body, send_headers, sent)
+        except:
+            conn.close()
+            raise
+
+        pooled = PooledResponse(self, key, conn, response)
+        if response.status >= 400:
+            data = pooled.read()
+            pooled.close()
+            raise urllib2.HTTPError(url, response.status, response.reason, response.msg, StringIO(data))
+        return pooled
+
+    def evict_idle(self):
+        '''Closes every idle connection that has been unused for longer than :attr:`idle_timeout`
+
+        '''
+        now = time.time()
+        with self._lock:
+            for key, idle in self._idle.items():
+                fresh = []
+                for conn, last_used in idle:
+                    if now - last_used > self.idle_timeout:
+                        conn.close()
+                    else:
+                        fresh.append((conn, last_used))
+                self._idle[key] = fresh
+
+    def close(self):
+        '''Closes all idle connections held by the pool
+
+        '''
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def _send(self, conn, path, body, headers, sent = None, reused = False):
+        '''Sends a request and waits for the response headers, calling sent in between
+
+        :raise: :exc:`_StaleConnection` if reused is True and the server had closed the connection, so the request can be
+                sent again on a fresh one. That is only the case if sending failed, or the connection was closed before any
+                of the response arrived. A timeout is never retried, since the server may have acted on the request
+
+        '''
+        record  = instrumentation.current()
+        started = time.time()
+        if record is not None and conn.sock is None:
+            conn.connect()
+            record.add(instrumentation.CONNECT, time.time() - started)
+            started = time.time()
+        try:
+            try:
+                conn.request('POST', path, body, headers)
+            except socket.timeout:
+                raise
+            except (httplib.CannotSendRequest, socket.error):
+                if reused:
+                    raise _StaleConnection()
+                raise
+            if sent:
+                sent()
+            try:
+                return conn.getresponse()
+            except httplib.BadStatusLine as e:
+                if reused and _nothing_received(e):
+                    raise _StaleConnection()
+                raise
+        finally:
+            if record is not None:
+                record.add(instrumentation.WAIT, time.time() - started)
+
+    def _acquire(self, key, timeout):
+        '''
+        :return: A tuple of (connection, reused) where reused is True if the connection came from the pool
+
+        '''
+        self.evict_idle()
+        with self._lock:
+            idle = self._idle.get(key)
+            conn = idle.pop()[0] if idle else None
+        if conn is None:
+            return self._connect(key, timeout), False
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout if timeout else socket.getdefaulttimeout())
+        conn.timeout = timeout
+        return conn, True
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_size:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def _connect(self, key, timeout):
+        scheme, host, port = key
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout = timeout)
+        return httplib.HTTPConnection(host, port, timeout = timeout)
+
+class _StaleConnection(Exception):
+    '''Raised by :meth:`ConnectionPool._send` when a reused connection had been closed by the server before the request was answered
+
+    '''
+
+def _nothing_received(error):
+    '''
+    :return: True if a :exc:`httplib.BadStatusLine` was raised because the connection closed before any of the response arrived
+
+    '''
+    line = error.line if isinstance(error.line, str) else ''
+    return line in ('', "''") or line.startswith('No status line received')
+
+class PooledResponse(object):
+    '''File-like wrapper around a response from a :class:`ConnectionPool`
+
+    Closing the response hands its connection back to the pool if the body was read in full, otherwise the connection is closed.
+
+    '''
+    def __init__(self, pool, key, conn, response):
+        self.status    = response.status #: The HTTP status code of the response (int)
+        self._pool     = pool
+        self._key      = key
+        self._conn     = conn
+        self._response = response
+
+    def read(self, amt = None):
+        '''
+        :param amt: (optional) The maximum number of bytes to read. If None, reads the rest of the body
+        :type amt: int
+        :rtype: str
+
+        '''
+        try:
+            return self._response.read(amt)
+        except:
+            self._conn.close()
+            raise
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool._release(self._key, self._conn)
+        else:
+            self._conn.close()
+        self._conn = None
+
+class RedirectTransport(Transport):
+    '''Sends every request to a different server, such as a :class:`~cryptsy.standin.StandInServer`, keeping the path of the original URL
+
+    :param address: The (host, port) to send requests to over plain HTTP
+    :type address: (str, int)
+    :param transport: (optional) The transport to send the redirected requests over. If None, a new :class:`ConnectionPool` is used
+    :type transport: :class:`Transport`
+
+    '''
+    def __init__(self, address, transport = None):
+        self.address    = address #: The (host, port) requests are sent to
+        self._transport = transport if transport else ConnectionPool()
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        parts = urlparse.urlsplit(url)
+        url   = urlparse.urlunsplit(('http', '{0}:{1}'.format(*self.address), parts.path, parts.query, parts.fragment))
+        return self._transport.open(url, body, headers, timeout, sent)
+
+class RecordingTransport(Transport):
+    '''Saves every request and response that passes through another transport, for replay by a :class:`~cryptsy.standin.StandInServer`
+
+    :param path: The file to append recordings to, one JSON object per line
+    :type path: str
+    :param transport: (optional) The transport to send requests over. If None, a new :class:`ConnectionPool` is used
+    :type transport: :class:`Transport`
+
+    Each recording holds the path of the URL, the API method, the request parameters other than the method and nonce,
+    and the HTTP status and body of the response. Headers, and so keys and signatures, are not recorded.
+
+    '''
+    def __init__(self, path, transport = None):
+        self.path       = path #: The file recordings are appended to (str)
+        self._transport = transport if transport else ConnectionPool()
+        self._lock      = threading.Lock()
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        try:
+            response = self._transport.open(url, body, headers, timeout, sent)
+            try:
+                data = response.read()
+            finally:
+                response.close()
+        except urllib2.HTTPError as e:
+            data = e.read()
+            self._record(url, body, e.code, data)
+            raise urllib2.HTTPError(e.filename, e.code, e.msg, e.hdrs, StringIO(data))
+        self._record(url, body, 200, data)
+        return StringIO(data)
+
+    def _record(self, url, body, status, data):
+        params = [(key, value) for key, value in urlparse.parse_qsl(body) if key not in ('method', 'nonce')]
+        line   = json.dumps({'path'   : urlparse.urlsplit(url).path,
+                             'method' : dict(urlparse.parse_qsl(body)).get('method'),
+                             'params' : params,
+                             'status' : status,
+                             'body'   : data})
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
@@ -0,0 +1,95 @@
+import os, sys, threading, urlparse, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.api_pool import ManagedAPIPool
+from cryptsy.managed_api import APIError
+from cryptsy.standin import StandInServer
+from cryptsy.cache import ResponseCache
+from cryptsy.transport import Transport, ConnectionPool
+
+def _depth(params):
+    return {'success':1, 'return':{'sell':[['0.002', '1.5']], 'buy':[['0.001', '2.0']]}}
+
+def _create(params):
+    return {'success':1, 'return':{'orderid':'7', 'moreinfo':'Order placed'}}
+
+def _cancel(params):
+    if params['orderid'] == '99':
+        return {'success':0, 'error':'Invalid order'}
+    return {'success':1, 'return':['Order cancelled']}
+
+class _KeyRecorder(Transport):
+    '''Notes the API method and application key of each request before passing it on'''
+
+    def __init__(self, transport):
+        self.calls      = []
+        self._transport = transport
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        self.calls.append((urlparse.parse_qs(body)['method'][0], (headers or {}).get('Key')))
+        return self._transport.open(url, body, headers, timeout, sent)
+
+class ManagedAPIPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        # Rate limiters are shared by application key, so every test gets keys of its own
+        self.keys   = [(self.id()+'.'+name, 'secret-'+name) for name in ('owner', 'second', 'third')]
+        self.owner  = self.keys[0][0]
+        self.server = StandInServer(secret_keys = dict(self.keys), latency = 0.05,
+                                    handlers = {'depth':_depth, 'createorder':_create, 'cancelorder':_cancel})
+        self.server.start()
+        self.pool      = ConnectionPool()
+        self.transport = _KeyRecorder(self.server.transport(self.pool))
+        self.api_pool  = ManagedAPIPool(self.keys, transport = self.transport, cache = ResponseCache({}), rate = 1000, burst = 1000)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def keys_used(self, method):
+        return [key for called, key in self.transport.calls if called == method]
+
+    def test_reads_are_spread_across_keys(self):
+        results = list(self.api_pool.fetch_many('depth', range(1, 13), max_concurrency = 12))
+        self.assertEqual([error for _, _, error in results if error is not None], [])
+        self.assertEqual(set(self.keys_used('depth')), set(key for key, _ in self.keys))
+        self.assertEqual([stats['calls'] for stats in self.api_pool.stats().values()], [4, 4, 4])
+
+    def test_orders_always_use_the_owner_key(self):
+        def trade():
+            self.api_pool.create_order(5, 'Buy', '1.0', '0.001')
+            self.api_pool.cancel_order(7)
+        workers = [threading.Thread(target = trade) for _ in xrange(6)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        # A call rejected for arriving out of nonce order is sent again, so a key can be used more than once per call
+        self.assertEqual(set(self.keys_used('createorder') + self.keys_used('cancelorder')), set([self.owner]))
+        self.assertEqual(self.api_pool.stats()[self.owner]['calls'], 12)
+
+    def test_owner_can_be_any_key(self):
+        api_pool = ManagedAPIPool(self.keys, owner = self.keys[2][0], transport = self.transport, cache = ResponseCache({}))
+        self.assertTrue(api_pool.owner is api_pool.apis[2])
+        api_pool.create_order(5, 'Buy', '1.0', '0.001')
+        self.assertEqual(self.keys_used('createorder'), [self.keys[2][0]])
+        self.assertRaises(ValueError, ManagedAPIPool, self.keys, owner = 'other')
+        self.assertRaises(ValueError, ManagedAPIPool, [])
+
+    def test_stats_count_calls_and_errors_per_key(self):
+        list(self.api_pool.fetch_many('depth', range(1, 7), max_concurrency = 6))
+        self.api_pool.create_order(5, 'Buy', '1.0', '0.001')
+        self.assertRaises(APIError, self.api_pool.cancel_order, 99)
+        stats = self.api_pool.stats()
+        self.assertEqual(sorted(stats), sorted(key for key, _ in self.keys))
+        owner = stats.pop(self.owner)
+        self.assertEqual((owner['calls'], owner['errors']), (4, 1))
+        for key_stats in stats.values():
+            self.assertEqual((key_stats['calls'], key_stats['errors']), (2, 0))
+        for key_stats in stats.values() + [owner]:
+            self.assertEqual((key_stats['in_flight'], key_stats['queued']), (0, 0))
+            self.assertTrue(0.0 < key_stats['utilization'] <= 1.0)
+            self.assertLess(key_stats['max_wait'], 0.01)
+
+if __name__ == '__main__':
+    unittest.main()
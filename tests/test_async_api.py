@@ -0,0 +1,138 @@
+import os, sys, socket, threading, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.async_api import AsyncManagedAPI
+from cryptsy.managed_api import APIError
+from cryptsy.nonblocking import _ResponseParser
+from cryptsy.standin import StandInServer
+from cryptsy.cache import ResponseCache
+from cryptsy.rate_limit import RateLimiter
+
+def _info(params):
+    return {'success':1, 'return':{'balances_available':{'BTC':'1.0'}}}
+
+def _depth(params):
+    return {'success':1, 'return':{'sell':[['0.002', '1.5']], 'buy':[['0.001', '2.0']], 'market':params['marketid']}}
+
+def _trades(params):
+    return {'success':1, 'return':[{'tradeid':str(n), 'tradetype':'Buy', 'datetime':'2014-01-01 00:00:00', 'marketid':'5',
+                                    'order_id':'9', 'fee':'0.0001', 'initiate_ordertype':'Buy', 'total':'0.5',
+                                    'tradeprice':'0.5', 'quantity':'1.0'} for n in (1, 2, 3)]}
+
+def _market_data(params):
+    return {'success':1, 'return':{'markets':dict(
+        (label, {'marketid':str(market_id), 'label':label, 'volume':'1.0', 'recenttrades':[], 'lasttradetime':'',
+                 'lasttradeprice':'0.5', 'primarycode':label[:3], 'primaryname':label[:3], 'secondarycode':'BTC',
+                 'secondaryname':'Bitcoin', 'sellorders':[], 'buyorders':[]})
+        for label, market_id in (('LTC/BTC', 3), ('DOGE/BTC', 132), ('FTC/BTC', 5)))}}
+
+class AsyncManagedAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls    = []
+        self.rejected = None
+        def create(params):
+            self.calls.append('create')
+            if self.rejected and 'cancel' not in self.calls:
+                return {'success':0, 'error':self.rejected}
+            return {'success':1, 'return':{'orderid':'2', 'moreinfo':'Order placed'}}
+        def cancel(params):
+            self.calls.append('cancel')
+            return {'success':1, 'return':['Order cancelled']}
+        self.server = StandInServer(secret_keys = {'key':'secret'}, latency = 0.002, jitter = 0.002,
+                                    handlers = {'getinfo':_info, 'depth':_depth, 'allmytrades':_trades, 'marketdatav2':_market_data,
+                                                'createorder':create, 'cancelorder':cancel})
+        self.server.start()
+        self.api = AsyncManagedAPI('key', 'secret', cache = ResponseCache({}), rate_limiter = RateLimiter(1000, 1000),
+                                   address = self.server.address)
+
+    def tearDown(self):
+        self.api.close()
+        self.server.stop()
+
+    def test_concurrent_private_calls_have_no_nonce_errors(self):
+        futures = [self.api.get_info() for _ in xrange(100)]
+        blocking_errors = []
+        def run():
+            for _ in xrange(20):
+                try:
+                    self.api.api.get_info()
+                except APIError as e:
+                    blocking_errors.append(e)
+        thread = threading.Thread(target = run)
+        thread.start()
+        for future in futures:
+            self.assertEqual(future.get(10)['balances_available'], {'BTC':'1.0'})
+        thread.join()
+        self.assertEqual(blocking_errors, [])
+
+    def test_public_calls_are_in_flight_together(self):
+        self.server.latency = 0.25
+        started = time.time()
+        futures = [self.api.general_market_data() for _ in xrange(8)]
+        for future in futures:
+            self.assertEqual(sorted(future.get(10)), ['DOGE/BTC', 'FTC/BTC', 'LTC/BTC'])
+        self.assertLess(time.time() - started, 1.0) # 2.0 seconds if sent one at a time
+
+    def test_iter_market_data_filters_markets(self):
+        self.assertEqual([label for label, _ in self.api.iter_market_data(markets = [3, 5]).get(10)], ['LTC/BTC', 'FTC/BTC'])
+
+    def test_after_and_callback(self):
+        results = []
+        done    = threading.Event()
+        def callback(trades):
+            results.append(trades)
+            done.set()
+        self.api.my_trades(after = 1, callback = callback)
+        self.assertTrue(done.wait(10))
+        self.assertEqual([trade.trade_id for trade in results[0]], [2, 3])
+
+    def test_api_errors_fail_the_future(self):
+        future = self.api.market_trades(5)
+        self.assertRaises(APIError, future.get, 10)
+        self.assertFalse(future.successful())
+
+    def test_timeout(self):
+        self.server.latency = 0.5
+        self.assertRaises(socket.timeout, self.api.get_info(timeout = 0.1).get, 10)
+
+    def test_fetch_many(self):
+        results = list(self.api.fetch_many('depth', range(1, 31), max_concurrency = 8))
+        self.assertEqual(sorted(market for market, _, _ in results), range(1, 31))
+        self.assertEqual([error for _, _, error in results if error is not None], [])
+        self.assertTrue(all(int(data['market']) == market for market, data, _ in results))
+
+    def test_replace_orders_falls_back_when_funds_are_held(self):
+        self.rejected = 'Insufficient BTC in account to complete this order.'
+        ((created, cancelled),) = self.api.replace_orders([(1, 5, 'Buy', 1.0, 0.5)]).get(10)
+        self.assertFalse(isinstance(created, Exception))
+        self.assertFalse(isinstance(cancelled, Exception))
+        self.assertEqual(self.calls, ['create', 'cancel', 'create'])
+
+    def test_create_orders_keeps_input_order(self):
+        results = self.api.create_orders([(5, 'Buy', 1.0, 0.5)]*10).get(10)
+        self.assertEqual([result['orderid'] for result in results], ['2']*10)
+        self.assertEqual(self.calls, ['create']*10)
+
+class ResponseParserTest(unittest.TestCase):
+
+    def test_chunked_body_split_anywhere(self):
+        response = 'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5;x=1\r\nhello\r\n7\r\n, world\r\n0\r\n\r\n'
+        for split in xrange(1, len(response)):
+            parser = _ResponseParser()
+            parser.feed(response[:split])
+            parser.feed(response[split:])
+            self.assertTrue(parser.done)
+            self.assertEqual(parser.body, 'hello, world')
+            self.assertTrue(parser.keep_alive)
+
+    def test_body_read_until_close(self):
+        parser = _ResponseParser()
+        parser.feed('HTTP/1.0 200 OK\r\n\r\nabc')
+        self.assertFalse(parser.done)
+        parser.feed_eof()
+        self.assertEqual(parser.body, 'abc')
+        self.assertFalse(parser.keep_alive)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import os, sys, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import ManagedAPI, APIError
+from cryptsy.standin import StandInServer
+from cryptsy.rate_limit import RateLimiter
+from cryptsy.transport import ConnectionPool
+
+class ReplaceOrdersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls    = []
+        self.rejected = None
+        def create(params):
+            self.calls.append('create')
+            if self.rejected and 'cancel' not in self.calls:
+                return {'success':0, 'error':self.rejected}
+            return {'success':1, 'return':{'orderid':'2', 'moreinfo':'Order placed'}}
+        def cancel(params):
+            self.calls.append('cancel')
+            return {'success':1, 'return':['Order cancelled']}
+        self.server = StandInServer(secret_keys = {'key':'secret'}, handlers = {'createorder':create, 'cancelorder':cancel})
+        self.server.start()
+        self.pool = ConnectionPool()
+        self.api  = ManagedAPI('key', 'secret', transport = self.server.transport(self.pool), rate_limiter = RateLimiter(1000, 1000))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def replace(self):
+        (result,) = self.api.replace_orders([(1, 5, 'Buy', 1.0, 0.5)])
+        return result
+
+    def test_places_before_cancelling(self):
+        created, cancelled = self.replace()
+        self.assertFalse(isinstance(created, Exception))
+        self.assertFalse(isinstance(cancelled, Exception))
+        self.assertEqual(self.calls, ['create', 'cancel'])
+
+    def test_falls_back_when_funds_are_held(self):
+        self.rejected = 'Insufficient BTC in account to complete this order.'
+        created, cancelled = self.replace()
+        self.assertFalse(isinstance(created, Exception))
+        self.assertFalse(isinstance(cancelled, Exception))
+        self.assertEqual(self.calls, ['create', 'cancel', 'create'])
+
+    def test_keeps_the_old_order_on_other_errors(self):
+        self.rejected = 'Invalid market'
+        created, cancelled = self.replace()
+        self.assertTrue(isinstance(created, APIError))
+        self.assertEqual(cancelled, None)
+        self.assertEqual(self.calls, ['create'])
+
+class BulkOrdersTest(unittest.TestCase):
+
+    def setUp(self):
+        def create(params):
+            return {'success':1, 'return':{'orderid':'2', 'moreinfo':'Order placed'}}
+        def cancel(params):
+            return {'success':1, 'return':['Order cancelled']}
+        self.server = StandInServer(secret_keys = {'key':'secret'}, latency = 0.2, handlers = {'createorder':create, 'cancelorder':cancel})
+        self.server.start()
+        self.pool = ConnectionPool()
+        self.api  = ManagedAPI('key', 'secret', transport = self.server.transport(self.pool), rate_limiter = RateLimiter(1000, 1000))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_orders_are_in_flight_together(self):
+        started = time.time()
+        results = self.api.create_orders([(5, 'Buy', 1.0, 0.5)]*16, max_concurrency = 16)
+        self.assertEqual([result['orderid'] for result in results], ['2']*16)
+        self.assertLess(time.time() - started, 1.6) # 3.2 seconds if each order waited for the one before it
+
+        started = time.time()
+        results = self.api.cancel_orders(range(1, 17), max_concurrency = 16)
+        self.assertFalse(any(isinstance(result, Exception) for result in results))
+        self.assertLess(time.time() - started, 1.6)
+
+    def test_replacements_are_in_flight_together(self):
+        started = time.time()
+        results = self.api.replace_orders([(n, 5, 'Buy', 1.0, 0.5) for n in xrange(1, 17)], max_concurrency = 16)
+        self.assertFalse(any(isinstance(result, Exception) for pair in results for result in pair))
+        self.assertLess(time.time() - started, 3.2) # 6.4 seconds if each call waited for the one before it
+
+if __name__ == '__main__':
+    unittest.main()
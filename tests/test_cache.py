@@ -0,0 +1,99 @@
+import os, sys, threading, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import ManagedAPI
+from cryptsy.cache import ResponseCache
+from cryptsy.standin import StandInServer
+from cryptsy.rate_limit import RateLimiter
+from cryptsy.transport import Transport, ConnectionPool
+
+class _HeldResponse(object):
+    def __init__(self, response, reading, proceed):
+        self._response = response
+        self._reading  = reading
+        self._proceed  = proceed
+
+    def read(self, *args):
+        self._reading.set()
+        self._proceed.wait(5)
+        return self._response.read(*args)
+
+    def close(self):
+        self._response.close()
+
+class _HoldingTransport(Transport):
+    '''Holds the body of the next myorders response until proceed is set, so a call can be made while it is in flight
+
+    '''
+    def __init__(self, transport):
+        self._transport = transport
+        self.hold       = False
+        self.reading    = threading.Event()
+        self.proceed    = threading.Event()
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        response = self._transport.open(url, body, headers, timeout, sent)
+        if self.hold and 'method=myorders' in body:
+            self.hold = False
+            return _HeldResponse(response, self.reading, self.proceed)
+        return response
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_put_after_invalidate_is_dropped(self):
+        cache      = ResponseCache()
+        generation = cache.generation('my_orders', 5)
+        cache.invalidate('my_orders', 5)
+        cache.put('my_orders', 5, (), 'stale', generation)
+        self.assertEqual(cache.get('my_orders', 5), (False, None))
+        cache.put('my_orders', 5, (), 'fresh', cache.generation('my_orders', 5))
+        self.assertEqual(cache.get('my_orders', 5), (True, 'fresh'))
+
+    def test_invalidating_one_market_keeps_others(self):
+        cache      = ResponseCache()
+        generation = cache.generation('my_orders', 6)
+        cache.invalidate('my_orders', 5)
+        cache.put('my_orders', 6, (), 'value', generation)
+        self.assertEqual(cache.get('my_orders', 6), (True, 'value'))
+
+    def test_all_markets_result_is_dropped_by_any_invalidate(self):
+        cache      = ResponseCache()
+        generation = cache.generation('my_orders', None)
+        cache.invalidate('my_orders', 5)
+        cache.put('my_orders', None, (), 'stale', generation)
+        self.assertEqual(cache.get('my_orders', None), (False, None))
+
+class ManagedAPICacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orders = []
+        def my_orders(params):
+            return {'success':1, 'return':list(self.orders)}
+        def create(params):
+            self.orders.append({'order_id':str(len(self.orders) + 1), 'created':'2014-03-01 12:00:00', 'ordertype':params['ordertype'],
+                                'price':params['price'], 'quantity':params['quantity'], 'total':'0.5', 'orig_quantity':params['quantity']})
+            return {'success':1, 'return':{'orderid':str(len(self.orders)), 'moreinfo':'Order placed'}}
+        self.server = StandInServer(secret_keys = {'key':'secret'}, handlers = {'myorders':my_orders, 'createorder':create})
+        self.server.start()
+        self.pool      = ConnectionPool()
+        self.transport = _HoldingTransport(self.server.transport(self.pool))
+        self.api       = ManagedAPI('key', 'secret', transport = self.transport, rate_limiter = RateLimiter(1000, 1000))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_read_in_flight_during_a_write_is_not_cached(self):
+        self.transport.hold = True
+        read   = []
+        reader = threading.Thread(target = lambda: read.append(self.api.my_orders(5)))
+        reader.start()
+        self.assertTrue(self.transport.reading.wait(5))
+        self.api.create_order(5, 'Buy', 1.0, 0.5)
+        self.transport.proceed.set()
+        reader.join()
+        self.assertEqual(read[0], [])
+        self.assertEqual(len(self.api.my_orders(5)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
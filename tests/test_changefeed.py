@@ -0,0 +1,88 @@
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import MarketData
+from cryptsy.changefeed import MarketDataDiffer, market_changes
+
+def _trade(trade_id):
+    return {'id':str(trade_id), 'time':'2014-03-01 12:00:00', 'price':'0.5', 'quantity':'1.0', 'total':'0.5'}
+
+def _order(price, quantity):
+    return {'price':price, 'quantity':quantity, 'total':str(float(price)*float(quantity))}
+
+def _market(trades = (2, 1), buys = (('0.4', '1.0'), ('0.3', '2.0')), sells = (('0.6', '1.0'), ('0.7', '2.0')),
+            price = '0.5', volume = '10.0'):
+    return MarketData({'marketid':'3', 'label':'LTC/BTC', 'volume':volume, 'lasttradetime':'', 'lasttradeprice':price,
+                       'primarycode':'LTC', 'primaryname':'Litecoin', 'secondarycode':'BTC', 'secondaryname':'Bitcoin',
+                       'recenttrades':[_trade(trade_id) for trade_id in trades],
+                       'buyorders':[_order(*order) for order in buys], 'sellorders':[_order(*order) for order in sells]})
+
+class MarketDataDifferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.differ = MarketDataDiffer()
+        (self.first,) = self.differ.diff({'LTC/BTC':_market()})
+
+    def change(self, **kwargs):
+        changes = self.differ.diff({'LTC/BTC':_market(**kwargs)})
+        self.assertTrue(len(changes) <= 1)
+        return changes[0] if changes else None
+
+    def flags(self, change):
+        return (change.price_changed, change.volume_changed, change.book_changed)
+
+    def test_first_snapshot_reports_everything(self):
+        self.assertEqual(self.first.label, 'LTC/BTC')
+        self.assertEqual([trade.trade_id for trade in self.first.new_trades], [2, 1])
+        self.assertEqual(self.flags(self.first), (True, True, True))
+
+    def test_unchanged_market_is_not_reported(self):
+        self.assertEqual(self.change(), None)
+
+    def test_new_trades(self):
+        change = self.change(trades = (4, 3, 2), price = '0.55', volume = '12.0')
+        self.assertEqual([trade.trade_id for trade in change.new_trades], [4, 3])
+        self.assertEqual(self.flags(change), (True, True, False))
+
+    def test_order_added_at_the_top_of_the_book(self):
+        change = self.change(buys = (('0.45', '1.0'), ('0.4', '1.0'), ('0.3', '2.0')))
+        self.assertEqual(change.new_trades, [])
+        self.assertEqual(self.flags(change), (False, False, True))
+
+    def test_best_order_removed(self):
+        change = self.change(sells = (('0.7', '2.0'),))
+        self.assertEqual(self.flags(change), (False, False, True))
+        change = self.change(sells = ())
+        self.assertEqual(self.flags(change), (False, False, True))
+
+    def test_best_order_changed(self):
+        change = self.change(buys = (('0.4', '0.5'), ('0.3', '2.0')))
+        self.assertEqual(self.flags(change), (False, False, True))
+        self.assertEqual(change.market_data.buy_orders[0].quantity, 0.5)
+
+    def test_changes_behind_the_best_orders_are_not_reported(self):
+        self.assertEqual(self.change(buys = (('0.4', '1.0'),), sells = (('0.6', '1.0'), ('0.65', '3.0'))), None)
+
+    def test_only_changed_markets_are_reported_to_listeners(self):
+        heard = []
+        self.differ.listeners.append(heard.append)
+        other   = _market()
+        changes = self.differ.diff([('LTC/BTC', _market()), ('FTC/BTC', other)])
+        self.assertEqual([change.label for change in changes], ['FTC/BTC'])
+        self.assertEqual(heard, changes)
+        self.assertTrue(heard[0].market_data is other)
+
+class MarketChangesTest(unittest.TestCase):
+
+    def test_yields_changes_across_polls(self):
+        snapshots = iter([{'LTC/BTC':_market()}, {'LTC/BTC':_market()}, {'LTC/BTC':_market(trades = (3, 2, 1))}])
+        class API(object):
+            def general_market_data(self):
+                return next(snapshots)
+        changes = market_changes(API(), interval = 0.0)
+        self.assertEqual([trade.trade_id for trade in next(changes).new_trades], [2, 1])
+        self.assertEqual([trade.trade_id for trade in next(changes).new_trades], [3])
+        self.assertRaises(StopIteration, next, changes)
+
+if __name__ == '__main__':
+    unittest.main()
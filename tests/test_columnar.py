@@ -0,0 +1,75 @@
+import os, sys, random, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import MarketOrderData
+
+try:
+    import numpy
+    from cryptsy.columnar import ColumnarOrderBook, BookSide
+except ImportError:
+    numpy = None
+
+def _market_orders(levels = 50, seed = 1):
+    generator = random.Random(seed)
+    def orders(price_key, low, high):
+        entries = []
+        for _ in xrange(levels):
+            price    = '%.8f' % generator.uniform(low, high)
+            quantity = '%.8f' % generator.uniform(0.1, 100)
+            entries.append({price_key:price, 'quantity':quantity, 'total':'%.8f' % (float(price)*float(quantity))})
+        return entries
+    return {'buyorders':orders('buyprice', 0.001, 0.002), 'sellorders':orders('sellprice', 0.002, 0.003)}
+
+@unittest.skipUnless(numpy, 'NumPy is not installed')
+class ColumnarOrderBookTest(unittest.TestCase):
+
+    def assert_matches(self, side, orders, descending):
+        orders = sorted(orders, key = lambda order: -order.price if descending else order.price)
+        self.assertEqual(side.price.dtype, numpy.float64)
+        self.assertTrue(side.price.flags['C_CONTIGUOUS'])
+        self.assertEqual(list(side.price), [order.price for order in orders])
+        self.assertEqual(list(side.quantity), [order.quantity for order in orders])
+        self.assertEqual(list(side.total), [order.total for order in orders])
+        self.assertEqual(side.best, (orders[0].price, orders[0].quantity))
+
+    def test_from_market_orders_matches_the_order_objects(self):
+        data = _market_orders()
+        book = ColumnarOrderBook.from_market_orders(data)
+        self.assert_matches(book.bids, MarketOrderData.build_many(data['buyorders']), True)
+        self.assert_matches(book.asks, MarketOrderData.build_many(data['sellorders']), False)
+        self.assertEqual(book.spread, book.asks.price[0] - book.bids.price[0])
+        self.assertTrue(book.spread > 0)
+
+    def test_from_depth(self):
+        book = ColumnarOrderBook.from_depth({'buy':[['0.001', '2.0'], ['0.0015', '1.0'], ['0.0012', '4.0']],
+                                             'sell':[['0.003', '1.0'], ['0.002', '1.5']]})
+        self.assertEqual(list(book.bids.price), [0.0015, 0.0012, 0.001])
+        self.assertEqual(list(book.bids.quantity), [1.0, 4.0, 2.0])
+        self.assertEqual(list(book.bids.total), [0.0015*1.0, 0.0012*4.0, 0.001*2.0])
+        self.assertEqual(book.asks.best, (0.002, 1.5))
+        self.assertEqual(list(book.asks.cumulative_quantity()), [1.5, 2.5])
+
+    def test_empty_sides(self):
+        book = ColumnarOrderBook.from_depth({'buy':[], 'sell':[['0.002', '1.5']]})
+        self.assertEqual(len(book.bids), 0)
+        self.assertEqual(book.bids.best, None)
+        self.assertEqual(book.spread, None)
+
+    def test_equal_prices_keep_their_input_order(self):
+        side = BookSide(numpy.array([2.0, 1.0, 2.0]), numpy.array([1.0, 2.0, 3.0]), numpy.array([2.0, 2.0, 6.0]), True)
+        self.assertEqual(list(side.quantity), [1.0, 3.0, 2.0])
+
+    def test_top_and_between(self):
+        book = ColumnarOrderBook.from_depth({'buy':[[str(price), '1.0'] for price in (5, 3, 4, 1, 2)],
+                                             'sell':[[str(price), '1.0'] for price in (8, 6, 9, 7)]})
+        self.assertEqual(list(book.bids.top(2).price), [5.0, 4.0])
+        self.assertEqual(list(book.bids.between(2, 4).price), [4.0, 3.0, 2.0])
+        self.assertEqual(list(book.asks.between(6.5, 8).price), [7.0, 8.0])
+        self.assertEqual(list(book.asks.top(10).price), [6.0, 7.0, 8.0, 9.0])
+
+    def test_missing_field(self):
+        self.assertRaises(ValueError, ColumnarOrderBook.from_market_orders, {'buyorders':[]})
+        self.assertRaises(ValueError, ColumnarOrderBook.from_depth, {'sell':[]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os, sys, json, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy import decoding
+
+_BODY = json.dumps({'success':1, 'return':{'LTC/BTC':{'marketid':'3', 'label':'LTC/BTC', 'lasttradeprice':'0.02450001',
+                                                      'primaryname':u'Litecoin \u0141', 'volume':12345.678901234567,
+                                                      'tiny':1e-8, 'recenttrades':[{'id':7, 'price':0.1}], 'buyorders':None}}})
+
+def _installed(name):
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+def _typed(value):
+    '''Pairs every value with its type, so that str and unicode strings or ints and floats do not compare equal'''
+    if isinstance(value, dict):
+        return dict((_typed(key), _typed(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [_typed(item) for item in value]
+    return (type(value), value)
+
+class DecodingTest(unittest.TestCase):
+
+    def tearDown(self):
+        decoding.use_backend('json')
+
+    def test_standard_library_is_the_default(self):
+        reload(decoding)
+        self.assertEqual(decoding.backend, 'json')
+        self.assertEqual(_typed(decoding.loads(_BODY)), _typed(json.loads(_BODY)))
+
+    def test_every_installed_backend_decodes_like_json(self):
+        expected = _typed(json.loads(_BODY))
+        for name in decoding.BACKENDS:
+            if not _installed(name):
+                continue
+            decoding.use_backend(name)
+            self.assertEqual(decoding.backend, name)
+            self.assertEqual(_typed(decoding.loads(_BODY)), expected, name)
+            self.assertRaises(ValueError, decoding.loads, '{"success":')
+
+    def test_use_fastest_picks_the_first_installed_backend(self):
+        self.assertEqual(decoding.use_fastest(), [name for name in decoding.BACKENDS if _installed(name)][0])
+        self.assertEqual(_typed(decoding.loads(_BODY)), _typed(json.loads(_BODY)))
+
+    def test_unknown_backends_are_rejected(self):
+        self.assertRaises(ValueError, decoding.use_backend, 'pickle')
+        self.assertEqual(decoding.backend, 'json')
+
+    def test_set_decoder(self):
+        decoding.set_decoder(lambda data: {'decoded':data}, 'custom')
+        self.assertEqual(decoding.backend, 'custom')
+        self.assertEqual(decoding.loads('{}'), {'decoded':'{}'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os, sys, threading, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import ManagedAPI
+from cryptsy.standin import StandInServer
+from cryptsy.cache import ResponseCache
+from cryptsy.rate_limit import RateLimiter
+from cryptsy.transport import ConnectionPool
+
+def _orders(params):
+    return {'success':1, 'return':{'sellorders':[{'sellprice':'0.002', 'quantity':'1.5', 'total':'0.003'}],
+                                   'buyorders' :[{'buyprice':'0.001', 'quantity':'2.0', 'total':'0.002'}]}}
+
+def _depth(params):
+    return {'success':1, 'return':{'sell':[['0.002', '1.5']], 'buy':[['0.001', '2.0']]}}
+
+class FetchManyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(secret_keys = {'key':'secret'}, latency = 0.002,
+                                    handlers = {'marketorders':_orders, 'depth':_depth})
+        self.server.start()
+        self.pool = ConnectionPool()
+        self.api  = ManagedAPI('key', 'secret', transport = self.server.transport(self.pool), cache = ResponseCache({}),
+                               rate_limiter = RateLimiter(1000, 1000))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_private_methods_have_no_nonce_errors(self):
+        for method in ('market_orders', 'depth'):
+            results = list(self.api.fetch_many(method, range(1, 51), max_concurrency = 8))
+            self.assertEqual(sorted(market for market, _, _ in results), range(1, 51))
+            self.assertEqual([error for _, _, error in results if error is not None], [])
+
+    def test_private_calls_wait_for_responses_in_parallel(self):
+        self.server.latency = 0.2
+        started = time.time()
+        results = list(self.api.fetch_many('depth', range(1, 17), max_concurrency = 16))
+        elapsed = time.time() - started
+        self.assertEqual([error for _, _, error in results if error is not None], [])
+        self.assertLess(elapsed, 1.6) # 3.2 seconds if each call waited for the one before it
+
+    def test_threads_sharing_a_key_have_no_nonce_errors(self):
+        errors = []
+        def run(market):
+            for _ in xrange(25):
+                try:
+                    self.api.depth(market)
+                except Exception as e:
+                    errors.append(e)
+        workers = [threading.Thread(target = run, args = (market,)) for market in xrange(1, 9)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os, sys, unittest
+from decimal import Decimal
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy import fixed_point
+from cryptsy.fixed_point import parse, to_string, multiply, divide, fee, SCALE
+from cryptsy.managed_api import ManagedAPI
+from cryptsy.standin import StandInServer
+from cryptsy.cache import ResponseCache
+from cryptsy.rate_limit import RateLimiter
+from cryptsy.transport import ConnectionPool
+
+class ParseTest(unittest.TestCase):
+
+    def test_decimal_strings_are_exact(self):
+        self.assertEqual(parse('0.00041230'), 41230)
+        self.assertEqual(parse('12345.6789'), 1234567890000)
+        self.assertEqual(parse('-0.5'), -SCALE//2)
+        self.assertEqual(parse(' +3 '), 3*SCALE)
+        self.assertEqual(parse('.1'), SCALE//10)
+
+    def test_other_types(self):
+        self.assertEqual(parse(2), 2*SCALE)
+        self.assertEqual(parse(0.1), SCALE//10)
+        self.assertEqual(parse(Decimal('0.00000002')), 2)
+        self.assertEqual(parse('1e-8'), 1)
+
+    def test_digits_past_the_unit_round_half_to_even(self):
+        self.assertEqual(parse('0.000000005'), 0)
+        self.assertEqual(parse('0.000000015'), 2)
+        self.assertEqual(parse('0.0000000151'), 2)
+        self.assertEqual(parse('-0.000000025'), -2)
+
+    def test_non_numbers_raise_value_error(self):
+        for value in (None, 'abc', '', 'nan', 'inf', '1.2.3', [], {}):
+            self.assertRaises(ValueError, parse, value)
+
+class ArithmeticTest(unittest.TestCase):
+
+    def test_multiply_rounds_half_to_even(self):
+        self.assertEqual(multiply(parse('0.00041'), parse('12.5')), parse('0.005125'))
+        self.assertEqual(multiply(1, parse('0.5')), 0)
+        self.assertEqual(multiply(3, parse('0.5')), 2)
+        self.assertEqual(multiply(-3, parse('0.5')), -2)
+
+    def test_divide_rounds_half_to_even(self):
+        self.assertEqual(divide(parse('0.005125'), parse('12.5')), parse('0.00041'))
+        self.assertEqual(divide(parse('1'), parse('3')), 33333333)
+        self.assertEqual(divide(parse('2'), parse('3')), 66666667)
+        self.assertEqual(divide(parse('1'), parse('-4')), -SCALE//4)
+        self.assertRaises(ZeroDivisionError, divide, 1, 0)
+
+    def test_fee(self):
+        self.assertEqual(fee(parse('0.005125'), parse('0.0025')), 1281) # 1281.25 units
+        self.assertEqual(fee(parse('0.00000200'), parse('0.0025')), 0)  # 0.5 units
+
+    def test_to_string_round_trips(self):
+        for text in ('0.00000001', '0.00041230', '12345.67890000', '-0.50000000', '0.00000000', '21000000.00000000'):
+            self.assertEqual(to_string(parse(text)), text)
+        for units in (0, 1, -1, SCALE - 1, 10**17 + 3):
+            self.assertEqual(parse(to_string(units)), units)
+        self.assertEqual(fixed_point.to_decimal(parse('0.00041230')), Decimal('0.00041230'))
+
+class FixedPointRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.params = []
+        def create(params):
+            self.params.append(params)
+            return {'success':1, 'return':{'orderid':'2', 'moreinfo':'Order placed'}}
+        def fees(params):
+            self.params.append(params)
+            return {'success':1, 'return':{'fee':'0.00000128', 'net':'0.00512628'}}
+        self.server = StandInServer(secret_keys = {'key':'secret'}, handlers = {'createorder':create, 'calculatefees':fees})
+        self.server.start()
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def api(self, fixed_point):
+        return ManagedAPI('key', 'secret', transport = self.server.transport(self.pool), cache = ResponseCache({}),
+                          rate_limiter = RateLimiter(1000, 1000), fixed_point = fixed_point)
+
+    def test_units_are_sent_as_decimal_strings(self):
+        api = self.api(True)
+        api.create_order(5, 'Buy', parse('12.5'), parse('0.00041'))
+        api.calculate_fees('Buy', parse('12.5'), parse('0.00041'))
+        for params in self.params:
+            self.assertEqual((params['quantity'], params['price']), ('12.50000000', '0.00041000'))
+
+    def test_ints_are_whole_coins_without_fixed_point(self):
+        self.api(False).create_order(5, 'Buy', 12, '0.00041')
+        self.assertEqual((self.params[0]['quantity'], self.params[0]['price']), ('12', '0.00041'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os, sys, shutil, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import UserTradeData, TransactionData
+from cryptsy.history import HistorySync
+from cryptsy import fixed_point
+
+_TRADE = {'tradeid':'7', 'tradetype':'Buy', 'datetime':'2014-03-01 12:00:00', 'marketid':'3', 'order_id':'11', 'fee':'0.00000003',
+          'initiate_ordertype':'Buy', 'total':'0.30000007', 'tradeprice':'0.10000001', 'quantity':'3.00000001'}
+_TRANSACTION = {'trxid':'ab12', 'fee':'0.00000001', 'timestamp':'1383458400', 'datetime':'2013-11-03 01:00:00', 'currency':'BTC',
+                'amount':'1.23456789', 'address':'1abc', 'timezone':'EST', 'type':'Deposit'}
+
+class _StubAPI(object):
+    def __init__(self, fixed):
+        self.fixed_point = fixed
+        self.fetching    = lambda: None # Called as each request is made
+        self._number     = fixed_point.parse if fixed else float
+
+    def my_trades(self, timeout = None, after = None):
+        self.fetching()
+        return [UserTradeData(_TRADE, self._number)]
+
+    def get_transactions(self, timeout = None, since = None):
+        self.fetching()
+        return [TransactionData(_TRANSACTION, self._number)]
+
+class HistorySyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'history.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_fixed_point_amounts_are_exact(self):
+        history = HistorySync(_StubAPI(True), self.path)
+        synced  = history.sync_trades()[0]
+        stored  = history.trades()[0]
+        for name in ('fee', 'total', 'trade_price', 'quantity'):
+            self.assertEqual(getattr(stored, name), getattr(synced, name))
+            self.assertTrue(isinstance(getattr(stored, name), (int, long)))
+        history.sync_transactions()
+        self.assertEqual(history.transactions()[0].amount, 123456789)
+        history.close()
+
+    def test_transactions_keep_the_server_time(self):
+        history = HistorySync(_StubAPI(False), self.path)
+        history.sync_transactions()
+        self.assertEqual([t.unix_time for t in history.transactions(start = 1383458400, end = 1383458401)], [1383458400])
+        history.close()
+
+    def test_records_already_stored_are_not_returned_again(self):
+        history = HistorySync(_StubAPI(False), self.path)
+        self.assertEqual(len(history.sync_trades()), 1)
+        self.assertEqual(len(history.sync_transactions()), 1)
+        self.assertEqual(history.sync_trades(), [])
+        self.assertEqual(history.sync_transactions(), [])
+        self.assertEqual((len(history.trades()), len(history.transactions())), (1, 1))
+        history.close()
+
+    def test_requests_are_made_without_holding_the_lock(self):
+        api     = _StubAPI(False)
+        history = HistorySync(api, self.path)
+        held    = []
+        api.fetching = lambda: held.append(history._lock.locked())
+        history.sync_trades()
+        history.sync_transactions()
+        self.assertEqual(held, [False, False])
+        history.close()
+
+    def test_mode_mismatch_is_rejected(self):
+        HistorySync(_StubAPI(True), self.path).close()
+        self.assertRaises(ValueError, HistorySync, _StubAPI(False), self.path)
+        HistorySync(_StubAPI(True), self.path).close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os, sys, threading, unittest
+from StringIO import StringIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import ManagedAPI, MarketData
+from cryptsy.cache import ResponseCache
+
+# The sell orders of market 4 are not valid JSON, so decoding them would raise
+_ORDERBOOKS = ('{"success":1,"return":{'
+               '"3":{"marketid":"3","label":"A/BTC","sellorders":[],"buyorders":[]},'
+               '"4":{"marketid":"4","label":"B/BTC","sellorders":[tru],"buyorders":[]},'
+               '"5":{"marketid":"5","label":"C/BTC","sellorders":[],"buyorders":[]}}}')
+
+def _entry(trades = 200, orders = 200):
+    return {'marketid':'3', 'label':'LTC/BTC', 'volume':'1.0', 'lasttradetime':'2014-03-01 12:00:00', 'lasttradeprice':'0.5',
+            'primarycode':'LTC', 'primaryname':'Litecoin', 'secondarycode':'BTC', 'secondaryname':'Bitcoin',
+            'recenttrades':[{'id':str(n), 'time':'2014-03-01 12:00:00', 'price':'0.5', 'quantity':'1.0', 'total':'0.5'} for n in xrange(trades)],
+            'sellorders':[{'price':'0.6', 'quantity':'1.0', 'total':'0.6'}]*orders,
+            'buyorders':[{'price':'0.4', 'quantity':'1.0', 'total':'0.4'}]*orders}
+
+class MarketDataTest(unittest.TestCase):
+
+    def test_lists_are_built_on_first_read(self):
+        market = MarketData(_entry(3, 2))
+        self.assertFalse('recent_trades' in market.__dict__)
+        self.assertEqual([trade.trade_id for trade in market.recent_trades], [0, 1, 2])
+        self.assertTrue(market.recent_trades is market.recent_trades)
+        self.assertFalse('_recent_trades' in market.__dict__)
+        self.assertEqual(len(market.buy_orders), 2)
+
+    def test_concurrent_first_reads_share_one_list(self):
+        old_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        try:
+            for _ in xrange(20):
+                market  = MarketData(_entry())
+                start   = threading.Event()
+                results = []
+                errors  = []
+                def read():
+                    start.wait()
+                    try:
+                        results.append(market.recent_trades)
+                    except Exception as e:
+                        errors.append(e)
+                threads = [threading.Thread(target = read) for _ in xrange(8)]
+                for thread in threads:
+                    thread.start()
+                start.set()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(errors, [])
+                self.assertTrue(all(result is market.recent_trades for result in results))
+        finally:
+            sys.setcheckinterval(old_interval)
+
+class OrderbookDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.api = ManagedAPI('key', 'secret', cache = ResponseCache({}))
+
+    def labels(self, labels = None, markets = None):
+        return [orderbook['label'] for _, orderbook in self.api._iter_orderbook_data(StringIO(_ORDERBOOKS), labels, markets)]
+
+    def test_rejected_labels_are_skipped_without_decoding_them(self):
+        self.assertEqual(self.labels(labels = ['A/BTC', 'C/BTC']), ['A/BTC', 'C/BTC'])
+
+    def test_labels_and_markets_both_filter(self):
+        self.assertEqual(self.labels(labels = ['A/BTC', 'C/BTC'], markets = [3]), ['A/BTC'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os, sys, json, shutil, tempfile, threading, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy import market_index
+from cryptsy.market_index import MarketInfo, MarketIndex, PersistentMarketIndex, FORMAT_VERSION
+
+def _entry(market_id, primary, secondary):
+    return {'marketid':str(market_id), 'label':'%s/%s' % (primary, secondary),
+            'primary_currency_code':primary, 'primary_currency_name':primary.lower(),
+            'secondary_currency_code':secondary, 'secondary_currency_name':secondary.lower()}
+
+_MARKETS = [_entry(3, 'LTC', 'BTC'), _entry(5, 'FTC', 'BTC'), _entry(2, 'DOGE', 'LTC')]
+
+class _Cache(object):
+
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, method, market = None):
+        self.invalidated.append(method)
+
+class _API(object):
+    '''Stands in for :class:`~cryptsy.managed_api.ManagedAPI`, counting getmarkets calls'''
+
+    def __init__(self, markets = _MARKETS):
+        self.cache   = _Cache()
+        self.markets = markets
+        self.error   = None
+        self.calls   = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def get_markets(self, timeout = None):
+        self.calls += 1
+        self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.markets
+
+def _old_index(age):
+    return MarketIndex([MarketInfo(_MARKETS[0])], time.time() - age)
+
+def _wait_until(condition):
+    deadline = time.time() + 5
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+class _TempDirTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'markets.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class MarketIndexTest(_TempDirTest):
+
+    def test_lookups(self):
+        index = MarketIndex.from_markets(_MARKETS)
+        self.assertEqual(index.market_id('ltc/btc'), 3)
+        self.assertEqual(index.label('5'), 'FTC/BTC')
+        self.assertEqual(index.by_label('NOPE/BTC'), None)
+        self.assertEqual([market.market_id for market in index.by_currency('ltc')], [2, 3])
+        self.assertEqual([market.market_id for market in index], [2, 3, 5])
+        self.assertEqual(index.currencies(), ['BTC', 'DOGE', 'FTC', 'LTC'])
+        self.assertTrue('Doge/LTC' in index and 5 in index and 4 not in index)
+
+    def test_save_and_load_round_trip(self):
+        index = MarketIndex.from_markets(_MARKETS)
+        index.save(self.path)
+        loaded = MarketIndex.load(self.path)
+        self.assertEqual(loaded.created, index.created)
+        self.assertEqual([market.to_json() for market in loaded], [market.to_json() for market in index])
+        self.assertEqual(os.listdir(self.directory), ['markets.json'])
+
+    def test_load_rejects_missing_malformed_and_other_version_files(self):
+        self.assertEqual(MarketIndex.load(self.path), None)
+        for document in ('{"version": 1, "created": 0', json.dumps([]),
+                         json.dumps({'version':FORMAT_VERSION, 'created':0, 'markets':[{'label':'LTC/BTC'}]}),
+                         json.dumps({'version':FORMAT_VERSION + 1, 'created':0, 'markets':_MARKETS})):
+            with open(self.path, 'w') as f:
+                f.write(document)
+            self.assertEqual(MarketIndex.load(self.path), None)
+
+    def test_failed_save_leaves_the_old_file_in_place(self):
+        MarketIndex.from_markets(_MARKETS[:1]).save(self.path)
+        def fail(source, destination):
+            raise OSError('disk full')
+        replace, market_index._replace = market_index._replace, fail
+        try:
+            self.assertRaises(OSError, MarketIndex.from_markets(_MARKETS).save, self.path)
+        finally:
+            market_index._replace = replace
+        self.assertEqual(len(MarketIndex.load(self.path)), 1)
+        self.assertEqual(os.listdir(self.directory), ['markets.json'])
+
+class PersistentMarketIndexTest(_TempDirTest):
+
+    def save_old_index(self, age):
+        _old_index(age).save(self.path)
+
+    def test_fresh_file_is_used_without_an_api_call(self):
+        self.save_old_index(10)
+        api   = _API()
+        index = PersistentMarketIndex(api, self.path, ttl = 60).get()
+        self.assertEqual(len(index), 1)
+        self.assertEqual(api.calls, 0)
+
+    def test_missing_file_is_fetched_and_written(self):
+        api   = _API()
+        index = PersistentMarketIndex(api, self.path).get()
+        self.assertEqual(len(index), 3)
+        self.assertEqual(api.calls, 1)
+        self.assertEqual(api.cache.invalidated, ['get_markets'])
+        self.assertEqual(len(MarketIndex.load(self.path)), 3)
+
+    def test_stale_index_is_refreshed_once_in_the_background(self):
+        self.save_old_index(120)
+        api = _API()
+        api.release.clear()
+        markets = PersistentMarketIndex(api, self.path, ttl = 60)
+        for _ in xrange(10):
+            self.assertEqual(len(markets.get()), 1)
+        self.assertTrue(_wait_until(lambda: api.calls == 1))
+        api.release.set()
+        self.assertTrue(_wait_until(lambda: len(markets.get()) == 3))
+        self.assertEqual(api.calls, 1)
+        self.assertEqual(len(MarketIndex.load(self.path)), 3)
+
+    def test_file_refreshed_by_another_process_is_picked_up(self):
+        api     = _API()
+        markets = PersistentMarketIndex(api, self.path, ttl = 60)
+        markets._index = _old_index(120)
+        MarketIndex.from_markets(_MARKETS[:2]).save(self.path)
+        markets.get()
+        self.assertTrue(_wait_until(lambda: len(markets.get()) == 2))
+        self.assertEqual(api.calls, 0)
+
+    def test_failed_refresh_waits_before_retrying(self):
+        self.save_old_index(120)
+        api       = _API()
+        api.error = IOError('connection refused')
+        markets   = PersistentMarketIndex(api, self.path, ttl = 60, retry_delay = 0.2)
+        markets.get()
+        self.assertTrue(_wait_until(lambda: markets.last_error is api.error))
+        for _ in xrange(10):
+            self.assertEqual(len(markets.get()), 1)
+        time.sleep(0.05)
+        self.assertEqual(api.calls, 1)
+        api.error = None
+        time.sleep(0.2)
+        markets.get()
+        self.assertTrue(_wait_until(lambda: len(markets.get()) == 3))
+        self.assertEqual(api.calls, 2)
+        self.assertEqual(markets.last_error, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os, sys, shutil, tempfile, threading, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.nonce import NonceGenerator
+from cryptsy.bare_api import call_pri_api
+from cryptsy.managed_api import ManagedAPI
+from cryptsy.standin import StandInServer
+from cryptsy.transport import Transport, ConnectionPool
+
+def _info(params):
+    return {'success':1, 'return':{}}
+
+class _HeadersFirstTransport(Transport):
+    '''Never reports a request as written, so the send lock is held until the response headers arrive'''
+
+    def __init__(self, transport):
+        self._transport = transport
+
+    def open(self, url, body, headers = None, timeout = None, sent = None):
+        return self._transport.open(url, body, headers, timeout)
+
+class NonceGeneratorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'nonce')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_nonces_are_unique_and_increasing(self):
+        nonce   = NonceGenerator(self.path, reserve = 1000)
+        threads = 16
+        calls   = 2000
+        issued  = [[] for _ in xrange(threads)]
+        start   = threading.Event()
+        def run(out):
+            start.wait()
+            for _ in xrange(calls):
+                out.append(nonce())
+        workers = [threading.Thread(target = run, args = (out,)) for out in issued]
+        for worker in workers:
+            worker.start()
+        start.set()
+        for worker in workers:
+            worker.join()
+
+        every = [value for out in issued for value in out]
+        self.assertEqual(len(every), threads*calls)
+        self.assertEqual(len(set(every)), len(every))
+        for out in issued:
+            self.assertEqual(out, sorted(out))
+            self.assertTrue(all(later > earlier for earlier, later in zip(out, out[1:])))
+
+    def test_restart_never_reuses_a_nonce(self):
+        first = NonceGenerator(self.path, reserve = 10)
+        last  = max(first() for _ in xrange(25))
+        self.assertGreater(NonceGenerator(self.path)(), last)
+
+    def test_mark_survives_a_crash_before_the_rename(self):
+        with open(self.path, 'w') as f:
+            f.write('100')
+        with open(self.path + '.tmp', 'w') as f:
+            f.write(str(10**18))
+        self.assertGreater(NonceGenerator(self.path)(), 10**18)
+
+    def test_store_replaces_the_file(self):
+        nonce = NonceGenerator(self.path, reserve = 5)
+        for _ in xrange(20):
+            nonce()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        with open(self.path) as f:
+            self.assertGreaterEqual(int(f.read()), nonce._last)
+
+class ConcurrentCallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(secret_keys = {'key':'secret'}, latency = 0.002, handlers = {'getinfo':_info})
+        self.server.start()
+        self.pool  = ConnectionPool(max_size = 8)
+        self.nonce = NonceGenerator()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def call_concurrently(self, transport):
+        results = []
+        def run():
+            for _ in xrange(25):
+                results.append(call_pri_api('getinfo', [], 'key', 'secret', transport = transport, nonce = self.nonce))
+        workers = [threading.Thread(target = run) for _ in xrange(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def test_no_nonce_is_rejected_while_the_lock_is_held_until_the_response(self):
+        results = self.call_concurrently(self.server.transport(_HeadersFirstTransport(self.pool)))
+        self.assertEqual([result for result in results if result['success'] != 1], [])
+        self.assertEqual(self.server.rejected, 0)
+
+    def test_nonces_rejected_after_an_early_release_are_resent(self):
+        results = self.call_concurrently(self.server.transport(self.pool))
+        self.assertEqual([result for result in results if result['success'] != 1], [])
+        self.assertEqual(self.server.requests, len(results) + self.server.rejected)
+
+class ManagedAPINonceTest(unittest.TestCase):
+
+    def test_nonce_path_persists_the_default_generator(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'nonce')
+            api  = ManagedAPI('key', 'secret', nonce_path = path)
+            last = api._nonce()
+            self.assertGreater(NonceGenerator(path)(), last)
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
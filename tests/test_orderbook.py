@@ -0,0 +1,73 @@
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.orderbook import OrderBook, LevelChange, _Side, BID, ASK, ADDED, CHANGED, REMOVED
+
+class SideTest(unittest.TestCase):
+
+    def setUp(self):
+        self.side = _Side(BID)
+
+    def test_insert_keeps_prices_sorted(self):
+        changes = self.side.replace([(0.3, 1.0), (0.1, 2.0), (0.2, 3.0)])
+        self.assertEqual(sorted(changes), sorted([LevelChange(BID, ADDED, 0.1, 2.0, 0.0), LevelChange(BID, ADDED, 0.2, 3.0, 0.0),
+                                                  LevelChange(BID, ADDED, 0.3, 1.0, 0.0)]))
+        self.assertEqual(self.side.prices, [0.1, 0.2, 0.3])
+        self.assertEqual(self.side.quantities, {0.1:2.0, 0.2:3.0, 0.3:1.0})
+
+    def test_quantities_at_the_same_price_are_summed(self):
+        self.side.replace([(0.1, 2.0), (0.1, 0.5)])
+        self.assertEqual(self.side.quantities, {0.1:2.5})
+        self.assertEqual(self.side.prices, [0.1])
+
+    def test_update(self):
+        self.side.replace([(0.1, 2.0), (0.2, 3.0)])
+        self.assertEqual(self.side.replace([(0.1, 2.0), (0.2, 4.0)]), [LevelChange(BID, CHANGED, 0.2, 4.0, 3.0)])
+        self.assertEqual(self.side.quantities, {0.1:2.0, 0.2:4.0})
+        self.assertEqual(self.side.replace([(0.1, 2.0), (0.2, 4.0)]), [])
+
+    def test_delete(self):
+        self.side.replace([(0.1, 2.0), (0.2, 3.0), (0.3, 1.0)])
+        self.assertEqual(self.side.replace([(0.1, 2.0), (0.3, 1.0)]), [LevelChange(BID, REMOVED, 0.2, 0.0, 3.0)])
+        self.assertEqual(self.side.prices, [0.1, 0.3])
+        self.assertEqual(self.side.quantities, {0.1:2.0, 0.3:1.0})
+
+    def test_level_updated_to_zero_is_deleted(self):
+        self.side.replace([(0.1, 2.0), (0.2, 3.0)])
+        self.assertEqual(self.side.replace([(0.1, 2.0), (0.2, 0.0)]), [LevelChange(BID, REMOVED, 0.2, 0.0, 3.0)])
+        self.assertEqual(self.side.prices, [0.1])
+        self.assertEqual(self.side.replace([(0.3, 0.0), (0.1, 2.0)]), [])
+        self.assertEqual(self.side.prices, [0.1])
+
+class OrderBookTest(unittest.TestCase):
+
+    def test_best_prices_after_mixed_updates(self):
+        book   = OrderBook(5)
+        events = []
+        book.listeners.append(events.append)
+        self.assertEqual((book.best_bid, book.best_ask), (None, None))
+        book.update([(0.10, 1.0), (0.12, 2.0), (0.11, 3.0)], [(0.15, 1.0), (0.13, 2.0), (0.14, 3.0)])
+        self.assertEqual((book.best_bid, book.best_ask), ((0.12, 2.0), (0.13, 2.0)))
+
+        changes = book.update([(0.10, 1.0), (0.11, 5.0), (0.125, 1.0)], [(0.13, 0.0), (0.14, 3.0), (0.15, 1.0)])
+        self.assertEqual(sorted(changes), sorted([LevelChange(BID, REMOVED, 0.12, 0.0, 2.0), LevelChange(BID, CHANGED, 0.11, 5.0, 3.0),
+                                                  LevelChange(BID, ADDED, 0.125, 1.0, 0.0), LevelChange(ASK, REMOVED, 0.13, 0.0, 2.0)]))
+        self.assertEqual((book.best_bid, book.best_ask), ((0.125, 1.0), (0.14, 3.0)))
+        self.assertEqual(book.bids(), [(0.125, 1.0), (0.11, 5.0), (0.10, 1.0)])
+        self.assertEqual(book.asks(1), [(0.14, 3.0)])
+        self.assertEqual(book.bids(2), [(0.125, 1.0), (0.11, 5.0)])
+
+        self.assertEqual(book.update([(0.10, 1.0), (0.11, 5.0), (0.125, 1.0)], [(0.14, 3.0), (0.15, 1.0)]), [])
+        self.assertEqual(len(events), 2)
+
+        book.update([], [])
+        self.assertEqual((book.best_bid, book.best_ask), (None, None))
+
+    def test_update_from_depth(self):
+        book = OrderBook()
+        book.update_from_depth({'buy':[['0.001', '2.0']], 'sell':[['0.002', '1.5']]})
+        self.assertEqual((book.best_bid, book.best_ask), ((0.001, 2.0), (0.002, 1.5)))
+        self.assertRaises(ValueError, book.update_from_depth, {'buy':[]})
+
+if __name__ == '__main__':
+    unittest.main()
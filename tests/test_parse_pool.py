@@ -0,0 +1,48 @@
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.managed_api import ManagedAPI, MarketData
+from cryptsy.parse_pool import ParsePool, PackedMarketData
+from cryptsy.standin import StandInServer
+from cryptsy.rate_limit import RateLimiter
+from cryptsy.transport import ConnectionPool
+
+_MARKETS = {'success':1, 'return':{'markets':{'LTC/BTC':{
+    'marketid':'3', 'label':'LTC/BTC', 'lasttradeprice':'0.02500000', 'volume':'1200.50000000', 'lasttradetime':'2014-03-01 12:00:00',
+    'primaryname':'LiteCoin', 'primarycode':'LTC', 'secondaryname':'BitCoin', 'secondarycode':'BTC',
+    'recenttrades':[{'id':'11', 'time':'2014-03-01 12:00:00', 'price':'0.02500000', 'quantity':'2.00000000', 'total':'0.05000000'}],
+    'sellorders':[{'price':'0.02600000', 'quantity':'1.00000000', 'total':'0.02600000'}],
+    'buyorders':[{'price':'0.02400000', 'quantity':'3.00000000', 'total':'0.07200000'}]}}}}
+
+class ParsePoolTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.parse_pool = ParsePool(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parse_pool.close()
+
+    def setUp(self):
+        self.server = StandInServer(handlers = {'marketdatav2':lambda params: _MARKETS})
+        self.server.start()
+        self.pool = ConnectionPool()
+        self.api  = ManagedAPI('key', 'secret', transport = self.server.transport(self.pool), rate_limiter = RateLimiter(1000, 1000))
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.stop()
+
+    def test_pool_is_opt_in_per_call(self):
+        plain  = self.api.general_market_data()['LTC/BTC']
+        packed = self.api.general_market_data(parse_pool = self.parse_pool)['LTC/BTC']
+        self.assertEqual(type(plain), MarketData)
+        self.assertTrue(isinstance(packed, PackedMarketData))
+        for name in ('market_id', 'label', 'last_trade_price', 'volume'):
+            self.assertEqual(getattr(packed, name), getattr(plain, name))
+        self.assertEqual([(o.price, o.quantity, o.total) for o in packed.buy_orders], [(o.price, o.quantity, o.total) for o in plain.buy_orders])
+        self.assertEqual([t.trade_id for t in packed.recent_trades], [t.trade_id for t in plain.recent_trades])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os, sys, threading, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.rate_limit import RateLimiter, PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_POLL
+
+class RateLimiterTest(unittest.TestCase):
+
+    def wait_until_queued(self, limiter, count):
+        deadline = time.time() + 5
+        while limiter.queued < count and time.time() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(limiter.queued, count)
+
+    def test_burst_is_available_at_once(self):
+        limiter = RateLimiter(rate = 1, burst = 5)
+        started = time.time()
+        for _ in xrange(5):
+            limiter.acquire()
+        self.assertLess(time.time() - started, 0.1)
+        self.assertGreater(limiter.try_acquire(), 0.5)
+
+    def test_tokens_refill_at_the_rate_up_to_the_burst(self):
+        limiter = RateLimiter(rate = 20, burst = 2)
+        self.assertEqual(limiter.try_acquire(), 0.0)
+        self.assertEqual(limiter.try_acquire(), 0.0)
+        self.assertAlmostEqual(limiter.try_acquire(), 0.05, delta = 0.01)
+        time.sleep(0.06)
+        self.assertEqual(limiter.try_acquire(), 0.0)
+        time.sleep(0.2)
+        self.assertEqual(limiter.available, 2)
+
+    def test_acquire_waits_for_a_token(self):
+        limiter = RateLimiter(rate = 10, burst = 1)
+        limiter.acquire()
+        self.assertAlmostEqual(limiter.acquire(), 0.1, delta = 0.03)
+
+    def test_waiters_go_in_priority_order(self):
+        limiter = RateLimiter(rate = 10, burst = 1)
+        limiter.acquire()
+        served  = []
+        workers = []
+        def run(name, priority):
+            limiter.acquire(priority)
+            served.append(name)
+        for name, priority in (('poll 1', PRIORITY_POLL), ('account', PRIORITY_ACCOUNT), ('poll 2', PRIORITY_POLL), ('order', PRIORITY_ORDER)):
+            worker = threading.Thread(target = run, args = (name, priority))
+            worker.start()
+            workers.append(worker)
+            self.wait_until_queued(limiter, len(workers))
+        for worker in workers:
+            worker.join()
+        self.assertEqual(served, ['order', 'account', 'poll 1', 'poll 2'])
+
+    def test_try_acquire_yields_to_waiters_of_the_same_or_a_more_urgent_priority(self):
+        limiter = RateLimiter(rate = 10, burst = 1)
+        limiter.acquire()
+        worker  = threading.Thread(target = limiter.acquire, args = (PRIORITY_ACCOUNT,))
+        worker.start()
+        self.wait_until_queued(limiter, 1)
+        with limiter._cond: # Keep the waiter from waking up to take the token as it refills
+            time.sleep(0.15)
+            self.assertGreater(limiter.try_acquire(PRIORITY_POLL), 0.0)
+            self.assertGreater(limiter.try_acquire(PRIORITY_ACCOUNT), 0.0)
+            self.assertEqual(limiter.try_acquire(PRIORITY_ORDER), 0.0)
+        worker.join()
+        self.assertEqual(limiter.acquired, 3)
+
+    def test_wait_statistics(self):
+        limiter = RateLimiter(rate = 10, burst = 1)
+        self.assertEqual(limiter.mean_wait, 0.0)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(limiter.acquired, 2)
+        self.assertAlmostEqual(limiter.max_wait, 0.1, delta = 0.03)
+        self.assertAlmostEqual(limiter.mean_wait, limiter.max_wait/2, delta = 0.01)
+        time.sleep(0.1)
+        self.assertEqual(limiter.try_acquire(since = time.time() - 1.0), 0.0)
+        self.assertAlmostEqual(limiter.max_wait, 1.0, delta = 0.01)
+        self.assertEqual(limiter.acquired, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os, sys, shutil, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.snapshot_store import SnapshotWriter, SnapshotReader
+from cryptsy.managed_api import MarketData
+from cryptsy.fixed_point import parse, SCALE
+
+_DEPTH = {'buy':[['0.001', '2.0']], 'sell':[['0.002', '1.5']]}
+
+def _market_data(label, number = float):
+    return MarketData({'marketid':'3', 'label':label, 'volume':'123456789.12345678', 'lasttradetime':'', 'lasttradeprice':'0.00041230',
+                       'primarycode':'A', 'primaryname':'A', 'secondarycode':'BTC', 'secondaryname':'Bitcoin',
+                       'recenttrades':[{'id':'7', 'time':'', 'price':'0.00041230', 'quantity':'12.5', 'total':'0.00515375'}],
+                       'sellorders':[{'price':'0.00041300', 'quantity':'1.0', 'total':'0.00041300'}],
+                       'buyorders':[{'price':'0.00041100', 'quantity':'2.0', 'total':'0.00082200'}]}, number)
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path      = os.path.join(self.directory, 'snapshots')
+        self.writer    = SnapshotWriter(self.path)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.directory)
+
+    def test_snapshots_survive_a_refresh(self):
+        self.writer.record_depth(5, _DEPTH, 100.0)
+        reader   = SnapshotReader(self.path)
+        snapshot = next(reader.snapshots())
+        market   = snapshot.market(5)
+        self.writer.record_depth(5, _DEPTH, 101.0)
+        reader.refresh()
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(snapshot.market_ids(), [5])
+        self.assertEqual([order[:2] for order in market.buy_orders], [(0.001, 2.0)])
+        reader.close()
+
+    def test_range_with_timestamps_out_of_order(self):
+        for timestamp in (100.0, 200.0, 50.0, 150.0):
+            self.writer.record_depth(5, _DEPTH, timestamp)
+        reader = SnapshotReader(self.path)
+        self.assertEqual([s.timestamp for s in reader.snapshots(100.0, 160.0)], [100.0, 150.0])
+        self.assertEqual([s.timestamp for s in reader.snapshots(end = 100.0)], [100.0, 50.0])
+        reader.close()
+
+    def test_range_with_increasing_timestamps(self):
+        for timestamp in (100.0, 150.0, 200.0):
+            self.writer.record_depth(5, _DEPTH, timestamp)
+        reader = SnapshotReader(self.path)
+        self.assertEqual([s.timestamp for s in reader.snapshots(120.0)], [150.0, 200.0])
+        reader.close()
+
+    def test_fixed_point_market_data_replays_exactly(self):
+        self.writer.record_market_data({'A/BTC':_market_data('A/BTC', parse)}, 100.0)
+        reader   = SnapshotReader(self.path)
+        snapshot = next(reader.snapshots())
+        market   = snapshot.market(3)
+        self.assertTrue(snapshot.fixed_point)
+        self.assertEqual(snapshot.scale, SCALE)
+        self.assertEqual(market.volume, parse('123456789.12345678'))
+        self.assertEqual(market.last_trade_price, 41230)
+        self.assertEqual(market.recent_trades, [(7, 41230, parse('12.5'), 515375)])
+        self.assertEqual(market.buy_orders, [(41100, SCALE*2, 82200)])
+        self.assertEqual(market.sell_orders, [(41300, SCALE, 41300)])
+        reader.close()
+
+    def test_float_market_data_is_not_scaled(self):
+        self.writer.record_market_data({'A/BTC':_market_data('A/BTC')}, 100.0)
+        reader   = SnapshotReader(self.path)
+        snapshot = next(reader.snapshots())
+        self.assertFalse(snapshot.fixed_point)
+        self.assertEqual(snapshot.scale, 1)
+        self.assertEqual(snapshot.market(3).last_trade_price, 0.0004123)
+        self.assertEqual(snapshot.market(3).buy_orders, [(0.000411, 2.0, 0.000822)])
+        reader.close()
+
+    def test_mixed_market_data_is_rejected(self):
+        self.assertRaises(ValueError, self.writer.record_market_data, [('A/BTC', _market_data('A/BTC')), ('B/BTC', _market_data('B/BTC', parse))])
+
+    def test_long_labels_are_kept_whole(self):
+        label = u'QUITELONGCOIN/\u0411TC'
+        self.writer.record_market_data({label:_market_data(label)}, 100.0)
+        reader = SnapshotReader(self.path)
+        self.assertEqual(next(reader.snapshots()).market(3).label, label)
+        reader.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os, sys, unittest
+from StringIO import StringIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.streaming import iter_items
+
+# The recent trades of market 4 are not valid JSON, so decoding them would raise
+_BODY = ('{"success":1,"return":{"markets":{'
+         '"A/BTC":{"marketid":"3","label":"A/BTC","recenttrades":[{"id":"1","price":"0.1"}]},'
+         '"B/BTC":{"marketid":"4","label":"B/BTC","recenttrades":[{"id":tru, "note":"}"}]},'
+         '"C/BTC":{"label":"C/BTC","marketid":"5","recenttrades":[]}}}}')
+
+class IterItemsTest(unittest.TestCase):
+
+    def items(self, **kwargs):
+        envelope = dict()
+        items    = list(iter_items(StringIO(_BODY), ('return', 'markets'), envelope, chunk_size = 7, **kwargs))
+        self.assertEqual(envelope, {'success':1})
+        return items
+
+    def test_where_skips_rejected_members_without_decoding_them(self):
+        items = self.items(where = ('marketid', lambda market: int(market) in (3, 5)))
+        self.assertEqual([key for key, _ in items], ['A/BTC', 'C/BTC'])
+        self.assertEqual(items[0][1]['recenttrades'], [{'id':'1', 'price':'0.1'}])
+        self.assertEqual(items[1][1], {'label':'C/BTC', 'marketid':'5', 'recenttrades':[]})
+
+    def test_every_where_condition_must_accept(self):
+        items = self.items(where = [('label', lambda label: label != 'B/BTC'), ('marketid', lambda market: market != '5')])
+        self.assertEqual([key for key, _ in items], ['A/BTC'])
+
+    def test_keys_skip_members_without_decoding_them(self):
+        self.assertEqual([key for key, _ in self.items(keys = set(['C/BTC']))], ['C/BTC'])
+
+    def test_rejected_member_is_decoded_without_where(self):
+        self.assertRaises(ValueError, self.items)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os, sys, socket, threading, time, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from cryptsy.standin import StandInServer
+from cryptsy.transport import ConnectionPool
+
+def _info(params):
+    return {'success':1, 'return':{}}
+
+class _OneShotServer(object):
+    '''Answers a single keep-alive request on each connection, then closes it without saying so'''
+
+    def __init__(self):
+        self.requests = 0
+        self.sock     = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.url      = 'http://127.0.0.1:%d/api' % self.sock.getsockname()[1]
+        self.thread   = threading.Thread(target = self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            data = ''
+            while '\r\n\r\n' not in data:
+                data += conn.recv(4096)
+            head, body = data.split('\r\n\r\n', 1)
+            length = int([line.split(':')[1] for line in head.split('\r\n') if line.lower().startswith('content-length')][0])
+            while len(body) < length:
+                body += conn.recv(4096)
+            self.requests += 1
+            conn.sendall('HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok')
+            conn.close()
+
+    def stop(self):
+        self.sock.close()
+
+class ConnectionPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ConnectionPool()
+
+    def tearDown(self):
+        self.pool.close()
+
+    def test_dropped_idle_connection_is_retried(self):
+        server = _OneShotServer()
+        try:
+            self.assertEqual(self.pool.request(server.url, 'a=1'), 'ok')
+            time.sleep(0.05)
+            self.assertEqual(self.pool.request(server.url, 'a=2'), 'ok')
+            self.assertEqual(server.requests, 2)
+        finally:
+            server.stop()
+
+    def test_timeout_on_reused_connection_is_not_resent(self):
+        server = StandInServer(handlers = {'getinfo':_info})
+        server.start()
+        try:
+            url = 'http://%s:%d/api.php' % server.address
+            self.pool.request(url, 'method=getinfo')
+            server.latency = 0.3
+            self.assertRaises(socket.timeout, self.pool.request, url, 'method=getinfo', timeout = 0.1)
+            time.sleep(0.5)
+            self.assertEqual(server.requests, 2)
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()